@@ -0,0 +1,222 @@
+"""
+BULK TOPICS
+===========
+Parse a CSV or one-topic-per-line list, package finished results as a zip,
+and optionally route a large list through the Message Batches API (about
+half the token cost, results within hours instead of seconds).
+"""
+
+import csv
+import io
+import re
+import sys
+import threading
+import time
+import zipfile
+from datetime import datetime
+
+from generation import _check_complete, single_request
+from jobs import DONE, FAILED, FINISHED, QUEUED, REFUND_ATTEMPTS, REFUND_RETRY_SECONDS
+
+MAX_BULK_TOPICS = 100
+MIN_TOPIC_CHARS = 5
+RESULT_ATTEMPTS = 5   # tries at reading a finished batch's results before failing its jobs
+
+
+def parse_topics(text: str, max_topics: int = MAX_BULK_TOPICS) -> list:
+    """Topics from CSV (a 'topic' column, else the first column) or plain lines.
+
+    Text is only read as CSV when it has a 'topic' header, or when every line
+    has the same number (above one) of columns; otherwise each line is a
+    topic, commas and all. Blank lines, too-short entries and repeats are
+    dropped; order is kept.
+    """
+    text = (text or '').strip()
+    if not text:
+        return []
+
+    lines = text.splitlines()
+    rows = None
+    if ',' in lines[0] or '\t' in lines[0]:
+        try:
+            dialect = csv.Sniffer().sniff(lines[0], delimiters=',\t;')
+            rows = [row for row in csv.reader(lines, dialect) if any(cell.strip() for cell in row)]
+        except csv.Error:
+            rows = None
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        widths = {len(row) for row in rows}
+        if 'topic' not in header and not (len(widths) == 1 and widths.pop() > 1):
+            rows = None
+
+    if rows:
+        header = [cell.strip().lower() for cell in rows[0]]
+        column = header.index('topic') if 'topic' in header else 0
+        if 'topic' in header:
+            rows = rows[1:]
+        candidates = [row[column] if column < len(row) else '' for row in rows]
+    else:
+        candidates = lines
+
+    topics = []
+    seen = set()
+    for candidate in candidates:
+        # Accept list markers people paste from notes: "1. ", "- ", "• "
+        topic = re.sub(r'^\s*(?:\d+[.)]|[-•*])\s+', '', candidate).strip()
+        if len(topic) < MIN_TOPIC_CHARS or topic.lower() in seen:
+            continue
+        seen.add(topic.lower())
+        topics.append(topic)
+    return topics[:max_topics]
+
+
+def _slug(topic: str, length: int = 48) -> str:
+    slug = re.sub(r'[^a-z0-9]+', '-', topic.lower()).strip('-')
+    return slug[:length].rstrip('-') or 'topic'
+
+
+def build_results_zip(jobs: list) -> bytes:
+    """Zip of one .txt per finished topic plus an index.csv of every topic."""
+    buffer = io.BytesIO()
+    index = io.StringIO()
+    writer = csv.writer(index)
+    writer.writerow(['#', 'topic', 'status', 'file'])
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for n, job in enumerate(jobs, start=1):
+            filename = ''
+            if job['status'] == DONE and job.get('result'):
+                filename = f"{n:03d}_{_slug(job['topic'])}.txt"
+                archive.writestr(filename, job['result'])
+            writer.writerow([n, job['topic'], job['status'], filename])
+        archive.writestr('index.csv', index.getvalue())
+    return buffer.getvalue()
+
+
+def results_zip_name() -> str:
+    return f"upsc_questions_bulk_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip"
+
+
+class MessageBatchRunner:
+    """Submits bulk topics as one Message Batches API batch and polls it.
+
+    Each topic is still a job row (with provider_batch_id set), so the page
+    shows progress the same way. A result is charged when it arrives with
+    the same job-keyed reserve(job) / refund(job) as JobRunner, which take
+    or return the credit together with the job's charged flag, so a job is
+    charged at most once. It is only delivered (DONE) once charged;
+    otherwise the job fails, and a reservation that may have landed is
+    refunded.
+    """
+
+    def __init__(self, client, store, reserve, refund, on_result=None, poll_seconds: float = 60):
+        self.client = client
+        self.store = store
+        self.reserve = reserve
+        self.refund = refund
+        self.on_result = on_result
+        self.poll_seconds = poll_seconds
+
+    def submit(self, email: str, topics: list, group_id: str) -> list:
+        jobs = [self.store.create(email, topic, group_id=group_id) for topic in topics]
+        try:
+            batch = self.client.messages.batches.create(requests=[
+                {'custom_id': job['id'], 'params': single_request(job['topic'])}
+                for job in jobs
+            ])
+        except Exception as e:
+            for job in jobs:
+                self.store.update(job['id'], status=FAILED, error=str(e))
+            raise
+        for job in jobs:
+            self.store.update(job['id'], provider_batch_id=batch.id)
+        self._start_poller(batch.id)
+        return [job['id'] for job in jobs]
+
+    def resume_pending(self) -> int:
+        """Restart pollers for batches a previous server process left running."""
+        batch_ids = {job['provider_batch_id'] for job in self.store.pending(max_age_minutes=48 * 60)
+                     if job.get('provider_batch_id') and job['status'] == QUEUED}
+        for batch_id in batch_ids:
+            self._start_poller(batch_id)
+        return len(batch_ids)
+
+    def _start_poller(self, batch_id: str):
+        threading.Thread(target=self._poll, args=(batch_id,), name=f"upsc-batch-{batch_id}", daemon=True).start()
+
+    def _poll(self, batch_id: str):
+        while True:
+            try:
+                batch = self.client.messages.batches.retrieve(batch_id)
+                if batch.processing_status == 'ended':
+                    break
+            except Exception:
+                pass
+            time.sleep(self.poll_seconds)
+
+        problem = None
+        for _ in range(RESULT_ATTEMPTS):
+            try:
+                # Jobs settled by an earlier attempt are skipped
+                for entry in self.client.messages.batches.results(batch_id):
+                    self._settle(entry)
+                return
+            except Exception as e:
+                problem = e
+                time.sleep(self.poll_seconds)
+        print(f"batch {batch_id}: could not read results: {problem}", file=sys.stderr, flush=True)
+        for job in self.store.by_provider_batch(batch_id):
+            if job['status'] not in FINISHED:
+                self.store.update(job['id'], status=FAILED, error="Could not fetch batch results.")
+
+    def _settle(self, entry):
+        """Charge and deliver one batch result, or fail its job."""
+        job = self.store.get(entry.custom_id)
+        if job is None or job['status'] in FINISHED:
+            return
+        reserved = False
+        try:
+            result = entry.result
+            if result.type != 'succeeded':
+                self.store.update(job['id'], status=FAILED, error=f"Batch request {result.type}.")
+                return
+            try:
+                # Cut off at max_tokens: never charged or delivered, as in the other modes
+                _check_complete(result.message)
+            except RuntimeError as e:
+                self.store.update(job['id'], status=FAILED, error=str(e))
+                return
+            output = result.message.content[0].text
+            # Already charged: an earlier poller reserved it, then stopped before DONE
+            if not job.get('charged'):
+                reserved = True  # a reservation that raised may still have landed
+                credit = self.reserve(job)
+                if credit is None:
+                    reserved = False
+                    self.store.update(job['id'], status=FAILED, error="No credits left.")
+                    return
+                self.store.mirror(job['id'], charged=True, credit=credit)
+            self.store.update(job['id'], status=DONE, result=output)
+        except Exception as e:
+            if reserved:
+                self._refund(job)
+            self.store.update(job['id'], status=FAILED, error=str(e))
+            return
+        if self.on_result is not None:
+            try:
+                self.on_result(job, output)
+            except Exception as e:
+                print(f"job {job['id']}: on_result failed: {e}", file=sys.stderr, flush=True)
+
+    def _refund(self, job: dict):
+        """refund(job), retried as in JobRunner, and logged if it never gets through."""
+        problem = None
+        for attempt in range(REFUND_ATTEMPTS):
+            try:
+                self.refund(job)
+                self.store.mirror(job['id'], charged=False, credit=None)
+                return
+            except Exception as e:
+                problem = e
+            time.sleep(REFUND_RETRY_SECONDS * (attempt + 1))
+        print(f"job {job['id']}: could not refund the credit of {job['email']}: {problem}",
+              file=sys.stderr, flush=True)
@@ -0,0 +1,294 @@
+"""
+APP FLOW BENCHMARK
+==================
+Drives the real streamlit_app.py with Streamlit's AppTest against the local
+fakes in fake_services.py, so no paid API is called, and reports per flow:
+wall time, script (re)runs and outbound calls per service.
+
+FLOWS:
+    otp_signup   New User -> Send OTP -> Verify OTP
+    quick_login  Quick Login for an email with a captured, uncredited payment
+    generate     logged-in user generates questions for a new topic
+    refresh      Refresh Credits after a new payment
+
+USAGE:
+    python benchmarks/bench_flows.py --rounds 5
+    python benchmarks/bench_flows.py --flows generate --ttft 1.5 --chunk-delay 0.05
+    python benchmarks/bench_flows.py --json results.json    # keep for comparison
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_DIR = os.path.dirname(BENCH_DIR)
+APP_PATH = os.path.join(APP_DIR, 'streamlit_app.py')
+sys.path.insert(0, APP_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+import httpx  # noqa: E402
+import requests  # noqa: E402
+from streamlit.runtime.scriptrunner import script_runner  # noqa: E402
+from streamlit.runtime.scriptrunner.script_cache import ScriptCache  # noqa: E402
+from streamlit.testing.v1 import AppTest, local_script_runner  # noqa: E402
+
+from fake_services import FakeServices  # noqa: E402
+
+SERVICES = ('supabase', 'razorpay', 'resend', 'anthropic')
+
+# AppTest compiles the script on every run with a fresh cache; a real server
+# compiles once. Share one cache, which also keeps concurrent sessions from
+# compiling at the same time (not thread-safe in CPython 3.11).
+_SCRIPT_CACHE = ScriptCache()
+local_script_runner.ScriptCache = lambda: _SCRIPT_CACHE
+
+
+# =============================================================================
+# INSTRUMENTATION
+# =============================================================================
+
+class ScriptRunCounter:
+    """Records every script execution (first run plus each st.rerun) per AppTest.
+
+    Wraps ScriptRunner._run_script, which Streamlit calls once per run (nested
+    for st.rerun, so a run's own time excludes the reruns inside it), and the
+    requests/httpx send methods, so outbound calls made while a script runs
+    are charged to that run; calls from worker threads, and async calls on
+    the data layer's I/O loop, count as background.
+    """
+
+    def __init__(self):
+        self.samples = defaultdict(list)   # id(session_state) -> [{'seconds', 'calls'}]
+        self.background_calls = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        original = script_runner.ScriptRunner._run_script
+        counter = self
+
+        def counted(runner, rerun_data):
+            stack = counter._stack()
+            frame = {'calls': 0, 'child_seconds': 0.0}
+            stack.append(frame)
+            started = time.perf_counter()
+            try:
+                return original(runner, rerun_data)
+            finally:
+                elapsed = time.perf_counter() - started
+                stack.pop()
+                if stack:
+                    stack[-1]['child_seconds'] += elapsed
+                sample = {'seconds': elapsed - frame['child_seconds'], 'calls': frame['calls']}
+                with counter._lock:
+                    counter.samples[id(getattr(runner, 'session_state', None))].append(sample)
+
+        script_runner.ScriptRunner._run_script = counted
+        self._wrap_send(requests.Session)
+        self._wrap_send(httpx.Client)
+        self._wrap_async_send(httpx.AsyncClient)
+
+    def _stack(self) -> list:
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _wrap_send(self, cls):
+        original = cls.send
+        counter = self
+
+        def send(client, *args, **kwargs):
+            stack = counter._stack()
+            if stack:
+                stack[-1]['calls'] += 1
+            else:
+                with counter._lock:
+                    counter.background_calls += 1
+            return original(client, *args, **kwargs)
+
+        cls.send = send
+
+    def _wrap_async_send(self, cls):
+        original = cls.send
+        counter = self
+
+        async def send(client, *args, **kwargs):
+            with counter._lock:
+                counter.background_calls += 1
+            return await original(client, *args, **kwargs)
+
+        cls.send = send
+
+    def runs_for(self, at: AppTest) -> list:
+        with self._lock:
+            return list(self.samples[id(at.session_state)])
+
+    def count(self, at: AppTest) -> int:
+        return len(self.runs_for(at))
+
+
+class Probe:
+    """Measures the interesting part of a flow: `with probe:` around it."""
+
+    def __init__(self, services: FakeServices, counter: ScriptRunCounter, at: AppTest):
+        self.services = services
+        self.counter = counter
+        self.at = at
+        self.result = None
+
+    def __enter__(self):
+        self._calls = self.services.snapshot()
+        self._runs = self.counter.count(self.at)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._started
+        calls = self.services.snapshot() - self._calls
+        self.result = {
+            'seconds': elapsed,
+            'runs': self.counter.count(self.at) - self._runs,
+            'calls': {service: calls.get(service, 0) for service in SERVICES},
+        }
+        return False
+
+
+# =============================================================================
+# FLOWS
+# =============================================================================
+
+def new_app(services: FakeServices, secrets: bool = True) -> AppTest:
+    """A fresh session; secrets=False when they are already set globally."""
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    if secrets:
+        for key, value in services.secrets().items():
+            at.secrets[key] = value
+    return at
+
+
+def by_label(elements, label: str):
+    return next(element for element in elements if label in element.label)
+
+
+def log_in(at: AppTest, services: FakeServices, email: str, free_credits: int = 1):
+    """Existing user, already logged in (session state as after OTP login)."""
+    user = services.add_user(email, free_credits=free_credits)
+    at.run()
+    at.session_state.logged_in = True
+    at.session_state.email = email
+    at.session_state.free_credits = user['free_credits']
+    at.session_state.paid_credits = user['paid_credits']
+    at.run()
+
+
+def otp_signup(at, services, email, probe):
+    with probe:
+        at.run()
+        at.button(key="new_user_btn").click().run()
+        by_label(at.text_input, "email").set_value(email)
+        by_label(at.checkbox, "Terms").check()
+        at.button(key="send_otp_btn").click().run()
+        at.text_input(key="otp_input_field").set_value(services.last_otp(email))
+        at.button(key="verify_otp_btn").click().run()
+    assert at.session_state.logged_in, "OTP signup did not log in"
+
+
+def quick_login(at, services, email, probe):
+    services.add_payment(email, amount_paise=2400)
+    with probe:
+        at.run()
+        at.button(key="quick_login_btn").click().run()
+        at.text_input(key="quick_email_input").set_value(email)
+        at.button(key="quick_login_submit").click().run()
+    assert at.session_state.logged_in and at.session_state.paid_credits == 2, "Quick Login did not credit payment"
+
+
+def generate(at, services, email, probe):
+    log_in(at, services, email)
+    # Random words, so neither the exact nor the similar-topic cache can answer
+    words = ' '.join(uuid.uuid4().hex[i:i + 6] for i in range(0, 24, 6))
+    at.text_area(key="query_input").set_value(f"Benchmark topic {words}")
+    with probe:
+        by_label(at.button, "Generate 10 Questions").click().run()
+    assert at.session_state.free_credits == 0, "generation did not use the credit"
+
+
+def refresh(at, services, email, probe):
+    log_in(at, services, email)
+    services.add_payment(email, amount_paise=1200)
+    with probe:
+        at.button(key="refresh_sidebar").click().run()
+    assert at.session_state.paid_credits == 1, "refresh did not credit payment"
+
+
+FLOWS = {
+    'otp_signup': otp_signup,
+    'quick_login': quick_login,
+    'generate': generate,
+    'refresh': refresh,
+}
+
+
+def run_flow(name: str, services: FakeServices, counter: ScriptRunCounter) -> dict:
+    """One fresh session through one flow; returns its Probe result."""
+    at = new_app(services)
+    probe = Probe(services, counter, at)
+    email = f"bench-{name}-{uuid.uuid4().hex[:8]}@gmail.com"
+    FLOWS[name](at, services, email, probe)
+    if at.exception:
+        raise RuntimeError(f"{name}: {at.exception[0].value}")
+    return probe.result
+
+
+def start_services(ttft: float, chunk_delay: float, latency: dict = None) -> FakeServices:
+    services = FakeServices(ttft=ttft, chunk_delay=chunk_delay, latency=latency)
+    # The Anthropic SDK reads its base URL from the environment
+    os.environ.update(services.env())
+    return services
+
+
+def summarize(samples: list) -> dict:
+    seconds = [s['seconds'] for s in samples]
+    return {
+        'n': len(samples),
+        'p50_s': statistics.median(seconds),
+        'max_s': max(seconds),
+        'runs': statistics.mean(s['runs'] for s in samples),
+        'calls': {service: statistics.mean(s['calls'][service] for s in samples) for service in SERVICES},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=3, help='sessions per flow')
+    parser.add_argument('--flows', default=','.join(FLOWS), help='comma-separated flows')
+    parser.add_argument('--ttft', type=float, default=0.5, help='fake Claude time to first token, seconds')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='fake Claude delay per streamed chunk')
+    parser.add_argument('--json', help='also write the summary to this file')
+    args = parser.parse_args()
+
+    services = start_services(args.ttft, args.chunk_delay)
+    counter = ScriptRunCounter()
+    flows = [f.strip() for f in args.flows.split(',') if f.strip()]
+
+    summary = {}
+    for name in flows:
+        samples = [run_flow(name, services, counter) for _ in range(args.rounds)]
+        summary[name] = summarize(samples)
+        s = summary[name]
+        calls = '  '.join(f"{service} {s['calls'][service]:4.1f}" for service in SERVICES)
+        print(f"{name:12} p50 {s['p50_s']:6.2f}s  max {s['max_s']:6.2f}s  runs {s['runs']:4.1f}  {calls}", flush=True)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(summary, f, indent=2)
+    services.close()
+
+
+if __name__ == '__main__':
+    main()
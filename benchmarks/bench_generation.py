@@ -0,0 +1,111 @@
+"""
+GENERATION LATENCY BENCHMARK
+============================
+Compares end-to-end latency of the generation modes. By default it runs
+against the fake Anthropic API from fake_services.py, which is free and
+checks the harness and each mode's overhead; --live uses the real API, and
+every live run costs real tokens.
+
+USAGE:
+    python benchmarks/bench_generation.py --rounds 3 --ttft 0.8
+    ANTHROPIC_API_KEY=sk-ant-... python benchmarks/bench_generation.py --live \
+        --rounds 3 "RBI holds repo rate at 6.5%" "Governor delays NEET bill in Tamil Nadu"
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from generation import GENERATION_MODES, ConnectionStats, PromptCacheStats, build_anthropic_client  # noqa: E402
+
+DEFAULT_TOPICS = [
+    "RBI holds repo rate at 6.5%",
+    "Governor delays NEET bill in Tamil Nadu",
+]
+
+
+def run_once(client, mode: str, topic: str, usage: PromptCacheStats) -> dict:
+    """Generate one topic, timing first progress and completion."""
+    started = time.perf_counter()
+    first = []
+
+    def on_progress(_text):
+        if not first:
+            first.append(time.perf_counter() - started)
+
+    output = GENERATION_MODES[mode](client, topic, on_progress=on_progress, usage_stats=usage)
+    return {
+        'total': time.perf_counter() - started,
+        'first': first[0] if first else None,
+        'chars': len(output),
+    }
+
+
+def summarize(samples: list) -> str:
+    totals = [s['total'] for s in samples]
+    firsts = [s['first'] for s in samples if s['first'] is not None]
+    return (
+        f"n={len(samples)}  total mean {statistics.mean(totals):6.2f}s  "
+        f"p50 {statistics.median(totals):6.2f}s  max {max(totals):6.2f}s  "
+        f"first output p50 {statistics.median(firsts):5.2f}s  "
+        f"chars mean {statistics.mean(s['chars'] for s in samples):7.0f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('topics', nargs='*', default=DEFAULT_TOPICS)
+    parser.add_argument('--rounds', type=int, default=2, help='runs per topic per mode')
+    parser.add_argument('--modes', default=','.join(GENERATION_MODES), help='comma-separated modes')
+    parser.add_argument('--live', action='store_true', help='call the real Anthropic API (costs tokens)')
+    parser.add_argument('--ttft', type=float, default=0.5, help='fake API: seconds to first token')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='fake API: seconds between chunks')
+    args = parser.parse_args()
+
+    services = None
+    if args.live:
+        api_key = os.environ.get('ANTHROPIC_API_KEY')
+        if not api_key:
+            sys.exit('ANTHROPIC_API_KEY is not set')
+    else:
+        from fake_services import FakeServices
+
+        services = FakeServices(ttft=args.ttft, chunk_delay=args.chunk_delay)
+        os.environ.update(services.env())
+        api_key = os.environ['ANTHROPIC_API_KEY']
+        print(f"fake Anthropic API at {services.url} (pass --live for the real one)", flush=True)
+
+    conn_stats = ConnectionStats()
+    client = build_anthropic_client(api_key, conn_stats)
+    modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+
+    results = {mode: [] for mode in modes}
+    for round_no in range(args.rounds):
+        for topic in args.topics:
+            # Alternate mode order so neither always runs on a warm prompt cache
+            order = modes if round_no % 2 == 0 else list(reversed(modes))
+            for mode in order:
+                usage = PromptCacheStats()
+                sample = run_once(client, mode, topic, usage)
+                sample.update(usage.totals())
+                results[mode].append(sample)
+                print(f"[{mode:6}] {sample['total']:6.2f}s  {topic[:50]}", flush=True)
+
+    print()
+    for mode, samples in results.items():
+        cached = sum(s['cache_read_tokens'] for s in samples)
+        print(f"{mode:6}  {summarize(samples)}  cache-read tokens {cached}")
+    if len(modes) == 2 and all(results.values()):
+        a, b = (statistics.median(s['total'] for s in results[m]) for m in modes)
+        print(f"\n{modes[1]} vs {modes[0]}: {a / b:.2f}x faster (p50)")
+    print(f"connections new={conn_stats.new} reused={conn_stats.reused}")
+    if services is not None:
+        services.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+"""
+LOGIN LATENCY BENCHMARK
+=======================
+Times the login steps a student waits on, with the async data layer
+(ASYNC_IO on, independent calls overlap) and without it (one call after
+another), against the local fakes with simulated network round trips:
+
+    return_email   landing back from Razorpay with ?return_email=
+    quick_login    Quick Login submit for an email with a new payment
+    send_otp       Send OTP (store the code + email it)
+    verify_otp     Verify OTP for a returning user
+
+USAGE:
+    python benchmarks/bench_login.py --rounds 5
+    python benchmarks/bench_login.py --supabase-latency 0.08 --razorpay-latency 0.4
+"""
+
+import argparse
+import statistics
+import time
+import uuid
+
+import streamlit as st
+
+from bench_flows import by_label, new_app, start_services
+
+MODES = ('off', 'on')
+
+
+def return_email(at, services, email):
+    services.add_user(email, free_credits=0)
+    services.add_payment(email, amount_paise=1200)
+    at.query_params['return_email'] = email
+    return at.run
+
+
+def quick_login(at, services, email):
+    services.add_payment(email, amount_paise=2400)
+    at.run()
+    at.button(key="quick_login_btn").click().run()
+    at.text_input(key="quick_email_input").set_value(email)
+    return at.button(key="quick_login_submit").click().run
+
+
+def send_otp(at, services, email):
+    at.run()
+    at.button(key="new_user_btn").click().run()
+    by_label(at.text_input, "email").set_value(email)
+    by_label(at.checkbox, "Terms").check()
+    return at.button(key="send_otp_btn").click().run
+
+
+def verify_otp(at, services, email):
+    services.add_user(email)
+    send_otp(at, services, email)()
+    at.text_input(key="otp_input_field").set_value(services.last_otp(email))
+    return at.button(key="verify_otp_btn").click().run
+
+
+STEPS = {
+    'return_email': return_email,
+    'quick_login': quick_login,
+    'send_otp': send_otp,
+    'verify_otp': verify_otp,
+}
+
+
+def time_step(name: str, services, mode: str) -> float:
+    at = new_app(services)
+    at.secrets['ASYNC_IO'] = mode
+    email = f"login-{name}-{uuid.uuid4().hex[:8]}@gmail.com"
+    action = STEPS[name](at, services, email)
+    started = time.perf_counter()
+    action()
+    elapsed = time.perf_counter() - started
+    if at.exception:
+        raise RuntimeError(f"{name} ({mode}): {at.exception[0].value}")
+    if name != 'send_otp' and not at.session_state.logged_in:
+        raise RuntimeError(f"{name} ({mode}): did not log in")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=5, help='sessions per step and mode')
+    parser.add_argument('--steps', default=','.join(STEPS), help='comma-separated steps')
+    parser.add_argument('--supabase-latency', type=float, default=0.05, help='seconds added to each Supabase call')
+    parser.add_argument('--razorpay-latency', type=float, default=0.3, help='seconds added to each Razorpay call')
+    parser.add_argument('--resend-latency', type=float, default=0.2, help='seconds added to each Resend call')
+    args = parser.parse_args()
+
+    services = start_services(0.1, 0.001, latency={
+        'supabase': args.supabase_latency, 'razorpay': args.razorpay_latency, 'resend': args.resend_latency,
+    })
+    steps = [s.strip() for s in args.steps.split(',') if s.strip()]
+    results = {}
+    for mode in MODES:
+        # The data layer is a cached resource: rebuild it for this mode, then warm up
+        st.cache_resource.clear()
+        for name in steps:
+            time_step(name, services, mode)
+            results[name, mode] = [time_step(name, services, mode) for _ in range(args.rounds)]
+
+    print(f"{'step':13} {'blocking p50':>13} {'async p50':>10} {'saved':>8}")
+    for name in steps:
+        blocking = statistics.median(results[name, 'off'])
+        concurrent = statistics.median(results[name, 'on'])
+        print(f"{name:13} {blocking:12.3f}s {concurrent:9.3f}s {blocking - concurrent:7.3f}s")
+    services.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,464 @@
+"""
+LOCAL FAKE SERVICES
+===================
+One in-process HTTP server standing in for every paid service the app
+calls, so flows can be benchmarked offline and for free:
+
+    /v1/messages          Anthropic Messages API (JSON or SSE stream, with
+                          configurable time to first token and chunk delay)
+    /rest/v1/<table>      Supabase PostgREST: select/insert/upsert/update/
+                          delete with eq/neq/gt/gte/lt/lte/in/is filters,
+                          order and limit, on in-memory tables
+    /rest/v1/rpc/<name>   the database functions in migrations/
+    /v1/payments[/<id>]   Razorpay payments list (from/to/count/skip) / fetch
+    /emails               Resend send-email (OTPs are captured for the flow)
+
+Every request is counted per service, which is what the benchmarks report
+as outbound calls, and can be delayed per service to stand in for network
+round trips (latency={'supabase': 0.05, 'razorpay': 0.3}).
+"""
+
+import json
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from migrate import EXPECTED_INDEXES
+
+FAKE_SUPABASE_KEY = "fake.supabase.key"
+
+SAMPLE_OUTPUT = "\n".join(
+    ["━" * 46, "📌 TOPIC ANALYSIS", "━" * 46, "", "**Topic:** Benchmark topic",
+     "**Primary Subject:** GS-III — Economy", ""]
+    + [f"**Q{n}** | Economy | PRIMARY\n\nWhich of the following is correct?\n(a) One\n(b) Two\n(c) Three\n(d) Four\n\n"
+       f"✓ **Answer:** (b)\n⚠️ **Trap:** Option (a) looks right.\n\n-----\n" for n in range(1, 6)]
+    + [f"**M{n}** | GS-III | PRIMARY | 15 marks\n\n\"Discuss the issue.\"\n\n-----\n" for n in range(1, 6)]
+)
+
+SAMPLE_JSON = json.dumps({
+    "analysis": {"topic": "Benchmark topic", "primary_subject": "GS-III — Economy",
+                 "angles": [{"angle": "Federalism", "paper": "GS-II", "connection": "Centre-state"}]},
+    "mcqs": [{"number": n, "subject": "Economy", "cross": n > 3, "stem": "Which is correct?",
+              "options": ["One", "Two", "Three", "Four"], "answer": "b", "trap": "Looks right.",
+              "key_point": "Key."} for n in range(1, 6)],
+    "mains": [{"number": n, "paper": "GS-III", "cross": n > 2, "marks": 15, "question": "Discuss.",
+               "framework": ["Intro", "Body", "Conclusion"], "must_include": "Cases.", "avoid": "Bias."}
+              for n in range(1, 6)],
+}, ensure_ascii=False)
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _coerce(arg: str, like):
+    """Turn a PostgREST filter argument into the stored value's type."""
+    arg = arg.strip('"')
+    if isinstance(like, bool):
+        return arg.lower() == 'true'
+    if isinstance(like, (int, float)):
+        try:
+            return float(arg)
+        except ValueError:
+            return arg
+    return arg
+
+
+def _matches(value, op: str, arg: str) -> bool:
+    if op == 'is':
+        return (value is None) if arg == 'null' else value is _coerce(arg, True)
+    if op == 'in':
+        options = [o.strip() for o in re.findall(r'"[^"]*"|[^,()]+', arg)]
+        return any(value == _coerce(o, value) for o in options if value is not None)
+    if value is None:
+        return False
+    target = _coerce(arg, value)
+    if not isinstance(target, type(value)) and not (isinstance(value, (int, float)) and isinstance(target, float)):
+        value = str(value)
+    return {
+        'eq': lambda: value == target, 'neq': lambda: value != target,
+        'gt': lambda: value > target, 'gte': lambda: value >= target,
+        'lt': lambda: value < target, 'lte': lambda: value <= target,
+    }.get(op, lambda: True)()
+
+
+class FakeServices:
+    """Starts the fake server on a free local port; see module docstring."""
+
+    TABLE_DEFAULTS = {
+        'users': {'free_credits': 0, 'paid_credits': 0, 'total_queries': 0, 'email_verified': False},
+        'otp_codes': {'used': False},
+        'payments': {'status': 'success'},
+    }
+    UNIQUE_KEYS = {'users': 'email', 'payments': 'razorpay_payment_id', 'generation_cache': 'topic_key'}
+
+    def __init__(self, ttft: float = 0.5, chunk_delay: float = 0.02, chunks: int = 60, latency: dict = None):
+        self.ttft = ttft
+        self.chunk_delay = chunk_delay
+        self.chunks = chunks
+        self.latency = latency or {}
+        self.tables = {}
+        self.razorpay_payments = []
+        self.emails = []
+        self.calls = Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, name="fake-services", daemon=True).start()
+
+    # ----- configuration for the app -----
+
+    def secrets(self) -> dict:
+        return {
+            'ANTHROPIC_API_KEY': 'sk-ant-fake',
+            'SUPABASE_URL': self.url,
+            'SUPABASE_KEY': FAKE_SUPABASE_KEY,
+            'RESEND_API_KEY': 're_fake',
+            'RESEND_API_URL': self.url,
+            'RAZORPAY_KEY_ID': 'rzp_test_fake',
+            'RAZORPAY_KEY_SECRET': 'fake',
+            'RAZORPAY_API_URL': f"{self.url}/v1",
+            'RAZORPAY_PAYMENT_URL': f"{self.url}/pay",
+        }
+
+    def env(self) -> dict:
+        """Environment the Anthropic SDK reads its base URL from."""
+        return {'ANTHROPIC_BASE_URL': self.url, 'ANTHROPIC_API_KEY': 'sk-ant-fake'}
+
+    # ----- fixtures and inspection -----
+
+    def add_payment(self, email: str, amount_paise: int = 1200, status: str = 'captured', field: str = 'email') -> str:
+        payment_id = f"pay_{uuid.uuid4().hex[:14]}"
+        payment = {'id': payment_id, 'amount': amount_paise, 'status': status, 'created_at': int(time.time()),
+                   'email': '', 'contact': '+919999999999', 'notes': {}}
+        if field == 'notes':
+            payment['notes'] = {'email': email}
+        elif field == 'contact':
+            payment['contact'] = email
+        else:
+            payment['email'] = email
+        with self._lock:
+            self.razorpay_payments.insert(0, payment)
+        return payment_id
+
+    def add_user(self, email: str, free_credits: int = 1, paid_credits: int = 0) -> dict:
+        return self._insert('users', [{'email': email, 'free_credits': free_credits,
+                                       'paid_credits': paid_credits, 'total_queries': 0,
+                                       'email_verified': True}])[0]
+
+    def user(self, email: str):
+        with self._lock:
+            row = next((r for r in self._rows('users') if r.get('email') == email), None)
+            return dict(row) if row else None
+
+    def last_otp(self, email: str):
+        with self._lock:
+            for message in reversed(self.emails):
+                if message.get('to') == email:
+                    found = re.search(r'>(\d{6})<', message.get('html', ''))
+                    return found.group(1) if found else None
+        return None
+
+    def _count(self, service: str):
+        with self._lock:
+            self.calls[service] += 1
+        if self.latency.get(service):
+            time.sleep(self.latency[service])
+
+    def snapshot(self) -> Counter:
+        with self._lock:
+            return Counter(self.calls)
+
+    def close(self):
+        self._server.shutdown()
+
+    # ----- in-memory PostgREST -----
+
+    def _rows(self, table: str) -> list:
+        return self.tables.setdefault(table, [])
+
+    def _insert(self, table: str, records: list, upsert_on: str = None) -> list:
+        out = []
+        with self._lock:
+            rows = self._rows(table)
+            unique = upsert_on or self.UNIQUE_KEYS.get(table)
+            for record in records:
+                existing = next((r for r in rows if unique and r.get(unique) == record.get(unique)), None)
+                if existing is not None:
+                    if not upsert_on:
+                        raise ValueError(f"duplicate key value violates unique constraint on {unique}")
+                    existing.update(record)
+                    out.append(dict(existing))
+                    continue
+                row = {'id': len(rows) + 1, 'created_at': _now()}
+                row.update(self.TABLE_DEFAULTS.get(table, {}))
+                row.update(record)
+                rows.append(row)
+                out.append(dict(row))
+        return out
+
+    def _select(self, table: str, params: list) -> list:
+        filters = [(k, v) for k, v in params if k not in ('select', 'order', 'limit', 'offset', 'on_conflict', 'columns')]
+        options = dict(params)
+        with self._lock:
+            rows = [r for r in self._rows(table)
+                    if all(_matches(r.get(k), *v.split('.', 1)) for k, v in filters)]
+        if 'order' in options:
+            column, _, direction = options['order'].partition('.')
+            rows.sort(key=lambda r: (r.get(column) is None, r.get(column)), reverse=direction.startswith('desc'))
+        offset = int(options.get('offset', 0))
+        rows = rows[offset:]
+        if 'limit' in options:
+            rows = rows[:int(options['limit'])]
+        select = options.get('select', '*')
+        if select != '*':
+            columns = [c.strip() for c in select.split(',')]
+            rows = [{c: r.get(c) for c in columns} for r in rows]
+        return [dict(r) for r in rows]
+
+    # ----- database functions (migrations/*.sql) -----
+
+    def _rpc(self, name: str, args: dict) -> list:
+        if name == 'schema_index_names':
+            return list(EXPECTED_INDEXES)
+        email = (args.get('p_email') or '').lower().strip()
+        if name == 'credit_payments':
+            return self._credit_payments(email, args.get('p_payments') or [])
+        if name == 'sync_razorpay_payments':
+            return self._sync_razorpay_payments(args)
+        if name == 'pending_razorpay_payments':
+            with self._lock:
+                credited = {r['razorpay_payment_id'] for r in self._rows('payments')}
+                rows = [dict(r) for r in self._rows('razorpay_payments')
+                        if r['email'] == email and r['created_at'] >= args['p_since'] and r['id'] not in credited]
+            return sorted(rows, key=lambda r: r['created_at'], reverse=True)
+        if name in ('reserve_query_credit', 'refund_query_credit'):
+            return self._job_credit(name, args['p_job_id'])
+        with self._lock:
+            user = next((r for r in self._rows('users') if r.get('email') == email), None)
+            if name == 'consume_query_credit':
+                if user is None or user['free_credits'] + user['paid_credits'] <= 0:
+                    return []
+                credit = 'free' if user['free_credits'] > 0 else 'paid'
+                user[f'{credit}_credits'] -= 1
+                user['total_queries'] = (user.get('total_queries') or 0) + 1
+                user['last_query_at'] = _now()
+                return [{'free_credits': user['free_credits'], 'paid_credits': user['paid_credits'],
+                         'total_queries': user['total_queries'], 'credit': credit}]
+        raise KeyError(name)
+
+    def _job_credit(self, name: str, job_id: str) -> list:
+        """reserve_query_credit / refund_query_credit (migrations/011): credit and job flag together."""
+        with self._lock:
+            job = next((r for r in self._rows('generation_jobs') if r.get('id') == job_id), None)
+            user = job and next((r for r in self._rows('users') if r.get('email') == job['email'].lower().strip()), None)
+            if user is None:
+                return []
+            if name == 'reserve_query_credit':
+                if job['charged'] or user['free_credits'] + user['paid_credits'] <= 0:
+                    return []
+                credit = 'free' if user['free_credits'] > 0 else 'paid'
+                user[f'{credit}_credits'] -= 1
+                user['total_queries'] = (user.get('total_queries') or 0) + 1
+                user['last_query_at'] = _now()
+                job.update(charged=True, credit=credit)
+                return [{'free_credits': user['free_credits'], 'paid_credits': user['paid_credits'],
+                         'total_queries': user['total_queries'], 'credit': credit}]
+            if not (job['charged'] and job.get('credit')):
+                return []
+            user[f"{job['credit']}_credits"] += 1
+            user['total_queries'] = max((user.get('total_queries') or 0) - 1, 0)
+            job.update(charged=False, credit=None)
+            return [{'free_credits': user['free_credits'], 'paid_credits': user['paid_credits'],
+                     'total_queries': user['total_queries']}]
+
+    def _credit_payments(self, email: str, payments: list) -> list:
+        with self._lock:
+            recorded = {r['razorpay_payment_id'] for r in self._rows('payments')}
+            new = [p for p in payments if p['id'] not in recorded]
+        self._insert('payments', [{'razorpay_payment_id': p['id'], 'email': email, 'amount': p.get('amount')}
+                                  for p in new])
+        added = sum(p['credits'] for p in new)
+        with self._lock:
+            user = next((r for r in self._rows('users') if r.get('email') == email), None)
+            if user is not None:
+                user['paid_credits'] += added
+        if user is None:
+            if not added:
+                return []
+            user = self.add_user(email, free_credits=0, paid_credits=added)
+        return [{'credits_added': added, 'free_credits': user['free_credits'],
+                 'paid_credits': user['paid_credits'], 'total_queries': user['total_queries']}]
+
+    def _sync_razorpay_payments(self, args: dict) -> int:
+        with self._lock:
+            index = {(r['id'], r['email']): r for r in self._rows('razorpay_payments')}
+            for row in args.get('p_rows') or []:
+                key = (row['id'], row['email'].lower().strip())
+                if key in index:
+                    index[key].update(status=row['status'], amount=row['amount'])
+                else:
+                    index[key] = dict(row, email=key[1])
+                    self._rows('razorpay_payments').append(index[key])
+            if args.get('p_created_at') is not None:
+                mark = (args['p_created_at'], args['p_payment_id'])
+                state = self._rows('razorpay_sync_state')
+                current = next((r for r in state if r['name'] == 'payments'), None)
+                if current is None:
+                    state.append({'name': 'payments', 'last_created_at': mark[0], 'last_payment_id': mark[1]})
+                elif (current['last_created_at'], current['last_payment_id']) < mark:
+                    current.update(last_created_at=mark[0], last_payment_id=mark[1])
+        return len(args.get('p_rows') or [])
+
+    # ----- HTTP -----
+
+    def _handler(self):
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _body(self):
+                return json.loads(self._raw) if self._raw else None
+
+            def _send(self, status: int, payload=None, headers=None):
+                body = b'' if payload is None else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for key, value in (headers or {}).items():
+                    self.send_header(key, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self, method: str):
+                # Always drain the body (postgrest sends one even on GET) to keep the connection usable
+                length = int(self.headers.get('Content-Length') or 0)
+                self._raw = self.rfile.read(length) if length else b''
+                parts = urlsplit(self.path)
+                path, params = parts.path, parse_qsl(parts.query, keep_blank_values=True)
+                if path.startswith('/rest/v1/rpc/') and method == 'POST':
+                    services._count('supabase')
+                    try:
+                        return self._send(200, services._rpc(path[len('/rest/v1/rpc/'):], self._body() or {}))
+                    except KeyError:
+                        return self._send(404, {'code': 'PGRST202', 'message': 'function not found'})
+                if path.startswith('/rest/v1/'):
+                    services._count('supabase')
+                    return self._postgrest(method, path[len('/rest/v1/'):], params)
+                if path == '/v1/messages' and method == 'POST':
+                    services._count('anthropic')
+                    return self._messages(self._body())
+                if path.startswith('/v1/payments') and method == 'GET':
+                    services._count('razorpay')
+                    return self._payments(path, dict(params))
+                if path == '/emails' and method == 'POST':
+                    services._count('resend')
+                    with services._lock:
+                        services.emails.append(self._body())
+                    return self._send(200, {'id': str(uuid.uuid4())})
+                services._count('other')
+                return self._send(404, {'error': 'not found'})
+
+            def do_GET(self):
+                self._route('GET')
+
+            def do_POST(self):
+                self._route('POST')
+
+            def do_PATCH(self):
+                self._route('PATCH')
+
+            def do_DELETE(self):
+                self._route('DELETE')
+
+            def _postgrest(self, method: str, table: str, params: list):
+                try:
+                    if method == 'GET':
+                        return self._send(200, services._select(table, params))
+                    if method == 'POST':
+                        body = self._body()
+                        records = body if isinstance(body, list) else [body]
+                        prefer = self.headers.get('Prefer', '')
+                        upsert_on = None
+                        if 'merge-duplicates' in prefer:
+                            upsert_on = dict(params).get('on_conflict') or services.UNIQUE_KEYS.get(table, 'id')
+                        if 'ignore-duplicates' in prefer:
+                            unique = dict(params).get('on_conflict') or services.UNIQUE_KEYS.get(table, 'id')
+                            taken = {r.get(unique) for r in services._select(table, [])}
+                            records = [r for r in records if r.get(unique) not in taken]
+                        return self._send(201, services._insert(table, records, upsert_on))
+                    matched = services._select(table, params)
+                    with services._lock:
+                        rows = services._rows(table)
+                        ids = {r['id'] for r in matched}
+                        if method == 'PATCH':
+                            body = self._body()
+                            for row in rows:
+                                if row['id'] in ids:
+                                    row.update(body)
+                            return self._send(200, [dict(r) for r in rows if r['id'] in ids])
+                        services.tables[table] = [r for r in rows if r['id'] not in ids]
+                        return self._send(200, matched)
+                except ValueError as e:
+                    return self._send(409, {'code': '23505', 'message': str(e)})
+
+            def _payments(self, path: str, params: dict):
+                with services._lock:
+                    payments = list(services.razorpay_payments)
+                payment_id = path[len('/v1/payments'):].strip('/')
+                if payment_id:
+                    match = next((p for p in payments if p['id'] == payment_id), None)
+                    return self._send(200 if match else 404, match or {'error': {'code': 'BAD_REQUEST_ERROR'}})
+                since = int(params.get('from', 0))
+                until = int(params.get('to', 2 ** 62))
+                skip = int(params.get('skip', 0))
+                count = int(params.get('count', 10))
+                items = [p for p in payments if since <= p['created_at'] <= until][skip:skip + count]
+                return self._send(200, {'entity': 'collection', 'count': len(items), 'items': items})
+
+            def _messages(self, request: dict):
+                system = json.dumps(request.get('system', ''))
+                text = SAMPLE_JSON if '\\"mcqs\\"' in system else SAMPLE_OUTPUT
+                usage = {'input_tokens': 900, 'output_tokens': len(text) // 4,
+                         'cache_read_input_tokens': 1500, 'cache_creation_input_tokens': 0}
+                message = {'id': f"msg_{uuid.uuid4().hex[:12]}", 'type': 'message', 'role': 'assistant',
+                           'model': request.get('model'), 'stop_sequence': None}
+                if not request.get('stream'):
+                    time.sleep(services.ttft + services.chunk_delay * services.chunks)
+                    return self._send(200, dict(message, content=[{'type': 'text', 'text': text}],
+                                                stop_reason='end_turn', usage=usage))
+
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+
+                def event(kind, data):
+                    self.wfile.write(f"event: {kind}\ndata: {json.dumps(dict(data, type=kind))}\n\n".encode())
+                    self.wfile.flush()
+
+                time.sleep(services.ttft)
+                event('message_start', {'message': dict(message, content=[], stop_reason=None,
+                                                        usage=dict(usage, output_tokens=1))})
+                event('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+                size = max(1, len(text) // services.chunks + 1)
+                for start in range(0, len(text), size):
+                    event('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': text[start:start + size]}})
+                    time.sleep(services.chunk_delay)
+                event('content_block_stop', {'index': 0})
+                event('message_delta', {'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                                        'usage': {'output_tokens': usage['output_tokens']}})
+                event('message_stop', {})
+                self.close_connection = True
+
+        return Handler
@@ -0,0 +1,226 @@
+"""
+CONCURRENT SESSION LOAD TEST
+============================
+Simulates N students using the app at once: each is its own AppTest session
+(real streamlit_app.py, local fakes from fake_services.py) clicking through
+
+    quick_login  Quick Login with a fresh payment
+    refresh      Refresh Credits after another payment
+    generate     generate questions for a new topic
+
+It records every script run's own wall time and the outbound calls made
+while it ran, per-step latency, and the process's peak RSS, then checks them
+against budgets and exits 1 if any is exceeded, so it can gate a deploy.
+
+USAGE:
+    python benchmarks/load_sessions.py --users 20
+    python benchmarks/load_sessions.py --users 50 --iterations 2 --budgets budgets.json
+
+BUDGETS (JSON; any key overrides the defaults below):
+    {"rerun_p95_s": 1.5, "peak_rss_mb": 1024,
+     "flows": {"generate": {"p95_s": 10, "runs": 3, "calls_per_run": 15}}}
+"""
+
+import argparse
+import json
+import math
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.secrets import Secrets
+from streamlit.testing.v1 import app_test
+
+from bench_flows import ScriptRunCounter, new_app, start_services
+
+DEFAULT_BUDGETS = {
+    'rerun_p95_s': 6.0,          # one script run's own time, any flow (generate streams in its run)
+    'peak_rss_mb': 1536,
+    'flows': {
+        #               p95 latency       script runs      calls in one run
+        'quick_login': {'p95_s': 4.0,    'runs': 4,       'calls_per_run': 10},
+        'refresh':     {'p95_s': 2.0,    'runs': 3,       'calls_per_run': 10},
+        'generate':    {'p95_s': 15.0,   'runs': 2,       'calls_per_run': 12},
+    },
+}
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+class _KeepRuntime(type):
+    """Metaclass that lets the first mock runtime stick (see share_runtime)."""
+
+    def __setattr__(cls, name, value):
+        if name != '_instance':
+            return super().__setattr__(name, value)
+        if value is not None and Runtime._instance is None:
+            Runtime._instance = value
+
+
+class _SharedRuntime(Runtime, metaclass=_KeepRuntime):
+    pass
+
+
+def share_runtime(secrets: dict):
+    """Make AppTest safe to run from many threads at once.
+
+    AppTest installs a mock runtime and swaps st.secrets around every run,
+    then clears them; with concurrent sessions one session's teardown pulls
+    them out from under another's script. Here the first mock runtime stays
+    installed and the secrets are set once, globally, for every session.
+    """
+    app_test.Runtime = _SharedRuntime
+    shared = Secrets([])
+    shared._secrets = dict(secrets)
+    st.secrets = shared
+
+
+class LoadTest:
+    """Runs the simulated users and collects per-step samples."""
+
+    def __init__(self, services, counter: ScriptRunCounter):
+        self.services = services
+        self.counter = counter
+        self.steps = []       # {'flow', 'seconds', 'runs': [script run samples]}
+        self.errors = []
+        self._lock = threading.Lock()
+
+    def step(self, at, flow: str, action):
+        before = self.counter.count(at)
+        started = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - started
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        with self._lock:
+            self.steps.append({'flow': flow, 'seconds': elapsed, 'runs': self.counter.runs_for(at)[before:]})
+
+    def user(self, iterations: int, stagger: float):
+        time.sleep(random.uniform(0, stagger))
+        for _ in range(iterations):
+            email = f"load-{uuid.uuid4().hex[:10]}@gmail.com"
+            at = new_app(self.services, secrets=False)
+            try:
+                at.run()
+                self.services.add_payment(email, amount_paise=1200)
+                at.button(key="quick_login_btn").click().run()
+                at.text_input(key="quick_email_input").set_value(email)
+                self.step(at, 'quick_login', lambda: at.button(key="quick_login_submit").click().run())
+                if not at.session_state.logged_in:
+                    raise RuntimeError("Quick Login did not log in")
+
+                self.services.add_payment(email, amount_paise=1200)
+                self.step(at, 'refresh', lambda: at.button(key="refresh_sidebar").click().run())
+
+                words = ' '.join(uuid.uuid4().hex[i:i + 6] for i in range(0, 24, 6))
+                at.text_area(key="query_input").set_value(f"Load test topic {words}")
+                generate = next(b for b in at.button if "Generate 10 Questions" in b.label)
+                self.step(at, 'generate', lambda: generate.click().run())
+            except Exception as e:
+                with self._lock:
+                    self.errors.append(f"{email}: {e}")
+
+    def run(self, users: int, iterations: int, stagger: float) -> float:
+        threads = [threading.Thread(target=self.user, args=(iterations, stagger), name=f"load-user-{n}")
+                   for n in range(users)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+
+def check(load: LoadTest, budgets: dict) -> list:
+    """Print the report; return budget violations."""
+    violations = []
+    all_runs = [run for step in load.steps for run in step['runs']]
+    if all_runs:
+        rerun_p95 = percentile([run['seconds'] for run in all_runs], 95)
+        print(f"script runs: {len(all_runs)}  own time p50 {statistics.median(r['seconds'] for r in all_runs):.3f}s  "
+              f"p95 {rerun_p95:.3f}s  max {max(r['seconds'] for r in all_runs):.3f}s")
+        if rerun_p95 > budgets['rerun_p95_s']:
+            violations.append(f"script run p95 {rerun_p95:.2f}s > {budgets['rerun_p95_s']}s")
+
+    print(f"\n{'flow':12} {'n':>4} {'p50 s':>7} {'p95 s':>7} {'runs':>5} {'calls/run max':>14} {'calls/run mean':>15}")
+    for flow, budget in budgets['flows'].items():
+        steps = [step for step in load.steps if step['flow'] == flow]
+        if not steps:
+            continue
+        seconds = [step['seconds'] for step in steps]
+        runs = max(len(step['runs']) for step in steps)
+        calls = [run['calls'] for step in steps for run in step['runs']] or [0]
+        p95 = percentile(seconds, 95)
+        print(f"{flow:12} {len(steps):4d} {statistics.median(seconds):7.2f} {p95:7.2f} {runs:5d} "
+              f"{max(calls):14d} {statistics.mean(calls):15.1f}")
+        if p95 > budget['p95_s']:
+            violations.append(f"{flow}: p95 {p95:.2f}s > {budget['p95_s']}s")
+        if runs > budget['runs']:
+            violations.append(f"{flow}: {runs} script runs > {budget['runs']}")
+        if max(calls) > budget['calls_per_run']:
+            violations.append(f"{flow}: {max(calls)} outbound calls in one run > {budget['calls_per_run']}")
+
+    rss = peak_rss_mb()
+    print(f"\npeak RSS {rss:.0f} MB  background calls {load.counter.background_calls}  errors {len(load.errors)}")
+    if rss > budgets['peak_rss_mb']:
+        violations.append(f"peak RSS {rss:.0f} MB > {budgets['peak_rss_mb']} MB")
+    violations += [f"error: {error}" for error in load.errors[:10]]
+    return violations
+
+
+def load_budgets(path: str) -> dict:
+    budgets = json.loads(json.dumps(DEFAULT_BUDGETS))
+    if path:
+        with open(path) as f:
+            overrides = json.load(f)
+        for flow, values in overrides.pop('flows', {}).items():
+            budgets['flows'].setdefault(flow, {}).update(values)
+        budgets.update(overrides)
+    return budgets
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10, help='concurrent sessions')
+    parser.add_argument('--iterations', type=int, default=1, help='journeys per user')
+    parser.add_argument('--stagger', type=float, default=2.0, help='spread user start over this many seconds')
+    parser.add_argument('--ttft', type=float, default=0.5, help='fake Claude time to first token, seconds')
+    parser.add_argument('--chunk-delay', type=float, default=0.02, help='fake Claude delay per streamed chunk')
+    parser.add_argument('--budgets', help='JSON file overriding the default budgets')
+    args = parser.parse_args()
+
+    budgets = load_budgets(args.budgets)
+    services = start_services(args.ttft, args.chunk_delay)
+    share_runtime(services.secrets())
+    load = LoadTest(services, ScriptRunCounter())
+    elapsed = load.run(args.users, args.iterations, args.stagger)
+    print(f"{args.users} users x {args.iterations} journeys in {elapsed:.1f}s\n")
+
+    violations = check(load, budgets)
+    services.close()
+    if violations:
+        print("\nBUDGET EXCEEDED:")
+        for violation in violations:
+            print(f"  - {violation}")
+        sys.exit(1)
+    print("\nall budgets met")
+
+
+if __name__ == '__main__':
+    main()
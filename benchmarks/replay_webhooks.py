@@ -0,0 +1,151 @@
+"""
+WEBHOOK REPLAYER
+================
+Sends signed Razorpay webhook events to the receiver in webhooks.py, the way
+Razorpay would: synthetic payment.captured events, or events saved from the
+Razorpay Dashboard (one JSON event per line in --file).
+
+With no --url it runs everything locally: the receiver in-process against
+the fake Supabase from fake_services.py. It replays each event twice (as
+Razorpay does on a retry) and sends one forged event. Then it checks the
+balance: every payment credited exactly once, the forged event rejected.
+
+USAGE:
+    python benchmarks/replay_webhooks.py --events 20
+    python benchmarks/replay_webhooks.py --url http://localhost:8502/razorpay/webhook \\
+        --secret whsec_test --email student@gmail.com --amount 2400
+    python benchmarks/replay_webhooks.py --url ... --secret ... --file events.jsonl
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+import uuid
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import requests  # noqa: E402
+
+from payments import calculate_credits_from_amount  # noqa: E402
+from webhooks import SIGNATURE_HEADER, WEBHOOK_PATH, make_server, sign  # noqa: E402
+
+LOCAL_SECRET = 'whsec_local_replay'
+
+
+def captured_event(email: str, amount_paise: int, field: str = 'email') -> dict:
+    """A payment.captured event as Razorpay sends it; field is where the email sits."""
+    payment = {'id': f"pay_{uuid.uuid4().hex[:14]}", 'entity': 'payment', 'amount': amount_paise,
+               'currency': 'INR', 'status': 'captured', 'email': '', 'contact': '+919999999999',
+               'notes': {}, 'created_at': int(time.time())}
+    if field == 'notes':
+        payment['notes'] = {'email': email}
+    elif field == 'contact':
+        payment['contact'] = email
+    else:
+        payment['email'] = email
+    return {'entity': 'event', 'event': 'payment.captured', 'contains': ['payment'],
+            'payload': {'payment': {'entity': payment}}, 'created_at': int(time.time())}
+
+
+def send(url: str, secret: str, event: dict, forge: bool = False):
+    """POST one event signed with secret (or a wrong one). Returns (status, seconds)."""
+    body = json.dumps(event).encode()
+    signature = sign(body, secret + 'x' if forge else secret)
+    started = time.perf_counter()
+    response = requests.post(url, data=body, timeout=30,
+                             headers={'Content-Type': 'application/json', SIGNATURE_HEADER: signature})
+    return response.status_code, time.perf_counter() - started
+
+
+def load_events(path: str) -> list:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay(url: str, secret: str, events: list, repeat: int = 1) -> list:
+    """Send every event repeat times, in order. Returns the (status, seconds) of each send."""
+    results = []
+    for event in events:
+        for _ in range(repeat):
+            results.append(send(url, secret, event))
+    return results
+
+
+def report(results: list):
+    seconds = [s for _, s in results]
+    statuses = {}
+    for status, _ in results:
+        statuses[status] = statuses.get(status, 0) + 1
+    print(f"sent {len(results)}  statuses {statuses}  "
+          f"p50 {statistics.median(seconds) * 1000:.1f}ms  max {max(seconds) * 1000:.1f}ms")
+
+
+def run_local(args) -> int:
+    """Receiver + fake Supabase in this process; returns the number of failed checks."""
+    from supabase import create_client
+    from fake_services import FAKE_SUPABASE_KEY, FakeServices
+
+    services = FakeServices()
+    server = make_server(create_client(services.url, FAKE_SUPABASE_KEY), LOCAL_SECRET, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}{WEBHOOK_PATH}"
+
+    email = args.email or f"replay-{uuid.uuid4().hex[:8]}@gmail.com"
+    fields = ('email', 'notes', 'contact')
+    events = load_events(args.file) if args.file else [
+        captured_event(email, args.amount, fields[n % len(fields)]) for n in range(args.events)
+    ]
+    results = replay(url, LOCAL_SECRET, events, repeat=2)
+    report(results)
+
+    failures = 0
+    forged_status, _ = send(url, LOCAL_SECRET, captured_event(email, args.amount), forge=True)
+    if forged_status != 400:
+        print(f"FAIL forged event answered {forged_status}, expected 400")
+        failures += 1
+    if any(status != 200 for status, _ in results):
+        print("FAIL some events were not accepted")
+        failures += 1
+    if not args.file:
+        expected = calculate_credits_from_amount(args.amount) * args.events
+        user = services.user(email) or {}
+        if user.get('paid_credits') != expected:
+            print(f"FAIL {email} has {user.get('paid_credits')} paid credits, expected {expected}")
+            failures += 1
+        else:
+            print(f"ok: {email} credited {expected} once each, forged event rejected")
+    server.shutdown()
+    services.close()
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='running receiver; omit to run one locally against the fakes')
+    parser.add_argument('--secret', help='webhook secret the receiver was started with')
+    parser.add_argument('--file', help='JSON-lines file of saved Razorpay events to replay')
+    parser.add_argument('--email', help='email for synthetic payments')
+    parser.add_argument('--amount', type=int, default=1200, help='synthetic payment amount, paise')
+    parser.add_argument('--events', type=int, default=10, help='synthetic payments to send')
+    parser.add_argument('--repeat', type=int, default=1, help='times to send each event (--url only)')
+    args = parser.parse_args()
+
+    if not args.url:
+        sys.exit(1 if run_local(args) else 0)
+    if not args.secret:
+        sys.exit('--secret is required with --url')
+    if not (args.file or args.email):
+        sys.exit('--email or --file is required with --url')
+    events = load_events(args.file) if args.file else [
+        captured_event(args.email, args.amount) for _ in range(args.events)
+    ]
+    report(replay(args.url, args.secret, events, repeat=args.repeat))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+ASYNC DATA ACCESS
+=================
+Login paths need several independent network calls, such as the user's row
+and the email's recent Razorpay payments. DataAccess runs them concurrently
+with httpx on one asyncio loop (a daemon thread with pooled connections),
+and gives the Streamlit script blocking wrappers:
+
+    data = DataAccess(SUPABASE_URL, SUPABASE_KEY, recent_payments=window)
+    user, credits_added = data.login(email)     # blocks; the calls inside overlap
+
+It talks to PostgREST and Resend over plain HTTP, against the same tables
+and database functions (migrations/) as the supabase client; Razorpay is
+only read through razorpay_sync (its shared window and synced index).
+"""
+
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from payments import PAYMENT_LOOKBACK_SECONDS, creditable_payments
+
+RESEND_API_URL = 'https://api.resend.com'
+OTP_TTL_MINUTES = 10
+
+
+class DataAccess:
+    """Concurrent Supabase/Resend calls with sync wrappers; see module docstring.
+
+    Each foo_async coroutine has a blocking foo() that runs it on the I/O
+    loop, so it can be called from the script thread or any worker.
+    """
+
+    def __init__(self, supabase_url: str, supabase_key: str, resend_key: str = None,
+                 resend_url: str = RESEND_API_URL, user_fields: tuple = ('email', 'free_credits', 'paid_credits', 'total_queries'),
+                 timeout: float = 15.0, recent_payments=None):
+        self.rest_url = f"{supabase_url.rstrip('/')}/rest/v1"
+        self.supabase_headers = {'apikey': supabase_key, 'Authorization': f'Bearer {supabase_key}'}
+        self.resend_key = resend_key
+        self.resend_url = resend_url.rstrip('/')
+        self.user_columns = ','.join(user_fields)
+        self.timeout = timeout
+        # The app's shared razorpay_sync.RecentPayments window, if any (blocking calls)
+        self.recent_payments = recent_payments
+        self._client = None
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="upsc-async-io", daemon=True).start()
+
+    def run(self, coro):
+        """Block until coro finishes on the I/O loop."""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result(self.timeout * 3)
+
+    def _http(self) -> httpx.AsyncClient:
+        # Only ever called on the loop thread
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+        return self._client
+
+    # ----- single calls -----
+
+    async def fetch_user_async(self, email: str):
+        response = await self._http().get(
+            f"{self.rest_url}/users", headers=self.supabase_headers,
+            params={'select': self.user_columns, 'email': f'eq.{email}'},
+        )
+        response.raise_for_status()
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def pending_payments_async(self, email: str) -> list:
+        """The email's uncredited payments from the synced index, as RazorpaySync.pending_payments."""
+        response = await self._http().post(
+            f"{self.rest_url}/rpc/pending_razorpay_payments", headers=self.supabase_headers,
+            json={'p_email': email, 'p_since': int(time.time()) - PAYMENT_LOOKBACK_SECONDS},
+        )
+        response.raise_for_status()
+        return response.json() or []
+
+    async def recorded_payment_ids_async(self, email: str) -> set:
+        """IDs of payments already credited to email within the lookback window."""
+        since = (datetime.utcnow() - timedelta(seconds=PAYMENT_LOOKBACK_SECONDS + 3600)).isoformat()
+        response = await self._http().get(
+            f"{self.rest_url}/payments", headers=self.supabase_headers,
+            params={'select': 'razorpay_payment_id', 'email': f'eq.{email}', 'created_at': f'gte.{since}'},
+        )
+        response.raise_for_status()
+        return {row['razorpay_payment_id'] for row in response.json()}
+
+    async def credit_payments_async(self, email: str, payments: list):
+        """credit_payments database function: the added credits and new balances, or None."""
+        response = await self._http().post(
+            f"{self.rest_url}/rpc/credit_payments", headers=self.supabase_headers,
+            json={'p_email': email, 'p_payments': payments},
+        )
+        response.raise_for_status()
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def save_otp_async(self, email: str, otp: str):
+        expires_at = (datetime.utcnow() + timedelta(minutes=OTP_TTL_MINUTES)).isoformat()
+        response = await self._http().post(
+            f"{self.rest_url}/otp_codes", headers=dict(self.supabase_headers, Prefer='return=minimal'),
+            json={'email': email, 'otp': otp, 'expires_at': expires_at, 'used': False},
+        )
+        response.raise_for_status()
+
+    async def send_email_async(self, message: dict):
+        if not self.resend_key:
+            raise RuntimeError("RESEND_API_KEY not configured in secrets")
+        response = await self._http().post(
+            f"{self.resend_url}/emails", headers={'Authorization': f'Bearer {self.resend_key}'}, json=message,
+        )
+        if response.status_code != 200:
+            raise RuntimeError(f"Resend error: {response.status_code} - {response.text}")
+
+    # ----- login flows -----
+
+    async def indexed_login_async(self, email: str):
+        """login_async through the shared recent-payments window: the user
+        read, the window lookup (a thread, as it may refresh) and the lookup
+        of credited payments run together. If everything found is credited,
+        the window is refreshed once for this email (rate-limited there).
+        (user, new payments), or None if the window is unavailable.
+        """
+        started = time.monotonic()
+        user, payments, recorded = await asyncio.gather(
+            self.fetch_user_async(email), asyncio.to_thread(self.recent_payments.payments_for, email),
+            self.recorded_payment_ids_async(email), return_exceptions=True,
+        )
+        for result in (user, recorded):
+            if isinstance(result, Exception):
+                raise result
+        if isinstance(payments, Exception):
+            return None
+        candidates = creditable_payments(payments, email)
+        new_payments = [payment for payment_id, payment in candidates.items() if payment_id not in recorded]
+        if not new_payments:
+            payments = await asyncio.to_thread(self.recent_payments.refresh_for, email, started)
+            candidates = creditable_payments(payments or [], email)
+            new_payments = [payment for payment_id, payment in candidates.items() if payment_id not in recorded]
+        return user, new_payments
+
+    async def login_async(self, email: str):
+        """Credit the email's new Razorpay payments and load its user row.
+
+        With the app's shared window, see indexed_login_async. Without it
+        (or if it cannot load), the user read and the synced payment index
+        (every uncredited payment of the lookback window, not one Razorpay
+        page) are read together, as check_and_credit_pending_payments does.
+        Anything credited meanwhile is still skipped by credit_payments.
+        Returns (user or None, credits added).
+        """
+        email = email.lower().strip()
+        indexed = await self.indexed_login_async(email) if self.recent_payments else None
+        if indexed is not None:
+            user, new_payments = indexed
+        else:
+            user, pending = await asyncio.gather(self.fetch_user_async(email), self.pending_payments_async(email))
+            new_payments = list(creditable_payments(pending, email).values())
+        if not new_payments:
+            return user, 0
+        balances = await self.credit_payments_async(email, new_payments)
+        if not balances:
+            return user, 0
+        added = balances.pop('credits_added')
+        return dict(user or {}, email=email, **balances), added
+
+    async def send_otp_async(self, email: str, otp: str, message: dict):
+        """Store the OTP, then email it. Returns an error message, or None.
+
+        The email waits for the insert: a code that was never saved could
+        not be verified.
+        """
+        try:
+            await self.save_otp_async(email.lower().strip(), otp)
+            await self.send_email_async(message)
+        except Exception as e:
+            return str(e)
+        return None
+
+    # ----- blocking wrappers for the Streamlit script -----
+
+    def login(self, email: str):
+        return self.run(self.login_async(email))
+
+    def send_otp(self, email: str, otp: str, message: dict):
+        return self.run(self.send_otp_async(email, otp, message))
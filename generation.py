@@ -0,0 +1,602 @@
+"""
+QUESTION GENERATION
+===================
+Prompt, pooled Claude client and the generation modes, shared by the
+Streamlit app and offline scripts (benchmarks, cache warm-up).
+
+MODES:
+    single  - one completion writes all four sections (streamable)
+    fanout  - topic analysis first, then sections A-D as concurrent calls
+    structured - one streamed JSON completion, parsed question by question
+"""
+
+import heapq
+import itertools
+import math
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime
+
+import anthropic
+import httpx
+
+from structured import STRUCTURED_SYSTEM_PROMPT, StreamingQuestionParser
+
+CLAUDE_MODEL = "claude-sonnet-4-20250514"
+
+
+# =============================================================================
+# ANTHROPIC CLIENT
+# =============================================================================
+
+ANTHROPIC_TIMEOUT = httpx.Timeout(connect=5.0, read=60.0, write=10.0, pool=10.0)
+ANTHROPIC_LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=120.0)
+ANTHROPIC_MAX_RETRIES = 2   # only for calls made outside an LLMLimiter, which does its own retrying
+
+
+class ConnectionStats:
+    """Counts Anthropic requests sent on new vs reused pooled connections."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.new = 0
+        self.reused = 0
+
+    def on_request(self, request):
+        """httpx request hook: notice when httpcore opens a TCP connection."""
+        opened = []
+
+        def trace(event_name, info):
+            if event_name == "connection.connect_tcp.complete":
+                opened.append(True)
+
+        request.extensions["trace"] = trace
+        request.extensions["upsc_opened"] = opened
+
+    def on_response(self, response):
+        """httpx response hook: record whether the request reused a connection."""
+        opened = response.request.extensions.get("upsc_opened")
+        if opened is None:
+            return
+        with self._lock:
+            if opened:
+                self.new += 1
+            else:
+                self.reused += 1
+
+
+def build_anthropic_client(api_key: str, stats: ConnectionStats = None, max_retries: int = ANTHROPIC_MAX_RETRIES):
+    """Anthropic client with a keep-alive pool, explicit timeouts and bounded retries.
+
+    Pass max_retries=0 when calls go through LLMLimiter.call: the SDK's own
+    retries would multiply its attempts and skip its shared back-off pause.
+    """
+    event_hooks = {}
+    if stats is not None:
+        event_hooks = {'request': [stats.on_request], 'response': [stats.on_response]}
+    http_client = httpx.Client(
+        timeout=ANTHROPIC_TIMEOUT,
+        limits=ANTHROPIC_LIMITS,
+        event_hooks=event_hooks,
+    )
+    return anthropic.Anthropic(
+        api_key=api_key,
+        http_client=http_client,
+        timeout=ANTHROPIC_TIMEOUT,
+        max_retries=max_retries,
+    )
+
+
+# =============================================================================
+# PROMPT
+# =============================================================================
+
+SYSTEM_PROMPT = """You are an expert UPSC question setter. Generate 10 practice questions from the given topic.
+
+CRITICAL REQUIREMENT — 5+5 SPLIT:
+• 5 questions from PRIMARY SUBJECT (the obvious angle)
+• 5 questions from CROSS-SUBJECT ANGLES (History, Geography, Economy, Ethics, Environment — whichever connects)
+
+DISTRIBUTE AS:
+- MCQ 1-3: Primary Subject
+- MCQ 4-5: Cross-Subject Angles (DIFFERENT subjects)
+- MAINS 1-2: Primary Subject
+- MAINS 3-5: Cross-Subject Angles (include Ethics case study)
+
+FORMAT:
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📌 TOPIC ANALYSIS
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+**Topic:** [News item]
+**Primary Subject:** [GS-I/II/III/IV] — [Subject name]
+
+**Cross-Subject Angles:**
+• [Angle 1] — [Different GS Paper] — [Connection]
+• [Angle 2] — [Different GS Paper] — [Connection]
+• [Angle 3] — [Different GS Paper] — [Connection]
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📝 SECTION A: PRIMARY MCQs (Q1-Q3)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+**Q1** | [Primary Subject] | PRIMARY
+
+[Question]
+(a) [Option]
+(b) [Option]
+(c) [Option]
+(d) [Option]
+
+✓ **Answer:** [Letter]
+⚠️ **Trap:** [Explain the trap]
+💡 **Key Point:** [1-2 lines]
+
+-----
+
+[Q2, Q3 same format]
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📝 SECTION B: CROSS-SUBJECT MCQs (Q4-Q5) 🔀
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+**Q4** | [Different Subject] | CROSS-ANGLE 🔀
+
+[Question linking news to different subject]
+(a)-(d) options
+
+✓ **Answer:** [Letter]
+💡 **Cross-Link:** [How this connects to original news]
+
+-----
+
+**Q5** | [Another Subject] | CROSS-ANGLE 🔀
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📝 SECTION C: PRIMARY MAINS (M1-M2)
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+**M1** | [Primary Paper] | PRIMARY | 15 marks
+
+"[Question]"
+
+**Answer Framework (250 words):**
+• **Intro (30 words):** [Approach]
+• **Body (150 words):** [Key points]
+• **Conclusion (40 words):** [Balanced ending]
+
+**Must Include:** [Cases, committees, articles]
+**Avoid:** [Common mistakes]
+
+-----
+
+[M2 same format]
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+📝 SECTION D: CROSS-SUBJECT MAINS (M3-M5) 🔀
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+**M3** | [Different Paper] | CROSS-ANGLE 🔀 | 15 marks
+**Cross-Link:** [Why UPSC asks from this angle]
+
+-----
+
+**M4** | [Another Paper] | CROSS-ANGLE 🔀
+
+-----
+
+**M5** | GS-IV | Ethics | CROSS-ANGLE 🔀 | Case Study
+
+[Ethics case study based on the topic]
+**Ethical Dimensions:** [Values at stake]
+**Framework:** [How to approach]
+
+━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+
+RULES:
+1. Exactly 5 primary + 5 cross-subject questions
+2. Cross-subject must be GENUINELY different subjects
+3. Use real UPSC trap patterns
+4. All cases/committees must be REAL
+5. Balanced conclusions always"""
+
+# The fixed 5+5 rules are sent as a cacheable prefix so repeat queries skip
+# re-processing them. The API ignores cache_control on prefixes shorter than
+# the model minimum (1024 tokens for Sonnet); the stats below show if it hits.
+SYSTEM_BLOCKS = [{
+    "type": "text",
+    "text": SYSTEM_PROMPT,
+    "cache_control": {"type": "ephemeral"}
+}]
+
+SECTION_RULE = "━" * 46
+
+# Fan-out sections: (id, header line, what to write, max_tokens)
+SECTIONS = [
+    ("A", "📝 SECTION A: PRIMARY MCQs (Q1-Q3)", "MCQs Q1-Q3 from the primary subject", 1800),
+    ("B", "📝 SECTION B: CROSS-SUBJECT MCQs (Q4-Q5) 🔀", "MCQs Q4-Q5 from two DIFFERENT cross-subject angles", 1200),
+    ("C", "📝 SECTION C: PRIMARY MAINS (M1-M2)", "Mains M1-M2 from the primary subject", 1600),
+    ("D", "📝 SECTION D: CROSS-SUBJECT MAINS (M3-M5) 🔀", "Mains M3-M5 from cross-subject angles, M5 being the Ethics case study", 2400),
+]
+
+
+# No cache_control: the JSON prompt (about 2,000 characters) is well under
+# the 1024-token caching minimum, so a marker would never create a cache.
+STRUCTURED_SYSTEM_BLOCKS = [{
+    "type": "text",
+    "text": STRUCTURED_SYSTEM_PROMPT,
+}]
+
+
+def user_message(topic: str) -> dict:
+    return {
+        "role": "user",
+        "content": f"Generate 10 UPSC questions for:\n\n{topic}\n\nRemember: 5 from primary subject + 5 from cross-subject angles."
+    }
+
+
+def single_request(topic: str) -> dict:
+    """Messages API parameters for the single-call mode."""
+    return dict(
+        model=CLAUDE_MODEL,
+        max_tokens=6000,
+        system=SYSTEM_BLOCKS,
+        messages=[user_message(topic)]
+    )
+
+
+# =============================================================================
+# USAGE STATS
+# =============================================================================
+
+class PromptCacheStats:
+    """Per-call prompt cache token counts for recent generations."""
+
+    def __init__(self, max_calls: int = 200):
+        self._lock = threading.Lock()
+        self.calls = deque(maxlen=max_calls)
+
+    def record(self, usage):
+        """Record the usage block of one completed Claude call."""
+        entry = {
+            'at': datetime.utcnow().isoformat(),
+            'input_tokens': usage.input_tokens,
+            'output_tokens': usage.output_tokens,
+            'cache_read_tokens': usage.cache_read_input_tokens or 0,
+            'cache_write_tokens': usage.cache_creation_input_tokens or 0,
+        }
+        with self._lock:
+            self.calls.append(entry)
+        return entry
+
+    def totals(self) -> dict:
+        """Sum token counts over the recorded calls."""
+        with self._lock:
+            calls = list(self.calls)
+        totals = {'calls': len(calls), 'input_tokens': 0, 'output_tokens': 0,
+                  'cache_read_tokens': 0, 'cache_write_tokens': 0}
+        for entry in calls:
+            for key in ('input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_write_tokens'):
+                totals[key] += entry[key]
+        return totals
+
+
+# =============================================================================
+# RATE LIMITING
+# =============================================================================
+
+class LLMBusyError(RuntimeError):
+    """Raised when the provider stays rate-limited/overloaded after all retries."""
+
+
+def is_retryable(error: Exception) -> bool:
+    """429, 529/5xx and mid-stream overloaded/rate-limit events."""
+    if isinstance(error, (anthropic.RateLimitError, anthropic.InternalServerError)):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        body = error.body if isinstance(error.body, dict) else {}
+        kind = (body.get('error') or {}).get('type') or body.get('type')
+        return error.status_code in (429, 529) or kind in ('overloaded_error', 'rate_limit_error')
+    return False
+
+
+def retry_after_seconds(error: Exception):
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers.get('retry-after'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class LLMLimiter:
+    """Server-wide cap on concurrent Claude calls with an ordered wait queue.
+
+    Waiters are served by (priority, arrival), lower priority first. A 429 or
+    overload pauses every new call for the retry-after (or backoff) delay and
+    the failed call is retried with exponential backoff and jitter.
+    """
+
+    def __init__(self, max_concurrent: int = 6, max_attempts: int = 4,
+                 base_delay: float = 2.0, max_delay: float = 60.0):
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._seq = itertools.count()
+        self.active = 0
+        self.paused_until = 0.0
+        self.avg_call_seconds = 20.0
+        self.calls = 0
+        self.throttled = 0
+        self.gave_up = 0
+
+    def _eta(self, position: int) -> float:
+        """Seconds until a waiter at this position should get a slot."""
+        waves = math.ceil(position / self.max_concurrent)
+        return waves * self.avg_call_seconds + max(0.0, self.paused_until - time.monotonic())
+
+    def _ready(self, ticket) -> bool:
+        """Caller holds _cond: ticket is first in line and a slot is free."""
+        return (self._waiting[0] == ticket and self.active < self.max_concurrent
+                and time.monotonic() >= self.paused_until)
+
+    def _wait(self):
+        """Wait (holding _cond) for a notify, or until a pause ends, at most a second."""
+        paused_for = self.paused_until - time.monotonic()
+        self._cond.wait(timeout=min(1.0, paused_for) if paused_for > 0 else 1.0)
+
+    @contextmanager
+    def slot(self, priority: int = 0, on_queue=None):
+        """Hold one of max_concurrent slots; on_queue(position, eta) while waiting."""
+        ticket = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._ready(ticket):
+                        heapq.heappop(self._waiting)
+                        self.active += 1
+                        self.calls += 1
+                        # The next ticket is now at the head and may fit in another slot
+                        self._cond.notify_all()
+                        break
+                    if on_queue is None:
+                        self._wait()
+                        continue
+                    position = 1 + sum(1 for other in self._waiting if other < ticket)
+                    eta = self._eta(position)
+                # Outside the lock: on_queue may write to the job store over the network
+                on_queue(position, eta)
+                with self._cond:
+                    if not self._ready(ticket):
+                        self._wait()
+        except BaseException:
+            with self._cond:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+            raise
+        started = time.monotonic()
+        try:
+            # Inside the try: a failed job-store write must still give the slot back
+            if on_queue is not None:
+                on_queue(0, 0.0)
+            yield
+        finally:
+            with self._cond:
+                self.active -= 1
+                self.avg_call_seconds = 0.8 * self.avg_call_seconds + 0.2 * (time.monotonic() - started)
+                self._cond.notify_all()
+
+    def pause(self, seconds: float):
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def call(self, fn, priority: int = 0, on_queue=None):
+        """Run fn() inside a slot, backing off and retrying on 429/overload."""
+        for attempt in range(self.max_attempts):
+            with self.slot(priority, on_queue):
+                try:
+                    return fn()
+                except Exception as e:
+                    if not is_retryable(e):
+                        raise
+                    error = e
+            with self._cond:
+                self.throttled += 1
+            if attempt == self.max_attempts - 1:
+                break
+            delay = retry_after_seconds(error)
+            if delay is None:
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt) * (0.5 + random.random())
+            self.pause(delay)
+        with self._cond:
+            self.gave_up += 1
+        raise LLMBusyError("Our AI provider is very busy right now. No credit was used — please try again in a minute.") from error
+
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                'active': self.active,
+                'waiting': len(self._waiting),
+                'calls': self.calls,
+                'throttled': self.throttled,
+                'gave_up': self.gave_up,
+                'paused_for': max(0.0, self.paused_until - time.monotonic()),
+                'avg_call_seconds': self.avg_call_seconds,
+            }
+
+
+def _limited(limit, fn):
+    return fn() if limit is None else limit(fn)
+
+
+# =============================================================================
+# GENERATION
+# =============================================================================
+
+COMPLETE_STOP_REASONS = ("end_turn", "stop_sequence")
+
+
+def _check_complete(message):
+    """Raise unless the model finished on its own; cut-off or truncated output is never charged."""
+    if message.stop_reason is None:
+        raise RuntimeError("Generation was interrupted. No credit was used.")
+    if message.stop_reason not in COMPLETE_STOP_REASONS:
+        raise RuntimeError(f"Generation stopped early ({message.stop_reason}). No credit was used.")
+
+
+def generate_single(client, topic: str, on_progress=None, usage_stats: PromptCacheStats = None,
+                    limit=None) -> str:
+    """Generate all 10 questions in one completion.
+
+    With on_progress the completion is streamed and on_progress(text_so_far)
+    is called for every chunk. limit(fn), e.g. an LLMLimiter.call wrapper,
+    runs each API call. Raises if the call fails or is cut off.
+    """
+    request = single_request(topic)
+
+    def create():
+        response = client.messages.create(**request)
+        if usage_stats is not None:
+            usage_stats.record(response.usage)
+        _check_complete(response)
+        return response.content[0].text
+
+    def stream():
+        # Restarts from scratch on a retry; on_progress gets the full text each time
+        output = ""
+        with client.messages.stream(**request) as message_stream:
+            for text in message_stream.text_stream:
+                output += text
+                on_progress(output)
+            final = message_stream.get_final_message()
+        if usage_stats is not None:
+            usage_stats.record(final.usage)
+        _check_complete(final)
+        return output
+
+    return _limited(limit, create if on_progress is None else stream)
+
+
+def _complete(client, content: str, max_tokens: int, usage_stats: PromptCacheStats = None, limit=None) -> str:
+    response = _limited(limit, lambda: client.messages.create(
+        model=CLAUDE_MODEL,
+        max_tokens=max_tokens,
+        system=SYSTEM_BLOCKS,
+        messages=[{"role": "user", "content": content}]
+    ))
+    if usage_stats is not None:
+        usage_stats.record(response.usage)
+    _check_complete(response)
+    return response.content[0].text.strip()
+
+
+def generate_analysis(client, topic: str, usage_stats: PromptCacheStats = None, limit=None) -> str:
+    """Write only the TOPIC ANALYSIS block for a topic."""
+    content = (
+        f"Topic:\n\n{topic}\n\n"
+        "Write ONLY the 📌 TOPIC ANALYSIS block in the FORMAT above, including its "
+        "rule lines. Do not write any questions."
+    )
+    return _complete(client, content, 700, usage_stats, limit)
+
+
+def generate_section(client, topic: str, analysis: str, section: tuple, usage_stats: PromptCacheStats = None,
+                     limit=None) -> str:
+    """Write one of sections A-D, consistent with an existing topic analysis."""
+    _, header, scope, max_tokens = section
+    content = (
+        f"Topic:\n\n{topic}\n\n"
+        f"The topic analysis is already written:\n\n{analysis}\n\n"
+        f"Write ONLY \"{header}\" — {scope} — in the FORMAT above, starting with "
+        "its rule and header lines. Use the subjects and angles from the analysis. "
+        "Do not repeat the analysis or write any other section."
+    )
+    return _complete(client, content, max_tokens, usage_stats, limit)
+
+
+def generate_fanout(client, topic: str, on_progress=None, usage_stats: PromptCacheStats = None,
+                    limit=None, max_workers: int = len(SECTIONS)) -> str:
+    """Generate the analysis, then sections A-D concurrently, in the usual layout.
+
+    Wall-clock time is the analysis plus the slowest section. on_progress is
+    called from the calling thread with the text so far, keeping section
+    order, so it is safe to render from. Raises if any call fails.
+    """
+    analysis = generate_analysis(client, topic, usage_stats, limit)
+    if on_progress is not None:
+        on_progress(analysis)
+
+    parts = [None] * len(SECTIONS)
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upsc-section") as pool:
+        futures = [
+            pool.submit(generate_section, client, topic, analysis, section, usage_stats, limit)
+            for section in SECTIONS
+        ]
+        for i, future in enumerate(futures):
+            # Collected in order: a finished later section waits for earlier ones
+            parts[i] = future.result()
+            if on_progress is not None:
+                on_progress(_assemble(analysis, parts[:i + 1]))
+
+    return _assemble(analysis, parts) + "\n\n" + SECTION_RULE
+
+
+def _assemble(analysis: str, parts: list) -> str:
+    return "\n\n".join([analysis] + [p for p in parts if p])
+
+
+def generate_structured_questions(client, topic: str, on_item=None, usage_stats: PromptCacheStats = None,
+                                  limit=None):
+    """Stream the questions as JSON and return a StructuredQuestions.
+
+    on_item(item, result) is called from the calling thread as soon as the
+    analysis, an MCQ or a Mains question is complete in the stream. On a
+    retry the parse restarts, so on_item sees earlier items again.
+    """
+    request = dict(single_request(topic), system=STRUCTURED_SYSTEM_BLOCKS)
+
+    def stream():
+        parser = StreamingQuestionParser()
+        with client.messages.stream(**request) as message_stream:
+            for text in message_stream.text_stream:
+                for item in parser.feed(text):
+                    if on_item is not None:
+                        on_item(item, parser.result)
+            final = message_stream.get_final_message()
+        if usage_stats is not None:
+            usage_stats.record(final.usage)
+        _check_complete(final)
+        if not parser.done or len(parser.result.mcqs) + len(parser.result.mains) == 0:
+            raise RuntimeError("Generation returned malformed questions. No credit was used.")
+        return parser.result
+
+    return _limited(limit, stream)
+
+
+def generate_structured(client, topic: str, on_progress=None, usage_stats: PromptCacheStats = None,
+                        limit=None) -> str:
+    """Structured mode rendered in the usual layout, one whole question at a time."""
+    def on_item(_item, result):
+        if on_progress is not None:
+            on_progress(result.to_text() + "\n")
+
+    result = generate_structured_questions(client, topic, on_item, usage_stats, limit)
+    return result.to_text() + "\n\n" + SECTION_RULE
+
+
+GENERATION_MODES = {
+    'single': generate_single,
+    'fanout': generate_fanout,
+    'structured': generate_structured,
+}
@@ -0,0 +1,439 @@
+"""
+GENERATION CACHE
+================
+Two-tier cache for generated question sets, keyed on a normalized topic.
+
+- Tier 1: in-process LRU with TTL, shared by every session on the server
+- Tier 2: Supabase `generation_cache` table, survives restarts
+- Rewordings (same words in another order, or extra filler such as "latest")
+  resolve to an existing key through a bounded MinHash/LSH index
+- Concurrent misses for the same key share one generation (SingleFlight)
+
+SUPABASE TABLE: migrations/009_generation_cache.sql
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+CACHE_TABLE = 'generation_cache'
+
+# Words that carry no topic signal in a headline. Negations and words that
+# flip a headline's meaning (before/after, up/down, if) are deliberately
+# absent: "will not hear plea" and "will hear plea" must not share a key.
+STOP_WORDS = frozenset({
+    'a', 'an', 'the', 'and', 'or', 'of', 'in', 'on', 'at', 'to', 'for',
+    'from', 'by', 'with', 'as', 'into', 'about',
+    'is', 'are', 'was', 'were', 'be', 'been', 'being', 'has', 'have', 'had',
+    'it', 'its', 'this', 'that', 'these', 'those', 'their', 'his', 'her',
+    'will', 'would', 'can', 'could', 'shall', 'should', 'may', 'might',
+    'do', 'does', 'did', 'then', 'so',
+})
+
+# Kept as tokens, and never allowed to differ between a topic and its near match
+NEGATIONS = frozenset({'not', 'no', 'never', 'without', 'nor'})
+
+
+def normalize_topic(topic: str) -> str:
+    """Fold case, strip punctuation and stop words, collapse whitespace."""
+    text = unicodedata.normalize('NFKC', topic or '').casefold()
+    # "won't"/"can't"/"cannot" must keep their negation once punctuation goes
+    text = re.sub(r"\bwon['’]t\b", 'will not', text)
+    text = re.sub(r"\b(can|shan)['’]t\b", r'\1 not', text)
+    text = re.sub(r"n['’]t\b", ' not', text)
+    text = re.sub(r'\bcannot\b', 'can not', text)
+    text = re.sub(r'[^\w\s]', ' ', text)
+    words = [w for w in text.split() if w not in STOP_WORDS]
+    return ' '.join(words)
+
+
+# Abbreviations headline writers use interchangeably with the full name
+TOPIC_ALIASES = {
+    'tn': 'tamil nadu', 'up': 'uttar pradesh', 'mp': 'madhya pradesh',
+    'ap': 'andhra pradesh', 'wb': 'west bengal', 'j&k': 'jammu kashmir',
+    'jk': 'jammu kashmir', 'sc': 'supreme court', 'hc': 'high court',
+    'govt': 'government', 'gov': 'government', 'pm': 'prime minister',
+    'cm': 'chief minister', 'ec': 'election commission', 'eci': 'election commission',
+    'us': 'united states', 'usa': 'united states', 'uk': 'united kingdom',
+}
+
+
+def _fold_plural(word: str) -> str:
+    if len(word) > 3 and word.endswith('s') and not word.endswith('ss'):
+        return word[:-1]
+    return word
+
+
+def topic_tokens(topic: str) -> frozenset:
+    """Word set used for similarity: aliases expanded, plurals folded."""
+    text = unicodedata.normalize('NFKC', topic or '').casefold()
+    words = []
+    for raw in text.split():
+        word = raw.strip('.,;:!?"\'()[]')
+        words.extend(TOPIC_ALIASES.get(word, word).split())
+    return frozenset(_fold_plural(word) for word in normalize_topic(' '.join(words)).split())
+
+
+def jaccard(a: frozenset, b: frozenset) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+# The only words a near match may add or drop. Word sets cannot tell a
+# paraphrase ("Governor delays NEET bill" / "Governor returns NEET bill")
+# from contradicting news ("RBI cuts repo rate" / "RBI holds repo rate"):
+# both differ in one verb. So any other unshared word (a verb, a number, a
+# negation, a name) means a different topic.
+FILLER_WORDS = frozenset(_fold_plural(word) for word in (
+    'latest', 'news', 'today', 'todays', 'update', 'updates', 'analysis', 'explained', 'explainer',
+    'issue', 'issues', 'report', 'story', 'highlights', 'key', 'current', 'affairs', 'upsc',
+    'recent', 'new', 'amid', 'says', 'said', 'topic', 'questions', 'question', 'mcq', 'mcqs',
+))
+
+
+def interchangeable(a: frozenset, b: frozenset) -> bool:
+    """Whether two topics' word sets differ only in FILLER_WORDS."""
+    return all(token in FILLER_WORDS for token in a ^ b)
+
+
+class TopicLSHIndex:
+    """Bounded MinHash/LSH index from topic token sets to cache keys.
+
+    Signatures use NUM_PERM universal hashes split into BANDS bands; any
+    shared band bucket makes a candidate, which is then confirmed with an
+    exact Jaccard check against the threshold and must differ from the
+    query only in filler words (see FILLER_WORDS).
+    """
+
+    NUM_PERM = 64
+    BANDS = 16
+    _PRIME = (1 << 61) - 1
+
+    def __init__(self, threshold: float = 0.8, max_entries: int = 5000, seed: int = 1):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.rows = self.NUM_PERM // self.BANDS
+        rng = random.Random(seed)
+        self._perms = [(rng.randrange(1, self._PRIME), rng.randrange(0, self._PRIME))
+                       for _ in range(self.NUM_PERM)]
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (tokens, band hashes)
+        self._buckets = {}              # (band, band hash) -> set of keys
+
+    def _signature(self, tokens: frozenset) -> list:
+        hashes = [int.from_bytes(hashlib.blake2b(t.encode(), digest_size=8).digest(), 'big') for t in tokens]
+        prime = self._PRIME
+        return [min((a * h + b) % prime for h in hashes) for a, b in self._perms]
+
+    def _bands(self, tokens: frozenset) -> tuple:
+        sig = self._signature(tokens)
+        rows = self.rows
+        return tuple(hash(tuple(sig[i:i + rows])) for i in range(0, self.NUM_PERM, rows))
+
+    def add(self, key: str, topic: str):
+        tokens = topic_tokens(topic)
+        if not key or not tokens:
+            return
+        bands = self._bands(tokens)
+        with self._lock:
+            self._remove_locked(key)
+            self._entries[key] = (tokens, bands)
+            for band, band_hash in enumerate(bands):
+                self._buckets.setdefault((band, band_hash), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove_locked(next(iter(self._entries)))
+
+    def remove(self, key: str):
+        with self._lock:
+            self._remove_locked(key)
+
+    def _remove_locked(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for band, band_hash in enumerate(entry[1]):
+            bucket = self._buckets.get((band, band_hash))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[(band, band_hash)]
+
+    def query(self, topic: str):
+        """Return (key, similarity) of the closest interchangeable indexed topic above threshold."""
+        tokens = topic_tokens(topic)
+        if not tokens:
+            return None, 0.0
+        bands = self._bands(tokens)
+        best_key, best_score = None, 0.0
+        with self._lock:
+            candidates = set()
+            for band, band_hash in enumerate(bands):
+                candidates |= self._buckets.get((band, band_hash), set())
+            for key in candidates:
+                indexed = self._entries[key][0]
+                score = jaccard(tokens, indexed)
+                if score > best_score and interchangeable(tokens, indexed):
+                    best_key, best_score = key, score
+        if best_score < self.threshold:
+            return None, best_score
+        return best_key, best_score
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class LRUTTLCache:
+    """Thread-safe LRU map whose entries also expire after a fixed TTL."""
+
+    def __init__(self, max_entries: int = 500, ttl_seconds: float = 86400):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl_seconds: float = None):
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry else None
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class GenerationCache:
+    """LRU+TTL memory tier in front of a persistent Supabase table."""
+
+    def __init__(self, supabase=None, model: str = '', max_entries: int = 500,
+                 ttl_seconds: float = 86400, similarity_threshold: float = 0.8,
+                 max_index_entries: int = 5000):
+        self.supabase = supabase
+        self.model = model
+        self.ttl_seconds = ttl_seconds
+        self.memory = LRUTTLCache(max_entries, ttl_seconds)
+        self.index = TopicLSHIndex(similarity_threshold, max_index_entries)
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def key_for(self, topic: str) -> str:
+        """Cache key for a topic; empty if nothing meaningful is left."""
+        return normalize_topic(topic)
+
+    def get(self, topic: str, record_stats: bool = True):
+        """Return cached output for the topic, or None on a miss."""
+        key = self.key_for(topic)
+        if not key:
+            return None
+
+        output, tier = self._lookup(key)
+        if output is not None:
+            if record_stats:
+                self._count(tier)
+            return output
+
+        # Rewording of a recent topic? Reuse its result
+        near_key, _ = self.index.query(topic)
+        if near_key and near_key != key:
+            output, _ = self._lookup(near_key)
+            if output is not None:
+                if record_stats:
+                    self._count('near_hits')
+                return output
+            self.index.remove(near_key)
+
+        if record_stats:
+            self._count('misses')
+        return None
+
+    def _lookup(self, key: str):
+        """Exact-key lookup through both tiers; returns (output, stats field)."""
+        output = self.memory.get(key)
+        if output is not None:
+            return output, 'memory_hits'
+
+        output, expires_at = self._db_get(key)
+        if output is not None:
+            remaining = (expires_at - datetime.now(timezone.utc)).total_seconds()
+            self.memory.put(key, output, min(self.ttl_seconds, max(remaining, 0)))
+            return output, 'db_hits'
+        return None, None
+
+    def put(self, topic: str, output: str):
+        """Store output for the topic in both tiers."""
+        key = self.key_for(topic)
+        if not key or not output:
+            return
+        self.memory.put(key, output)
+        self.index.add(key, topic)
+        self._db_put(key, topic, output)
+
+    def rebuild_index(self, limit: int = None):
+        """Re-index unexpired topics from the persisted table (run at startup)."""
+        if not self.supabase:
+            return 0
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            limit = limit or self.index.max_entries
+            result = self.supabase.table(CACHE_TABLE).select('topic_key, topic').eq('model', self.model).gt('expires_at', now).order('created_at', desc=True).limit(limit).execute()
+            # Oldest first so the newest topics survive the index bound
+            for row in reversed(result.data or []):
+                self.index.add(row['topic_key'], row['topic'])
+            return len(result.data or [])
+        except Exception:
+            return 0
+
+    def stats(self) -> dict:
+        hits = self.memory_hits + self.db_hits + self.near_hits
+        lookups = hits + self.misses
+        return {
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'evictions': self.memory.evictions,
+            'expirations': self.memory.expirations,
+            'entries': len(self.memory),
+            'indexed_topics': len(self.index),
+        }
+
+    def _count(self, field: str):
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def _db_get(self, key: str):
+        if not self.supabase:
+            return None, None
+        try:
+            now = datetime.now(timezone.utc).isoformat()
+            result = self.supabase.table(CACHE_TABLE).select('output, expires_at').eq('topic_key', key).eq('model', self.model).gt('expires_at', now).limit(1).execute()
+            if not result.data:
+                return None, None
+            row = result.data[0]
+            expires_at = datetime.fromisoformat(row['expires_at'].replace('Z', '+00:00'))
+            return row['output'], expires_at
+        except Exception:
+            return None, None
+
+    def _db_put(self, key: str, topic: str, output: str):
+        if not self.supabase:
+            return
+        try:
+            expires_at = datetime.now(timezone.utc) + timedelta(seconds=self.ttl_seconds)
+            self.supabase.table(CACHE_TABLE).upsert({
+                'topic_key': key,
+                'topic': topic.strip(),
+                'output': output,
+                'model': self.model,
+                'expires_at': expires_at.isoformat()
+            }).execute()
+        except Exception:
+            pass
+
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key onto one execution.
+
+    The first caller (leader) runs fn(on_progress); callers arriving while it
+    is in flight wait for its result instead of starting their own, and get
+    its progress updates as well.
+    """
+
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+            self.progress = None
+            self.listeners = []
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key: str, fn, on_progress=None):
+        if not key:
+            return fn(on_progress or (lambda text: None))
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+            if on_progress is not None:
+                call.listeners.append(on_progress)
+            progress = call.progress
+
+        if not leader:
+            if on_progress is not None and progress is not None:
+                on_progress(progress)
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        def broadcast(text):
+            with self._lock:
+                call.progress = text
+                listeners = list(call.listeners)
+            for listener in listeners:
+                try:
+                    listener(text)
+                except Exception:
+                    pass
+
+        try:
+            call.result = fn(broadcast)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            in_flight = len(self._calls)
+        return {'executed': self.executed, 'coalesced': self.coalesced, 'in_flight': in_flight}
@@ -0,0 +1,97 @@
+"""
+GENERATION HISTORY
+==================
+Every successful generation is kept per user (topic, model, compressed
+output), so a result lost to a rerun or refresh can be reopened and
+downloaded again without another API call or credit.
+
+Listing pages are metadata only, keyset-paged newest first; a body is
+fetched and decompressed only when the user opens that entry.
+
+SUPABASE TABLE: migrations/005_generation_history.sql
+"""
+
+import threading
+import zlib
+from datetime import datetime, timezone
+
+HISTORY_TABLE = 'generation_history'
+HISTORY_PAGE_SIZE = 10
+LIST_COLUMNS = 'id,topic,model,mode,chars,created_at'
+
+
+def compress(text: str) -> str:
+    """Output text -> zlib bytes as a Postgres bytea hex literal (PostgREST's JSON form)."""
+    return '\\x' + zlib.compress(text.encode('utf-8'), 9).hex()
+
+
+def decompress(value: str) -> str:
+    """Inverse of compress()."""
+    return zlib.decompress(bytes.fromhex(value[2:] if value.startswith('\\x') else value)).decode('utf-8')
+
+
+class HistoryStore:
+    """A user's past generations in Supabase.
+
+    Without a Supabase client entries are kept in memory, so history still
+    works for the life of the server process. add() never raises: losing a
+    history row must not fail a generation that already succeeded.
+    """
+
+    def __init__(self, supabase=None):
+        self.supabase = supabase
+        self._lock = threading.Lock()
+        self._entries = []      # in-memory rows, oldest first
+        self._next_id = 1
+
+    def add(self, email: str, topic: str, output: str, model: str = None, mode: str = None) -> bool:
+        row = {
+            'email': email.lower().strip(),
+            'topic': topic.strip(),
+            'model': model,
+            'mode': mode,
+            'chars': len(output),
+            'body': compress(output),
+        }
+        if self.supabase:
+            try:
+                self.supabase.table(HISTORY_TABLE).insert(row).execute()
+                return True
+            except Exception:
+                return False
+        with self._lock:
+            self._entries.append(dict(row, id=self._next_id, created_at=datetime.now(timezone.utc).isoformat()))
+            self._next_id += 1
+        return True
+
+    def page(self, email: str, before_id: int = None, limit: int = HISTORY_PAGE_SIZE):
+        """(entries, more): up to `limit` entries older than before_id, newest first, no bodies."""
+        email = email.lower().strip()
+        if self.supabase:
+            query = self.supabase.table(HISTORY_TABLE).select(LIST_COLUMNS).eq('email', email)
+            if before_id is not None:
+                query = query.lt('id', before_id)
+            try:
+                rows = query.order('id', desc=True).limit(limit + 1).execute().data or []
+            except Exception:
+                return [], False
+        else:
+            with self._lock:
+                rows = [{k: e[k] for k in LIST_COLUMNS.split(',')} for e in reversed(self._entries)
+                        if e['email'] == email and (before_id is None or e['id'] < before_id)][:limit + 1]
+        return rows[:limit], len(rows) > limit
+
+    def body(self, email: str, entry_id: int):
+        """Decompressed output of one entry, only if it belongs to email."""
+        email = email.lower().strip()
+        if self.supabase:
+            try:
+                result = (self.supabase.table(HISTORY_TABLE).select('body')
+                          .eq('id', entry_id).eq('email', email).execute())
+            except Exception:
+                return None
+            rows = result.data or []
+        else:
+            with self._lock:
+                rows = [e for e in self._entries if e['id'] == entry_id and e['email'] == email]
+        return decompress(rows[0]['body']) if rows else None
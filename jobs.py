@@ -0,0 +1,296 @@
+"""
+GENERATION JOBS
+===============
+Generate clicks become job rows run by a background worker pool, so a
+refresh or disconnect during the wait does not lose the result. The page
+only polls the job; the worker reserves a credit before generating and
+refunds it if the generation fails.
+
+SUPABASE TABLE: migrations/008_generation_jobs.sql
+"""
+
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+JOBS_TABLE = 'generation_jobs'
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED = (DONE, FAILED)
+
+REFUND_ATTEMPTS = 3
+REFUND_RETRY_SECONDS = 0.5
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class JobStore:
+    """Job rows in Supabase, mirrored in memory for fast polling.
+
+    Without a Supabase client the in-memory mirror is the store, so jobs
+    still survive page reloads (but not server restarts).
+    """
+
+    def __init__(self, supabase=None):
+        self.supabase = supabase
+        self._lock = threading.Lock()
+        self._jobs = {}
+
+    def create(self, email: str, topic: str, **extra) -> dict:
+        job = {
+            'id': str(uuid.uuid4()),
+            'email': email.lower().strip(),
+            'topic': topic.strip(),
+            'status': QUEUED,
+            'result': None,
+            'error': None,
+            'charged': False,
+            'created_at': _now(),
+        }
+        job.update(extra)
+        if self.supabase:
+            self.supabase.table(JOBS_TABLE).insert(job).execute()
+        with self._lock:
+            self._jobs[job['id']] = dict(job)
+        return job
+
+    def adopt(self, job: dict):
+        """Mirror a job this process did not create (resumed after a restart)."""
+        with self._lock:
+            self._jobs.setdefault(job['id'], dict(job))
+
+    def mirror(self, job_id: str, **fields):
+        """Record fields a database function already wrote (e.g. the charged flag)."""
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+
+    def get(self, job_id: str):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                return dict(job)
+        if not self.supabase:
+            return None
+        try:
+            result = self.supabase.table(JOBS_TABLE).select('*').eq('id', job_id).execute()
+        except Exception:
+            return None
+        if not result.data:
+            return None
+        job = result.data[0]
+        # Only finished rows are safe to mirror; live ones belong to a worker
+        if job['status'] in FINISHED:
+            with self._lock:
+                self._jobs[job_id] = dict(job)
+        return job
+
+    def update(self, job_id: str, **fields):
+        fields['updated_at'] = _now()
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(fields)
+        if self.supabase:
+            try:
+                self.supabase.table(JOBS_TABLE).update(fields).eq('id', job_id).execute()
+            except Exception:
+                pass
+
+    def by_group(self, group_id: str) -> list:
+        """All jobs of a bulk run, oldest first."""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job.get('group_id') == group_id]
+        if not jobs and self.supabase:
+            try:
+                result = self.supabase.table(JOBS_TABLE).select('*').eq('group_id', group_id).execute()
+                jobs = result.data or []
+            except Exception:
+                jobs = []
+        return sorted(jobs, key=lambda job: job['created_at'])
+
+    def by_provider_batch(self, batch_id: str) -> list:
+        """All jobs sent in one Message Batches API batch."""
+        with self._lock:
+            jobs = [dict(job) for job in self._jobs.values() if job.get('provider_batch_id') == batch_id]
+        if not jobs and self.supabase:
+            try:
+                result = self.supabase.table(JOBS_TABLE).select('*').eq('provider_batch_id', batch_id).execute()
+                jobs = result.data or []
+            except Exception:
+                jobs = []
+        return jobs
+
+    def mark_charged(self, job_id: str, charged: bool = True, **fields) -> bool:
+        """Flip charged to `charged` (with fields); True only for the one caller that flipped it."""
+        fields['charged'] = charged
+        if self.supabase:
+            result = (self.supabase.table(JOBS_TABLE).update(dict(fields, updated_at=_now()))
+                      .eq('id', job_id).eq('charged', not charged).execute())
+            flipped = bool(result.data)
+            if flipped:
+                with self._lock:
+                    if job_id in self._jobs:
+                        self._jobs[job_id].update(fields)
+            return flipped
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job['charged'] == charged:
+                return False
+            job.update(fields)
+            return True
+
+    def pending(self, max_age_minutes: int = 60) -> list:
+        """Unfinished jobs from the last hour, e.g. orphaned by a restart."""
+        if not self.supabase:
+            return []
+        try:
+            since = (datetime.now(timezone.utc) - timedelta(minutes=max_age_minutes)).isoformat()
+            result = self.supabase.table(JOBS_TABLE).select('*').in_('status', [QUEUED, RUNNING]).gt('created_at', since).execute()
+            return result.data or []
+        except Exception:
+            return []
+
+    def evict_finished(self, keep: int = 1000):
+        """Bound the in-memory mirror; finished jobs stay readable from Supabase."""
+        with self._lock:
+            finished = [jid for jid, job in self._jobs.items() if job['status'] in FINISHED]
+            for jid in finished[:max(0, len(finished) - keep)]:
+                del self._jobs[jid]
+
+
+class JobRunner:
+    """Runs jobs on a thread pool.
+
+    execute(topic, on_progress, on_queue) returns the generated text or
+    raises; on_queue(position, eta_seconds) reports waits for an API slot.
+    reserve(job) takes a credit before the API call and marks the job
+    charged, returning the credit's kind (None when there is none);
+    refund(job) gives it back and clears the flag if the generation fails.
+    Both act on the job's charged flag in the same database statement
+    (migrations/011), so a credit is taken and returned at most once per
+    job. A failing job always ends FAILED, even when Supabase is down; a
+    refund that raises is retried, then logged to stderr. on_result(job,
+    output), if given, is called after a job is marked done. The pool is
+    sized above the API concurrency limit so waiting jobs sit in the
+    limiter's queue, where they have a position to report.
+    """
+
+    def __init__(self, store: JobStore, execute, reserve, refund, on_result=None, max_workers: int = 32):
+        self.store = store
+        self.execute = execute
+        self.reserve = reserve
+        self.refund = refund
+        self.on_result = on_result
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="upsc-job")
+        self._lock = threading.Lock()
+        self._progress = {}
+        self._queue = {}
+
+    def submit(self, email: str, topic: str, **extra) -> str:
+        job = self.store.create(email, topic, **extra)
+        self._pool.submit(self._run, job)
+        return job['id']
+
+    def resume_pending(self) -> int:
+        """Re-queue jobs a previous server process never finished.
+
+        Jobs that already hold a reserved credit run without taking another.
+        """
+        jobs = [job for job in self.store.pending() if not job.get('provider_batch_id')]
+        for job in jobs:
+            # Mirrored, so pollers in this process see it finish even if Supabase writes fail
+            self.store.adopt(job)
+            self._pool.submit(self._run, job)
+        return len(jobs)
+
+    def progress(self, job_id: str) -> str:
+        with self._lock:
+            return self._progress.get(job_id, "")
+
+    def _set_progress(self, job_id: str, text: str):
+        with self._lock:
+            self._progress[job_id] = text
+
+    def queue_status(self, job_id: str):
+        """(position, eta_seconds) while the job waits for an API slot, else None."""
+        with self._lock:
+            return self._queue.get(job_id)
+
+    def _set_queue(self, job_id: str, position: int, eta: float):
+        with self._lock:
+            if position:
+                self._queue[job_id] = (position, eta)
+            else:
+                self._queue.pop(job_id, None)
+
+    def _run(self, job: dict):
+        job_id = job['id']
+        # Whether the job may hold a credit; refunding one it does not hold is a no-op
+        reserved = bool(job.get('charged'))
+        try:
+            if not reserved:
+                reserved = True  # a reservation that raised may still have landed
+                try:
+                    credit = self.reserve(job)
+                except Exception as e:
+                    raise RuntimeError(f"Could not start the job: {e}") from e
+                if credit is None:
+                    reserved = False
+                    self.store.update(job_id, status=FAILED, error="No credits left.")
+                    return
+                self.store.mirror(job_id, charged=True, credit=credit)
+            self.store.update(job_id, status=RUNNING)
+            output = self.execute(
+                job['topic'],
+                lambda text: self._set_progress(job_id, text),
+                lambda position, eta: self._set_queue(job_id, position, eta),
+            )
+            if not output:
+                raise RuntimeError("Empty response.")
+            self.store.update(job_id, status=DONE, result=output)
+        except Exception as e:
+            self._fail(job, reserved, str(e))
+        else:
+            if self.on_result is not None:
+                try:
+                    self.on_result(job, output)
+                except Exception as e:
+                    print(f"job {job_id}: on_result failed: {e}", file=sys.stderr, flush=True)
+        finally:
+            with self._lock:
+                self._progress.pop(job_id, None)
+                self._queue.pop(job_id, None)
+            self.store.evict_finished()
+
+    def _fail(self, job: dict, reserved: bool, error: str):
+        """Return the job's credit, if it may hold one, and mark it FAILED. Never raises.
+
+        store.update never raises and always updates the in-memory mirror,
+        so pollers in this process see FAILED even if Supabase is down.
+        """
+        if reserved:
+            self._refund(job)
+        self.store.update(job['id'], status=FAILED, error=error)
+
+    def _refund(self, job: dict):
+        """refund(job), retried while it raises, and logged if it never gets through."""
+        problem = None
+        for attempt in range(REFUND_ATTEMPTS):
+            try:
+                # Nothing returned: the job held no credit (any more)
+                self.refund(job)
+                self.store.mirror(job['id'], charged=False, credit=None)
+                return
+            except Exception as e:
+                problem = e
+            time.sleep(REFUND_RETRY_SECONDS * (attempt + 1))
+        print(f"job {job['id']}: could not refund the credit of {job['email']}: {problem}",
+              file=sys.stderr, flush=True)
@@ -0,0 +1,61 @@
+"""
+DATABASE MAINTENANCE
+====================
+Scheduled clean-up for tables that would otherwise grow without bound:
+
+    python maintenance.py purge-otps      # expired or used OTP codes
+
+    # crontab: every 15 minutes
+    */15 * * * * cd /app && python maintenance.py purge-otps >> maintenance.log 2>&1
+
+Or let the database schedule it with pg_cron (Supabase: Database -> Extensions),
+one batch per run:
+    select cron.schedule('purge-otp-codes', '*/15 * * * *', 'select purge_otp_codes(5000)');
+
+Credentials come from the environment (SUPABASE_URL, SUPABASE_KEY), falling
+back to .streamlit/secrets.toml.
+"""
+
+import argparse
+import sys
+import time
+
+from settings import secret
+
+OTP_PURGE_BATCH = 5000
+
+
+def purge_otp_codes(supabase, batch_size: int = OTP_PURGE_BATCH, max_batches: int = 200) -> int:
+    """Delete expired or used OTP rows one batch per call (migration 004). Returns rows deleted."""
+    total = 0
+    for _ in range(max_batches):
+        result = supabase.rpc('purge_otp_codes', {'p_batch_size': batch_size}).execute()
+        deleted = int(result.data or 0)
+        total += deleted
+        if deleted < batch_size:
+            break
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('job', choices=['purge-otps'])
+    parser.add_argument('--batch-size', type=int, default=OTP_PURGE_BATCH)
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    url, key = secret('SUPABASE_URL'), secret('SUPABASE_KEY')
+    if not (url and key):
+        sys.exit('SUPABASE_URL / SUPABASE_KEY are not set')
+
+    started = time.perf_counter()
+    try:
+        deleted = purge_otp_codes(create_client(url, key), batch_size=args.batch_size)
+    except Exception as e:
+        sys.exit(f"purge failed: {e}")
+    print(f"purged {deleted} OTP code(s) in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+SCHEMA MIGRATIONS
+=================
+Versioned SQL files in migrations/ (NNN_description.sql), applied in order,
+each in its own transaction and recorded in a schema_migrations table so
+every file runs exactly once per database:
+
+    python migrate.py              # apply pending migrations
+    python migrate.py --status     # list applied / pending, change nothing
+
+Needs a direct Postgres connection (Supabase: Project Settings -> Database
+-> Connection string) in DATABASE_URL, from the environment or
+.streamlit/secrets.toml, and the psycopg2 driver (pip install psycopg2-binary).
+
+The app itself only reads the schema: at startup it calls
+missing_indexes() and warns when an index the hot queries rely on is absent.
+"""
+
+import argparse
+import os
+import re
+import sys
+
+from settings import secret
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+SCHEMA_TABLE = 'schema_migrations'
+
+# Indexes every deployment needs: index name -> what it serves
+EXPECTED_INDEXES = {
+    'users_email_key': 'users by email (unique)',
+    'otp_codes_unused_idx': 'unused OTPs by email and code',
+    'otp_codes_expires_at_idx': 'OTP purge by expiry',
+    'payments_razorpay_payment_id_key': 'payments by Razorpay ID (unique)',
+    'payments_email_created_at_idx': 'payments already credited to an email',
+    'razorpay_payments_email_created_at_idx': 'synced Razorpay payments by email',
+    'generation_jobs_unfinished_idx': 'unfinished jobs resumed at startup',
+    'generation_jobs_group_id_idx': 'jobs of a bulk run',
+    'generation_jobs_provider_batch_id_idx': 'jobs of a Message Batches batch',
+    'generation_cache_model_created_at_idx': 'newest cache entries per model',
+    'llm_metrics_at_idx': 'telemetry rows by time',
+}
+
+_FILE_PATTERN = re.compile(r'^(\d+)_[\w-]+\.sql$')
+
+
+def migration_files(directory: str = MIGRATIONS_DIR) -> list:
+    """[(version, filename)] sorted by version."""
+    found = []
+    for name in os.listdir(directory):
+        match = _FILE_PATTERN.match(name)
+        if match:
+            found.append((int(match.group(1)), name))
+    found.sort()
+    versions = [version for version, _ in found]
+    if len(versions) != len(set(versions)):
+        raise ValueError(f"duplicate migration version in {directory}")
+    return found
+
+
+def missing_indexes(supabase) -> list:
+    """Names of EXPECTED_INDEXES absent from the database.
+
+    Uses the schema_index_names function from migration 002; when that is
+    not installed either, every expected index is reported missing.
+    """
+    try:
+        result = supabase.rpc('schema_index_names', {}).execute()
+        present = {row if isinstance(row, str) else next(iter(row.values())) for row in result.data or []}
+    except Exception:
+        present = set()
+    return [name for name in EXPECTED_INDEXES if name not in present]
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def applied_versions(conn) -> set:
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            create table if not exists {SCHEMA_TABLE} (
+                version integer primary key,
+                name text not null,
+                applied_at timestamptz not null default now()
+            )
+        """)
+        cur.execute(f"select version from {SCHEMA_TABLE}")
+        versions = {row[0] for row in cur.fetchall()}
+    conn.commit()
+    return versions
+
+
+def apply_migration(conn, version: int, name: str, directory: str = MIGRATIONS_DIR):
+    """Run one file and record it, all or nothing."""
+    with open(os.path.join(directory, name), encoding='utf-8') as f:
+        sql = f.read()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql)
+            cur.execute(f"insert into {SCHEMA_TABLE} (version, name) values (%s, %s)", (version, name))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--status', action='store_true', help='list migrations without applying any')
+    parser.add_argument('--dir', default=MIGRATIONS_DIR, help='migrations directory')
+    args = parser.parse_args()
+
+    try:
+        import psycopg2
+    except ImportError:
+        sys.exit('psycopg2 is not installed: pip install psycopg2-binary')
+    url = secret('DATABASE_URL')
+    if not url:
+        sys.exit('DATABASE_URL is not set')
+
+    conn = psycopg2.connect(url)
+    try:
+        done = applied_versions(conn)
+        for version, name in migration_files(args.dir):
+            if version in done:
+                print(f"[applied] {name}")
+            elif args.status:
+                print(f"[pending] {name}")
+            else:
+                print(f"[apply  ] {name}", flush=True)
+                try:
+                    apply_migration(conn, version, name, args.dir)
+                except Exception as e:
+                    sys.exit(f"{name} failed, nothing from it was applied: {e}")
+
+        with conn.cursor() as cur:
+            cur.execute("select indexname from pg_indexes where schemaname = 'public'")
+            present = {row[0] for row in cur.fetchall()}
+        missing = [name for name in EXPECTED_INDEXES if name not in present]
+        for name in missing:
+            print(f"missing index {name}: {EXPECTED_INDEXES[name]}")
+    finally:
+        conn.close()
+    sys.exit(1 if missing and not args.status else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+-- 001: atomic credit accounting
+--
+-- Each function is one UPDATE on the user's row, so concurrent queries from
+-- several tabs (or the web app and the bot) are serialized by the row lock
+-- instead of overwriting each other's absolute balances.
+--
+-- consume_query_credit: use one credit, free first, count the query and
+--     return the new balances plus which kind was used ('free' or 'paid').
+--     No row when the user is unknown or has no credit left. Call it before
+--     generating to reserve the credit.
+-- refund_query_credit: give back a credit taken by consume_query_credit
+--     (same kind) and uncount the query, e.g. when generation fails.
+
+create or replace function consume_query_credit(p_email text)
+returns table (free_credits integer, paid_credits integer, total_queries integer, credit text)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    return query
+    with target as (
+        select u.email, u.free_credits > 0 as use_free
+          from users u
+         where u.email = lower(trim(p_email))
+           and u.free_credits + u.paid_credits > 0
+           for update
+    )
+    update users u
+       set free_credits  = u.free_credits - case when t.use_free then 1 else 0 end,
+           paid_credits  = u.paid_credits - case when t.use_free then 0 else 1 end,
+           total_queries = coalesce(u.total_queries, 0) + 1,
+           last_query_at = now()
+      from target t
+     where u.email = t.email
+    returning u.free_credits, u.paid_credits, u.total_queries,
+              case when t.use_free then 'free' else 'paid' end;
+end;
+$$;
+
+create or replace function refund_query_credit(p_email text, p_credit text)
+returns table (free_credits integer, paid_credits integer, total_queries integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    return query
+    update users u
+       set free_credits  = u.free_credits + case when p_credit = 'free' then 1 else 0 end,
+           paid_credits  = u.paid_credits + case when p_credit = 'free' then 0 else 1 end,
+           total_queries = greatest(coalesce(u.total_queries, 0) - 1, 0)
+     where u.email = lower(trim(p_email))
+    returning u.free_credits, u.paid_credits, u.total_queries;
+end;
+$$;
@@ -0,0 +1,55 @@
+-- 002: users, otp_codes and payments, with the indexes their hot queries need
+--
+-- Every statement is idempotent, so this is safe on a database whose tables
+-- were created by hand. On such a database, creating a unique index fails if
+-- duplicates already exist. Find them first, e.g.
+--     select email, count(*) from users group by email having count(*) > 1;
+-- The index names match Postgres' default names for UNIQUE constraints, so
+-- an existing constraint already satisfies them.
+
+create table if not exists users (
+    id bigserial primary key,
+    email text not null,
+    free_credits integer not null default 0 check (free_credits >= 0),
+    paid_credits integer not null default 0 check (paid_credits >= 0),
+    total_queries integer not null default 0,
+    email_verified boolean not null default false,
+    last_query_at timestamptz,
+    created_at timestamptz not null default now()
+);
+-- get_user_by_email and every credit update
+create unique index if not exists users_email_key on users (email);
+
+create table if not exists otp_codes (
+    id bigserial primary key,
+    email text not null,
+    otp text not null,
+    expires_at timestamptz not null,
+    used boolean not null default false,
+    created_at timestamptz not null default now()
+);
+-- verify_otp looks up (email, otp) among unused codes only; used codes,
+-- which are nearly all rows, stay out of the index
+create index if not exists otp_codes_unused_idx on otp_codes (email, otp) where not used;
+
+create table if not exists payments (
+    id bigserial primary key,
+    razorpay_payment_id text not null,
+    email text not null,
+    amount integer,
+    status text not null default 'success',
+    created_at timestamptz not null default now()
+);
+-- is_payment_processed, and a payment can only ever be credited once
+create unique index if not exists payments_razorpay_payment_id_key on payments (razorpay_payment_id);
+
+-- Index names in the public schema, for the app's startup check
+create or replace function schema_index_names()
+returns setof text
+language sql
+stable
+security definer
+set search_path = public
+as $$
+    select indexname::text from pg_indexes where schemaname = 'public';
+$$;
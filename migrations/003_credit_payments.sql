@@ -0,0 +1,42 @@
+-- 003: record captured payments and add their credits in one transaction
+--
+-- credit_payments(p_email, p_payments) takes a JSON array of
+-- {"id": razorpay_payment_id, "credits": n, "amount": rupees}. Payments
+-- already in the payments table are skipped (unique index from 002), and
+-- only the credits of rows actually inserted are added to the user, who is
+-- created if needed. Calling it again with the same payments adds nothing.
+-- Returns the credits added and the user's balances.
+
+create or replace function credit_payments(p_email text, p_payments jsonb)
+returns table (credits_added integer, free_credits integer, paid_credits integer, total_queries integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+    v_email text := lower(trim(p_email));
+    v_added integer;
+begin
+    with inserted as (
+        insert into payments (razorpay_payment_id, email, amount, status)
+        select p->>'id', v_email, (p->>'amount')::integer, 'success'
+          from jsonb_array_elements(p_payments) p
+        on conflict (razorpay_payment_id) do nothing
+        returning razorpay_payment_id
+    )
+    select coalesce(sum((p->>'credits')::integer), 0) into v_added
+      from jsonb_array_elements(p_payments) p
+     where p->>'id' in (select razorpay_payment_id from inserted);
+
+    if v_added = 0 then
+        return query
+        select 0, u.free_credits, u.paid_credits, u.total_queries from users u where u.email = v_email;
+        return;
+    end if;
+
+    return query
+    insert into users as u (email, free_credits, paid_credits, total_queries, email_verified)
+    values (v_email, 0, v_added, 0, true)
+    on conflict (email) do update set paid_credits = u.paid_credits + excluded.paid_credits
+    returning v_added, u.free_credits, u.paid_credits, u.total_queries;
+end;
+$$;
@@ -0,0 +1,26 @@
+-- 004: keep otp_codes small
+--
+-- Codes are single-use and live 10 minutes, so every row older than that
+-- (or already used) is dead weight. purge_otp_codes deletes at most
+-- p_batch_size of them per call, keeping each transaction and its locks
+-- short; maintenance.py calls it until a batch comes back short.
+
+create index if not exists otp_codes_expires_at_idx on otp_codes (expires_at);
+
+create or replace function purge_otp_codes(p_batch_size integer default 5000)
+returns integer
+language plpgsql
+as $$
+declare
+    v_deleted integer;
+begin
+    delete from otp_codes
+     where id in (
+        select id from otp_codes
+         where expires_at < now() or used
+         limit p_batch_size
+     );
+    get diagnostics v_deleted = row_count;
+    return v_deleted;
+end;
+$$;
@@ -0,0 +1,17 @@
+-- 005: every successful generation, kept for the user to reopen or re-download
+--
+-- body is the zlib-compressed output (about a quarter of the text size);
+-- list queries never select it, so paging through history stays cheap.
+
+create table if not exists generation_history (
+    id bigserial primary key,
+    email text not null references users (email) on delete cascade,
+    topic text not null,
+    model text,
+    mode text,
+    chars integer not null,           -- uncompressed length, shown without fetching the body
+    body bytea not null,
+    created_at timestamptz not null default now()
+);
+-- "My history": newest first, keyset-paged on id
+create index if not exists generation_history_email_id_idx on generation_history (email, id desc);
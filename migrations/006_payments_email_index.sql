@@ -0,0 +1,6 @@
+-- 006: payments already credited to an email, newest first
+--
+-- The async login path (data_access.py) reads these alongside the user row
+-- and the Razorpay fetch, instead of looking payment IDs up afterwards.
+
+create index if not exists payments_email_created_at_idx on payments (email, created_at desc);
@@ -0,0 +1,73 @@
+-- 007: local index of Razorpay payments, filled incrementally by razorpay_sync.py
+--
+-- razorpay_payments holds one row per payment and email it carries (checkout
+-- email, notes email, email-like contact), so "this student's payments" is
+-- an index lookup rather than a scan of Razorpay's API. razorpay_sync_state
+-- keeps the sync's high-water mark: the newest payment's created_at (Razorpay
+-- unix seconds) and ID.
+
+create table if not exists razorpay_payments (
+    razorpay_payment_id text not null,
+    email text not null,
+    amount integer not null,
+    status text not null,
+    created_at bigint not null,
+    synced_at timestamptz not null default now(),
+    primary key (razorpay_payment_id, email)
+);
+
+create index if not exists razorpay_payments_email_created_at_idx on razorpay_payments (email, created_at desc);
+
+create table if not exists razorpay_sync_state (
+    name text primary key,
+    last_created_at bigint not null,
+    last_payment_id text not null,
+    updated_at timestamptz not null default now()
+);
+
+-- Upsert one page of payments ({"id", "email", "amount" (paise), "status",
+-- "created_at"}); a re-synced payment picks up its new status. When
+-- p_created_at is given the cursor moves to it, never backwards, so it is
+-- only advanced once a whole sync has been stored. Returns rows written.
+create or replace function sync_razorpay_payments(p_rows jsonb, p_created_at bigint default null,
+                                                  p_payment_id text default null)
+returns integer
+language plpgsql
+as $$
+#variable_conflict use_column
+declare
+    v_written integer;
+begin
+    insert into razorpay_payments as r (razorpay_payment_id, email, amount, status, created_at)
+    select p->>'id', lower(trim(p->>'email')), (p->>'amount')::integer, p->>'status', (p->>'created_at')::bigint
+      from jsonb_array_elements(p_rows) p
+    on conflict (razorpay_payment_id, email) do update
+       set status = excluded.status, amount = excluded.amount, synced_at = now();
+    get diagnostics v_written = row_count;
+
+    if p_created_at is not null then
+        insert into razorpay_sync_state as s (name, last_created_at, last_payment_id)
+        values ('payments', p_created_at, p_payment_id)
+        on conflict (name) do update
+           set last_created_at = excluded.last_created_at, last_payment_id = excluded.last_payment_id,
+               updated_at = now()
+         where (s.last_created_at, s.last_payment_id) < (excluded.last_created_at, excluded.last_payment_id);
+    end if;
+    return v_written;
+end;
+$$;
+
+-- The email's indexed payments since p_since that are not yet credited
+-- (absent from payments), in Razorpay's field names.
+create or replace function pending_razorpay_payments(p_email text, p_since bigint)
+returns table (id text, email text, amount integer, status text, created_at bigint)
+language sql
+stable
+as $$
+    select r.razorpay_payment_id, r.email, r.amount, r.status, r.created_at
+      from razorpay_payments r
+     where r.email = lower(trim(p_email))
+       and r.created_at >= p_since
+       and not exists (select 1 from payments p where p.razorpay_payment_id = r.razorpay_payment_id)
+     order by r.created_at desc;
+$$;
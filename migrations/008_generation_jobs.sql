@@ -0,0 +1,27 @@
+-- 008: background generation jobs (jobs.py)
+--
+-- One row per Generate click or bulk topic. The worker reserves a credit
+-- before generating (charged/credit) and refunds it if the job fails, so a
+-- refresh or disconnect never loses a result or a credit.
+
+create table if not exists generation_jobs (
+    id uuid primary key,
+    email text not null,
+    topic text not null,
+    status text not null default 'queued',   -- queued | running | done | failed
+    result text,
+    error text,
+    charged boolean not null default false,
+    credit text,                             -- 'free' or 'paid', the credit reserved
+    group_id text,                           -- bulk run the job belongs to
+    provider_batch_id text,                  -- Message Batches API batch, if any
+    created_at timestamptz default now(),
+    updated_at timestamptz default now()
+);
+-- Unfinished jobs resumed at startup
+create index if not exists generation_jobs_unfinished_idx on generation_jobs (created_at)
+    where status in ('queued', 'running');
+-- A bulk run's jobs, and a Message Batches batch's jobs
+create index if not exists generation_jobs_group_id_idx on generation_jobs (group_id) where group_id is not null;
+create index if not exists generation_jobs_provider_batch_id_idx on generation_jobs (provider_batch_id)
+    where provider_batch_id is not null;
@@ -0,0 +1,14 @@
+-- 009: shared cache of generated question sets (generation_cache.py)
+--
+-- Keyed on the normalized topic; rows past expires_at are ignored by reads.
+
+create table if not exists generation_cache (
+    topic_key text primary key,
+    topic text not null,
+    output text not null,
+    model text,
+    created_at timestamptz default now(),
+    expires_at timestamptz not null
+);
+-- Newest live entries per model, loaded into the near-match index at startup
+create index if not exists generation_cache_model_created_at_idx on generation_cache (model, created_at desc);
@@ -0,0 +1,22 @@
+-- 010: one telemetry row per generation request (telemetry.py)
+
+create table if not exists llm_metrics (
+    id bigserial primary key,
+    at timestamptz not null default now(),
+    source text,                -- interactive | bulk | warmup
+    model text,
+    mode text,                  -- single | fanout | structured
+    outcome text,               -- ok | coalesced | busy | error
+    cache_hit boolean not null default false,
+    queue_wait_ms integer,
+    ttft_ms integer,
+    latency_ms integer,
+    api_calls integer,
+    input_tokens integer,
+    output_tokens integer,
+    cache_read_tokens integer,
+    cache_write_tokens integer,
+    error text
+);
+-- Admin stats over the last N days
+create index if not exists llm_metrics_at_idx on llm_metrics (at);
@@ -0,0 +1,87 @@
+-- 011: credits reserved and refunded per generation job
+--
+-- refund_query_credit (001) added a credit for any caller, linked to no
+-- reservation, so a repeated error path could mint credits. Both sides now
+-- take the job's ID and move the credit and the job's charged flag in one
+-- statement:
+--
+-- reserve_query_credit: use one credit (free first) for a job that is not
+--     charged yet, count the query and mark the job charged with the kind
+--     used. No row when the job is already charged, or the user has no
+--     credit left.
+-- refund_query_credit: give the job's credit back, uncount the query and
+--     clear the job's charged flag, only while the job is still charged.
+--     No row otherwise, so each reservation is refunded at most once.
+
+drop function if exists refund_query_credit(text, text);
+
+create or replace function reserve_query_credit(p_job_id uuid)
+returns table (free_credits integer, paid_credits integer, total_queries integer, credit text)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    return query
+    with job as (
+        select j.id, lower(trim(j.email)) as email
+          from generation_jobs j
+         where j.id = p_job_id
+           and not j.charged
+           for update
+    ), target as (
+        select u.email, u.free_credits > 0 as use_free, job.id as job_id
+          from users u
+          join job on u.email = job.email
+         where u.free_credits + u.paid_credits > 0
+           for update of u
+    ), used as (
+        update users u
+           set free_credits  = u.free_credits - case when t.use_free then 1 else 0 end,
+               paid_credits  = u.paid_credits - case when t.use_free then 0 else 1 end,
+               total_queries = coalesce(u.total_queries, 0) + 1,
+               last_query_at = now()
+          from target t
+         where u.email = t.email
+        returning u.free_credits, u.paid_credits, u.total_queries,
+                  case when t.use_free then 'free' else 'paid' end as credit, t.job_id
+    ), marked as (
+        update generation_jobs j
+           set charged = true, credit = used.credit, updated_at = now()
+          from used
+         where j.id = used.job_id
+        returning j.id
+    )
+    select used.free_credits, used.paid_credits, used.total_queries, used.credit from used;
+end;
+$$;
+
+create or replace function refund_query_credit(p_job_id uuid)
+returns table (free_credits integer, paid_credits integer, total_queries integer)
+language plpgsql
+as $$
+#variable_conflict use_column
+begin
+    return query
+    with held as (
+        select j.id, lower(trim(j.email)) as email, j.credit as kind
+          from generation_jobs j
+         where j.id = p_job_id
+           and j.charged
+           and j.credit is not null
+           for update
+    ), job as (
+        update generation_jobs j
+           set charged = false, credit = null, updated_at = now()
+          from held
+         where j.id = held.id
+        returning held.email, held.kind
+    )
+    update users u
+       set free_credits  = u.free_credits + case when job.kind = 'free' then 1 else 0 end,
+           paid_credits  = u.paid_credits + case when job.kind = 'free' then 0 else 1 end,
+           total_queries = greatest(coalesce(u.total_queries, 0) - 1, 0)
+      from job
+     where u.email = job.email
+    returning u.free_credits, u.paid_credits, u.total_queries;
+end;
+$$;
@@ -0,0 +1,74 @@
+"""
+RAZORPAY PAYMENTS
+=================
+Matching Razorpay payments to a student's email and turning them into
+credits. Pure functions, shared by the blocking and async login paths
+and the webhook receiver (webhooks.py).
+"""
+
+PAYMENT_LOOKBACK_SECONDS = 172800   # credit payments from the last 48 hours
+CREDIT_PRICE_PAISE = 1200           # ₹12 per credit
+VALID_STATUSES = ('captured', 'authorized')
+
+
+def calculate_credits_from_amount(amount_paise: int) -> int:
+    """Calculate credits based on payment amount in paise. ₹12 = 1 credit."""
+    return max(0, amount_paise // CREDIT_PRICE_PAISE)
+
+
+def payment_emails(payment: dict) -> set:
+    """Every email a payment carries (Payment Pages store it in different fields)."""
+    return set(ordered_emails(payment))
+
+
+def ordered_emails(payment: dict) -> list:
+    """payment_emails in preference order: checkout email, then notes, then contact."""
+    # Some Payment Pages put the email in the notes or the contact field
+    notes = payment.get('notes') if isinstance(payment.get('notes'), dict) else {}
+    contact = str(payment.get('contact') or '')
+    emails = []
+    for value in (payment.get('email'), notes.get('email'), notes.get('Email'), contact if '@' in contact else None):
+        value = (value or '').lower().strip()
+        if value and value not in emails:
+            emails.append(value)
+    return emails
+
+
+def billing_email(payment: dict, known=()):
+    """The one email a pushed payment is credited to.
+
+    The first of ordered_emails that is in known (existing accounts), so a
+    student who typed another address at checkout is credited on the
+    account polling would find; a new address only when none is known.
+    """
+    emails = ordered_emails(payment)
+    for email in emails:
+        if email in known:
+            return email
+    return emails[0] if emails else None
+
+
+def credit_row(payment: dict):
+    """{'id', 'credits', 'amount'} for a paid payment worth at least one credit, else None.
+
+    The row shape credit_payments (migrations/003) expects.
+    """
+    if payment.get('status') not in VALID_STATUSES:
+        return None
+    credits = calculate_credits_from_amount(payment.get('amount', 0))
+    if credits <= 0:
+        return None
+    return {'id': payment['id'], 'credits': credits, 'amount': payment.get('amount', 0) // 100}
+
+
+def creditable_payments(payments: list, email: str) -> dict:
+    """{payment_id: credit_row(payment)} for the email's paid payments."""
+    email = email.lower().strip()
+    candidates = {}
+    for payment in payments:
+        if email not in payment_emails(payment):
+            continue
+        row = credit_row(payment)
+        if row:
+            candidates[payment['id']] = row
+    return candidates
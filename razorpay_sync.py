@@ -0,0 +1,292 @@
+"""
+RAZORPAY SYNC
+=============
+Keeps a local index of Razorpay payments (razorpay_payments, migration 007)
+so a student's credit check is one indexed lookup instead of downloading
+and scanning the last 48 hours of payments.
+
+Each sync reads the high-water mark (created_at and ID of the newest payment
+stored), asks Razorpay for everything since then, paging with skip until a
+short page, and upserts every payment under each email it carries. The
+mark only moves once the whole window is stored, so an interrupted sync
+just repeats. A few minutes before the mark are fetched again so late
+status changes (authorized -> captured) are picked up.
+
+In the app, RecentPayments holds the same 48-hour window in memory for every
+session in the process, indexed by email. It pages Razorpay the same way,
+forward from its own newest payment, and stores what it fetches in the
+index too. It refreshes at most once per RECENT_TTL_SECONDS, one refresh at
+a time with the rest waiting for it, so a crowd clicking Refresh Credits
+makes one Razorpay call, not one each. Sync can also run from cron, which
+keeps the index warm for other processes and for when Razorpay is down
+(a credit check only reads the index, it never syncs):
+
+    python razorpay_sync.py            # one sync
+    python razorpay_sync.py --status   # show the high-water mark
+
+Credentials come from the environment (RAZORPAY_KEY_ID, RAZORPAY_KEY_SECRET,
+SUPABASE_URL, SUPABASE_KEY, optional RAZORPAY_API_URL), falling back to
+.streamlit/secrets.toml.
+"""
+
+import argparse
+import sys
+import threading
+import time
+
+import requests
+
+from payments import PAYMENT_LOOKBACK_SECONDS, payment_emails
+from settings import secret
+
+RAZORPAY_API_URL = 'https://api.razorpay.com/v1'
+SYNC_PAGE_SIZE = 100          # Razorpay's largest page
+SYNC_OVERLAP_SECONDS = 600    # re-read before the mark for status changes
+SYNC_MAX_PAGES = 200
+SYNC_STATE = 'payments'
+RECENT_TTL_SECONDS = 15       # how stale the shared in-memory window may get
+MISS_COOLDOWN_SECONDS = 60    # an email not found forces a refresh at most this often
+
+
+def index_rows(payment: dict) -> list:
+    """razorpay_payments rows for one payment: one per email it carries."""
+    return [{'id': payment['id'], 'email': email, 'amount': payment.get('amount', 0),
+             'status': payment.get('status', ''), 'created_at': payment.get('created_at', 0)}
+            for email in sorted(payment_emails(payment))]
+
+
+class RazorpaySync:
+    """Incremental Razorpay -> razorpay_payments sync; see module docstring.
+
+    Thread-safe: concurrent syncs in one process run one at a time. Syncs
+    from several processes only repeat each other's upserts.
+    """
+
+    def __init__(self, supabase, auth: tuple, api_url: str = RAZORPAY_API_URL,
+                 page_size: int = SYNC_PAGE_SIZE, overlap: int = SYNC_OVERLAP_SECONDS, timeout: float = 15.0):
+        self.supabase = supabase
+        self.auth = auth
+        self.api_url = api_url.rstrip('/')
+        self.page_size = page_size
+        self.overlap = overlap
+        self.timeout = timeout
+        self._http = requests.Session()
+        self._lock = threading.Lock()
+
+    def cursor(self):
+        """(created_at, payment_id) of the newest stored payment, or None before the first sync."""
+        result = self.supabase.table('razorpay_sync_state').select('last_created_at,last_payment_id') \
+            .eq('name', SYNC_STATE).execute()
+        if not result.data:
+            return None
+        row = result.data[0]
+        return row['last_created_at'], row['last_payment_id']
+
+    def fetch_page(self, since: int, until: int, skip: int) -> list:
+        response = self._http.get(
+            f"{self.api_url}/payments", auth=self.auth, timeout=self.timeout,
+            params={'from': since, 'to': until, 'count': self.page_size, 'skip': skip},
+        )
+        response.raise_for_status()
+        return response.json().get('items', [])
+
+    def fetch_window(self, since: int, max_pages: int = SYNC_MAX_PAGES, on_page=None):
+        """Every payment created since `since`, paging with skip. Returns (payments, complete).
+
+        on_page(items) sees each page as it arrives. complete is False when
+        max_pages ran out before a short page.
+        """
+        # A fixed upper bound keeps skip offsets stable while new payments arrive
+        until = int(time.time())
+        payments = []
+        for page in range(max_pages):
+            items = self.fetch_page(since, until, page * self.page_size)
+            payments.extend(items)
+            if on_page:
+                on_page(items)
+            if len(items) < self.page_size:
+                return payments, True
+        return payments, False
+
+    def store(self, payments: list):
+        """Upsert payments into the index, leaving the mark alone."""
+        rows = [row for payment in payments for row in index_rows(payment)]
+        if rows:
+            self.supabase.rpc('sync_razorpay_payments', {'p_rows': rows}).execute()
+
+    def advance(self, payments: list, cursor=None):
+        """Move the mark to the newest of payments, if that is past cursor."""
+        newest = max(((p.get('created_at', 0), p['id']) for p in payments), default=None)
+        if newest and (cursor is None or newest > tuple(cursor)):
+            self.supabase.rpc('sync_razorpay_payments', {
+                'p_rows': [], 'p_created_at': newest[0], 'p_payment_id': newest[1],
+            }).execute()
+
+    def sync(self, max_pages: int = SYNC_MAX_PAGES) -> list:
+        """Fetch and store everything since the mark. Returns the payments fetched."""
+        with self._lock:
+            cursor = self.cursor()
+            since = cursor[0] - self.overlap if cursor else int(time.time()) - PAYMENT_LOOKBACK_SECONDS
+            payments, complete = self.fetch_window(since, max_pages, on_page=self.store)
+            # Window not exhausted: keep the old mark so the next sync covers the rest
+            if complete:
+                self.advance(payments, cursor)
+            return payments
+
+    def pending_payments(self, email: str) -> list:
+        """The email's uncredited payments from the lookback window, shaped like Razorpay's.
+
+        One indexed lookup, no sync: the index is kept current by cron and
+        by RecentPayments, off the request path. Raises if it cannot be read.
+        """
+        result = self.supabase.rpc('pending_razorpay_payments', {
+            'p_email': email.lower().strip(), 'p_since': int(time.time()) - PAYMENT_LOOKBACK_SECONDS,
+        }).execute()
+        return result.data or []
+
+
+class RecentPayments:
+    """Server-wide, TTL-cached email -> payments index of the lookback window.
+
+    Every email a payment carries (see payments.payment_emails) maps to it.
+    A stale window is refreshed single-flight: one caller fetches what is
+    new since the last refresh, concurrent callers wait and share the
+    result. An email with no payments in a fresh window forces one more
+    refresh, at most once per miss_cooldown per email, for a payment made
+    seconds ago; callers that find only already-credited payments can ask
+    for the same with refresh_for.
+    """
+
+    def __init__(self, sync: RazorpaySync, ttl: float = RECENT_TTL_SECONDS,
+                 miss_cooldown: float = MISS_COOLDOWN_SECONDS):
+        self.sync = sync
+        self.ttl = ttl
+        self.miss_cooldown = miss_cooldown
+        self._lock = threading.Lock()
+        self._payments = {}        # payment_id -> payment
+        self._by_email = {}        # email -> [payment]
+        self._newest = None        # (created_at, payment_id) of the newest payment held
+        self._refreshed_at = None  # monotonic time of the last good refresh
+        self._inflight = None      # threading.Event while a refresh runs
+        self._inflight_began = None
+        self._forced = {}          # email -> monotonic time of its last forced refresh
+
+    def refresh(self, newer_than: float = None):
+        """Bring the window up to date, or wait for the refresh already running.
+
+        newer_than (a time.monotonic() value) only accepts a refresh that
+        began after it; one already running from before is waited out first.
+        """
+        while True:
+            with self._lock:
+                inflight, began = self._inflight, self._inflight_began
+                if inflight is None:
+                    self._inflight, self._inflight_began = threading.Event(), time.monotonic()
+            if inflight is None:
+                break
+            inflight.wait(self.sync.timeout * 3)
+            if newer_than is None or began >= newer_than:
+                return
+        try:
+            self._refresh()
+        finally:
+            with self._lock:
+                done, self._inflight = self._inflight, None
+            done.set()
+
+    def _refresh(self):
+        now = int(time.time())
+        cutoff = now - PAYMENT_LOOKBACK_SECONDS
+        since = max(self._newest[0] - self.sync.overlap, cutoff) if self._newest else cutoff
+        fetched, complete = self.sync.fetch_window(since)
+        try:
+            self.sync.store(fetched)
+        except Exception:
+            pass  # the index table is optional here; memory still gets the payments
+        payments = {pid: p for pid, p in self._payments.items() if p.get('created_at', 0) >= cutoff}
+        payments.update((p['id'], p) for p in fetched)
+        by_email = {}
+        for payment in payments.values():
+            for email in payment_emails(payment):
+                by_email.setdefault(email, []).append(payment)
+        newest = max(((p.get('created_at', 0), p['id']) for p in fetched), default=None)
+        with self._lock:
+            self._payments, self._by_email = payments, by_email
+            if complete and newest and (self._newest is None or newest > self._newest):
+                self._newest = newest
+            self._refreshed_at = time.monotonic()
+
+    def payments_for(self, email: str) -> list:
+        """Payments from the lookback window that carry this email.
+
+        An email with none gets one forced refresh (see refresh_for).
+        Raises only if the window has never loaded.
+        """
+        email = email.lower().strip()
+        started = time.monotonic()
+        if self._refreshed_at is None or started - self._refreshed_at > self.ttl:
+            self._refresh_quietly()
+        found = self._by_email.get(email)
+        if not found:
+            found = self.refresh_for(email, started)
+        if self._refreshed_at is None:
+            raise RuntimeError("recent Razorpay payments are unavailable")
+        return list(found or [])
+
+    def refresh_for(self, email: str, since: float = None):
+        """Force a refresh on behalf of email, at most once per miss_cooldown.
+
+        For a payment the window cannot have seen yet: none for this email
+        (payments_for), or none that is not already credited (the caller).
+        Skipped if a refresh finished after since (default: now). Returns
+        the email's payments after it, or None when skipped.
+        """
+        email = email.lower().strip()
+        since = time.monotonic() if since is None else since
+        if self._refreshed_at is not None and self._refreshed_at > since:
+            return None
+        with self._lock:
+            forced_at = self._forced.get(email)
+            if forced_at is not None and since - forced_at < self.miss_cooldown:
+                return None
+            self._forced = {e: t for e, t in self._forced.items() if since - t < self.miss_cooldown}
+            self._forced[email] = since
+        self._refresh_quietly(newer_than=since)
+        return list(self._by_email.get(email) or [])
+
+    def _refresh_quietly(self, newer_than: float = None):
+        # A failed refresh keeps serving the last window
+        try:
+            self.refresh(newer_than)
+        except Exception:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--status', action='store_true', help='show the high-water mark, sync nothing')
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    url, key = secret('SUPABASE_URL'), secret('SUPABASE_KEY')
+    key_id, key_secret = secret('RAZORPAY_KEY_ID'), secret('RAZORPAY_KEY_SECRET')
+    if not (url and key):
+        sys.exit('SUPABASE_URL / SUPABASE_KEY are not set')
+    if not (key_id and key_secret):
+        sys.exit('RAZORPAY_KEY_ID / RAZORPAY_KEY_SECRET are not set')
+
+    engine = RazorpaySync(create_client(url, key), (key_id, key_secret),
+                          api_url=secret('RAZORPAY_API_URL') or RAZORPAY_API_URL)
+    try:
+        if not args.status:
+            started = time.perf_counter()
+            fetched = len(engine.sync())
+            print(f"synced {fetched} payment(s) in {time.perf_counter() - started:.1f}s")
+        print(f"high-water mark: {engine.cursor()}")
+    except Exception as e:
+        sys.exit(f"sync failed: {e}")
+
+
+if __name__ == '__main__':
+    main()
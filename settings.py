@@ -0,0 +1,20 @@
+"""
+SETTINGS
+========
+Credentials for the command-line tools (migrate.py, maintenance.py,
+warmup.py, webhooks.py, razorpay_sync.py), which run outside Streamlit.
+"""
+
+import os
+
+
+def secret(name: str):
+    """Environment variable, else the app's Streamlit secrets file (.streamlit/secrets.toml)."""
+    value = os.environ.get(name)
+    if value:
+        return value
+    try:
+        import streamlit as st
+        return st.secrets.get(name)
+    except Exception:
+        return None
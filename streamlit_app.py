@@ -13,17 +13,49 @@ STREAMLIT SECRETS:
     RAZORPAY_KEY_ID = "rzp_live_xxxxx"
     RAZORPAY_KEY_SECRET = "xxxxxxxxxxxxx"
     RAZORPAY_PAYMENT_URL = "https://rzp.io/rzp/xxxxx"
+    ADMIN_EMAILS = "you@gmail.com, partner@gmail.com"   # optional, sees server stats
+    GENERATION_MODE = "single"                          # optional, "fanout" or "structured"
+    RAZORPAY_API_URL = "https://api.razorpay.com/v1"    # optional, e.g. local fakes for benchmarks
+    RESEND_API_URL = "https://api.resend.com"           # optional, e.g. local fakes for benchmarks
+    ASYNC_IO = "on"                                     # optional, "off" makes login calls one by one
+    PAYMENT_WEBHOOKS = "off"                            # optional, "on" once webhooks.py receives Razorpay events
+
+DATABASE:
+    python migrate.py    # applies migrations/*.sql; needs DATABASE_URL
+
+PAYMENTS:
+    python webhooks.py   # credits payment.captured events as Razorpay sends them
+    python razorpay_sync.py   # from cron: keeps the local payment index warm
 """
 
 import streamlit as st
-import anthropic
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import requests
 import random
 import os
+import sys
 import time
+import uuid
 from datetime import datetime, timedelta
 from supabase import create_client
 
+from generation import (
+    ANTHROPIC_MAX_RETRIES, CLAUDE_MODEL, GENERATION_MODES, ConnectionStats, LLMBusyError, LLMLimiter,
+    PromptCacheStats, build_anthropic_client,
+)
+from generation_cache import GenerationCache, SingleFlight
+from jobs import DONE, FAILED, FINISHED, JobRunner, JobStore
+from warmup import CacheWarmer
+from history import HistoryStore
+from payments import creditable_payments
+from data_access import DataAccess
+from razorpay_sync import RazorpaySync, RecentPayments
+from migrate import EXPECTED_INDEXES, missing_indexes
+from telemetry import BUSY, COALESCED, ERROR, OK, CallTrace, MetricsWriter, bucketize, summarize, within
+from batch import (
+    MAX_BULK_TOPICS, MessageBatchRunner, build_results_zip, parse_topics, results_zip_name,
+)
+
 # =============================================================================
 # PAGE CONFIG
 # =============================================================================
@@ -51,6 +83,49 @@ def get_supabase_client():
 supabase = get_supabase_client()
 
 
+@st.cache_resource
+def get_missing_indexes():
+    """Expected indexes absent from the database; checked once per server process."""
+    if not supabase:
+        return []
+    missing = missing_indexes(supabase)
+    if missing:
+        print(f"WARNING: database indexes missing: {', '.join(missing)}. Run python migrate.py.", file=sys.stderr)
+    return missing
+
+get_missing_indexes()
+
+
+# =============================================================================
+# ANTHROPIC CLIENT
+# =============================================================================
+
+def get_anthropic_api_key():
+    """Resolve the Anthropic key from secrets, falling back to the environment."""
+    try:
+        return st.secrets["ANTHROPIC_API_KEY"]
+    except (KeyError, FileNotFoundError):
+        return os.environ.get("ANTHROPIC_API_KEY")
+
+
+@st.cache_resource
+def get_anthropic_client():
+    """Process-wide Anthropic client with a keep-alive pool.
+
+    Generation calls retry in get_llm_limiter(), so the SDK does not retry.
+    """
+    api_key = get_anthropic_api_key()
+    if not api_key:
+        return None
+    return build_anthropic_client(api_key, get_anthropic_connection_stats(), max_retries=0)
+
+
+@st.cache_resource
+def get_anthropic_connection_stats():
+    """Shared connection counters for the pooled Anthropic client."""
+    return ConnectionStats()
+
+
 # =============================================================================
 # ANTI-ABUSE: EMAIL WHITELIST (STRICT)
 # =============================================================================
@@ -137,11 +212,39 @@ st.markdown("""
 # EMAIL / OTP FUNCTIONS
 # =============================================================================
 
+def service_url(name: str, default: str) -> str:
+    """Base URL of an external API, overridable in secrets (benchmarks use local fakes)."""
+    try:
+        return st.secrets.get(name, default).rstrip('/')
+    except Exception:
+        return default
+
+
 def generate_otp():
     """Generate 6-digit OTP."""
     return str(random.randint(100000, 999999))
 
 
+def otp_email_message(email: str, otp: str) -> dict:
+    """Resend message carrying the OTP."""
+    return {
+        "from": "UPSC Predictor <noreply@upscpredictor.in>",
+        "to": email,
+        "subject": "Your OTP for UPSC Predictor",
+        "html": f"""
+                <div style="font-family: Arial, sans-serif; max-width: 480px; margin: 0 auto;">
+                    <h2 style="color: #1e293b;">UPSC Predictor</h2>
+                    <p>Your verification code is:</p>
+                    <div style="background: #f0f9ff; border: 2px solid #38bdf8; border-radius: 8px; padding: 20px; text-align: center; margin: 20px 0;">
+                        <span style="font-size: 32px; font-weight: bold; letter-spacing: 8px; color: #0369a1;">{otp}</span>
+                    </div>
+                    <p style="color: #64748b; font-size: 14px;">This code expires in 10 minutes.</p>
+                    <p style="color: #64748b; font-size: 14px;">If you didn't request this, please ignore this email.</p>
+                </div>
+                """
+    }
+
+
 def send_otp_email(email: str, otp: str) -> bool:
     """Send OTP via Resend."""
     try:
@@ -151,27 +254,12 @@ def send_otp_email(email: str, otp: str) -> bool:
             return False
         
         response = requests.post(
-            "https://api.resend.com/emails",
+            f"{service_url('RESEND_API_URL', 'https://api.resend.com')}/emails",
             headers={
                 "Authorization": f"Bearer {api_key}",
                 "Content-Type": "application/json"
             },
-            json={
-                "from": "UPSC Predictor <noreply@upscpredictor.in>",
-                "to": email,
-                "subject": "Your OTP for UPSC Predictor",
-                "html": f"""
-                <div style="font-family: Arial, sans-serif; max-width: 480px; margin: 0 auto;">
-                    <h2 style="color: #1e293b;">UPSC Predictor</h2>
-                    <p>Your verification code is:</p>
-                    <div style="background: #f0f9ff; border: 2px solid #38bdf8; border-radius: 8px; padding: 20px; text-align: center; margin: 20px 0;">
-                        <span style="font-size: 32px; font-weight: bold; letter-spacing: 8px; color: #0369a1;">{otp}</span>
-                    </div>
-                    <p style="color: #64748b; font-size: 14px;">This code expires in 10 minutes.</p>
-                    <p style="color: #64748b; font-size: 14px;">If you didn't request this, please ignore this email.</p>
-                </div>
-                """
-            }
+            json=otp_email_message(email, otp)
         )
         
         if response.status_code != 200:
@@ -201,25 +289,16 @@ def save_otp(email: str, otp: str) -> bool:
 
 
 def verify_otp(email: str, otp: str) -> bool:
-    """Verify OTP from database."""
+    """Consume an OTP: mark it used only if it is unused and unexpired, in one round trip."""
     if not supabase:
         return False
     try:
         email = email.lower().strip()
-        result = supabase.table('otp_codes').select('*').eq('email', email).eq('otp', otp).eq('used', False).execute()
-        
-        if not result.data:
-            return False
-        
-        otp_record = result.data[0]
-        expires_at = datetime.fromisoformat(otp_record['expires_at'].replace('Z', '+00:00'))
-        
-        if datetime.now(expires_at.tzinfo) > expires_at:
-            return False
-        
-        # Mark OTP as used
-        supabase.table('otp_codes').update({'used': True}).eq('id', otp_record['id']).execute()
-        return True
+        result = (supabase.table('otp_codes').update({'used': True})
+                  .eq('email', email).eq('otp', otp).eq('used', False)
+                  .gt('expires_at', datetime.utcnow().isoformat())
+                  .execute())
+        return bool(result.data)
     except Exception:
         return False
 
@@ -228,16 +307,68 @@ def verify_otp(email: str, otp: str) -> bool:
 # USER FUNCTIONS
 # =============================================================================
 
-def get_user_by_email(email: str):
-    """Get user by email."""
+def is_admin(email: str) -> bool:
+    """Check if email is listed in the ADMIN_EMAILS secret."""
+    if not email:
+        return False
+    try:
+        admins = st.secrets.get("ADMIN_EMAILS", "")
+        return email.lower().strip() in {a.lower().strip() for a in admins.split(',') if a.strip()}
+    except Exception:
+        return False
+
+
+USER_FIELDS = ('email', 'free_credits', 'paid_credits', 'total_queries')
+USER_CACHE_TTL = 30  # seconds a session reuses a user record it read or wrote
+
+
+def _user_cache():
+    """This session's {email: (cached_at, user)}; None off the script thread (job workers)."""
+    if get_script_run_ctx(suppress_warning=True) is None:
+        return None
+    return st.session_state.setdefault('user_cache', {})
+
+
+def remember_user(email: str, row: dict):
+    """Cache the user record a read or write returned (projected to USER_FIELDS)."""
+    cache = _user_cache()
+    if cache is None:
+        return None
+    user = {field: row.get(field) for field in USER_FIELDS}
+    cache[email.lower().strip()] = (time.monotonic(), user)
+    return user
+
+
+def forget_user(email: str):
+    """Drop the session's cached record after a write that did not return one."""
+    cache = _user_cache()
+    if cache is not None:
+        cache.pop(email.lower().strip(), None)
+
+
+def get_user_by_email(email: str, fresh: bool = False):
+    """Get user by email.
+
+    Served from the session cache for USER_CACHE_TTL seconds; fresh=True
+    forces a read, for balances that background jobs may have changed.
+    """
     if not supabase:
         return None
+    email = email.lower().strip()
+    cache = _user_cache()
+    if not fresh and cache is not None:
+        cached = cache.get(email)
+        if cached and time.monotonic() - cached[0] < USER_CACHE_TTL:
+            return dict(cached[1])
     try:
-        email = email.lower().strip()
-        result = supabase.table('users').select('*').eq('email', email).execute()
-        return result.data[0] if result.data else None
+        result = supabase.table('users').select(','.join(USER_FIELDS)).eq('email', email).execute()
     except Exception:
         return None
+    if not result.data:
+        forget_user(email)
+        return None
+    remember_user(email, result.data[0])
+    return result.data[0]
 
 
 def create_user(email: str):
@@ -253,158 +384,195 @@ def create_user(email: str):
             'total_queries': 0,
             'email_verified': True
         }).execute()
-        return result.data[0] if result.data else None
     except Exception:
+        forget_user(email)
+        return None
+    if not result.data:
+        forget_user(email)
         return None
+    remember_user(email, result.data[0])
+    return result.data[0]
+
+
+def sync_session_credits(user: dict):
+    """Copy credit counters from a user record into the session."""
+    st.session_state.free_credits = user.get('free_credits', 0)
+    st.session_state.paid_credits = user.get('paid_credits', 0)
+    st.session_state.total_queries = user.get('total_queries', 0)
 
 
-def update_user_credits(email: str, free_credits: int, paid_credits: int, total_queries: int = None):
-    """Update user credits."""
+def consume_query_credit(email: str):
+    """Use one credit (free first) and count the query in one atomic database call.
+
+    Runs consume_query_credit from migrations/001_credit_functions.sql.
+    Returns the new balances plus 'credit' ('free' or 'paid'), or None
+    when no credit is left.
+    """
     if not supabase:
-        return False
+        return None
+    forget_user(email)
     try:
-        email = email.lower().strip()
-        update_data = {'free_credits': free_credits, 'paid_credits': paid_credits}
-        if total_queries is not None:
-            update_data['total_queries'] = total_queries
-            update_data['last_query_at'] = datetime.utcnow().isoformat()
-        supabase.table('users').update(update_data).eq('email', email).execute()
-        return True
+        result = supabase.rpc('consume_query_credit', {'p_email': email.lower().strip()}).execute()
+        return result.data[0] if result.data else None
     except Exception:
-        return False
+        return None
 
 
-def add_paid_credits(email: str, credits_to_add: int = 1):
-    """Add paid credits to user."""
-    email = email.lower().strip()
-    user = get_user_by_email(email)
-    
-    if user:
-        new_paid = user.get('paid_credits', 0) + credits_to_add
-        new_free = user.get('free_credits', 0)
-        update_user_credits(email, new_free, new_paid)
-        return new_paid
-    else:
-        # Create user with paid credit (no free credit since they paid first)
-        if not supabase:
-            return 0
-        try:
-            supabase.table('users').insert({
-                'email': email,
-                'free_credits': 0,
-                'paid_credits': credits_to_add,
-                'total_queries': 0,
-                'email_verified': True
-            }).execute()
-            return credits_to_add
-        except Exception:
-            return 0
+def reserve_query_credit(job: dict):
+    """Take a credit for a job and mark the job charged, atomically.
+
+    Runs reserve_query_credit from migrations/011_job_credits.sql. Returns
+    the credit's kind, or None when there is no credit (or the job already
+    holds one). Raises if the call fails.
+    """
+    if not supabase:
+        return None
+    forget_user(job['email'])
+    result = supabase.rpc('reserve_query_credit', {'p_job_id': job['id']}).execute()
+    return result.data[0]['credit'] if result.data else None
+
+
+def refund_query_credit(job: dict):
+    """Give back the job's credit if it still holds one. Returns the new balances, or None.
+
+    Raises if the call fails, so JobRunner can retry it.
+    """
+    if not supabase:
+        return None
+    forget_user(job['email'])
+    result = supabase.rpc('refund_query_credit', {'p_job_id': job['id']}).execute()
+    return result.data[0] if result.data else None
 
 
 # =============================================================================
 # PAYMENT FUNCTIONS
 # =============================================================================
 
+def processed_payment_ids(payment_ids: list) -> set:
+    """Which of these Razorpay payment IDs are already recorded, in one query."""
+    if not supabase or not payment_ids:
+        return set()
+    try:
+        result = supabase.table('payments').select('razorpay_payment_id').in_('razorpay_payment_id', payment_ids).execute()
+        return {row['razorpay_payment_id'] for row in result.data or []}
+    except Exception:
+        return set()
+
+
 def is_payment_processed(payment_id: str) -> bool:
     """Check if payment already processed."""
-    if not supabase:
-        return payment_id in st.session_state.get('processed_payments', set())
+    return payment_id in processed_payment_ids([payment_id])
+
+
+def credit_payments(email: str, payments: list) -> int:
+    """Record payments and add their credits in one transaction. Returns credits added.
+
+    payments: [{'id': razorpay_payment_id, 'credits': n, 'amount': rupees}].
+    Runs credit_payments from migrations/003_credit_payments.sql, which
+    skips payments already recorded, so a repeated or concurrent call for
+    the same payment never credits it twice.
+    """
+    if not supabase or not payments:
+        return 0
+    email = email.lower().strip()
     try:
-        result = supabase.table('payments').select('razorpay_payment_id').eq('razorpay_payment_id', payment_id).execute()
-        return len(result.data) > 0
+        result = supabase.rpc('credit_payments', {'p_email': email, 'p_payments': payments}).execute()
     except Exception:
-        return False
+        forget_user(email)
+        return 0
+    if not result.data:
+        return 0
+    row = result.data[0]
+    remember_user(email, dict(row, email=email))
+    return row['credits_added']
 
 
-def record_payment(payment_id: str, email: str, amount: int = 12):
-    """Record payment in database."""
+@st.cache_resource
+def get_payment_sync():
+    """Incremental Razorpay sync into the local payment index (migration 007); None without Razorpay keys."""
     if not supabase:
-        st.session_state.setdefault('processed_payments', set()).add(payment_id)
-        return True
+        return None
     try:
-        supabase.table('payments').insert({
-            'razorpay_payment_id': payment_id,
-            'email': email.lower().strip(),
-            'amount': amount,
-            'status': 'success'
-        }).execute()
-        return True
-    except Exception:
-        return False
+        auth = (st.secrets["RAZORPAY_KEY_ID"], st.secrets["RAZORPAY_KEY_SECRET"])
+    except (KeyError, FileNotFoundError):
+        return None
+    return RazorpaySync(supabase, auth, api_url=service_url('RAZORPAY_API_URL', 'https://api.razorpay.com/v1'))
 
 
-def calculate_credits_from_amount(amount_paise: int) -> int:
-    """Calculate credits based on payment amount in paise. ₹12 = 1 credit."""
-    # ₹12 per credit = 1200 paise per credit
-    # Add small tolerance for payment gateway rounding
-    credits = amount_paise // 1200
-    return max(0, credits)
+@st.cache_resource
+def get_recent_payments():
+    """The process-wide, TTL-cached email -> payments window; None without Razorpay keys."""
+    payment_sync = get_payment_sync()
+    return RecentPayments(payment_sync) if payment_sync else None
 
 
 def check_and_credit_pending_payments(email: str) -> int:
-    """Check Razorpay for recent payments by email and credit if not processed."""
+    """Credit the email's uncredited recent payments. Returns credits added.
+
+    Looks the email up in the shared in-memory window of recent payments;
+    only a payment found there costs a database lookup, and when all of
+    them are credited already the window is refreshed once for this email
+    (rate-limited in RecentPayments). If the window cannot load (Razorpay
+    down), falls back to the synced payment index.
+    """
+    started = time.monotonic()
+    recent = get_recent_payments()
     try:
-        key_id = st.secrets["RAZORPAY_KEY_ID"]
-        key_secret = st.secrets["RAZORPAY_KEY_SECRET"]
-        
-        # Fetch recent payments from Razorpay (last 48 hours for safety)
-        from_timestamp = int(time.time()) - 172800  # 48 hours ago
-        
-        response = requests.get(
-            f"https://api.razorpay.com/v1/payments",
-            auth=(key_id, key_secret),
-            params={
-                'from': from_timestamp,
-                'count': 100
-            }
-        )
-        
-        if response.status_code != 200:
+        candidates = creditable_payments(recent.payments_for(email), email) if recent else None
+    except Exception:
+        candidates = None
+    if candidates is None:
+        payment_sync = get_payment_sync()
+        if payment_sync is None:
             return 0
-        
-        payments = response.json().get('items', [])
-        credits_added = 0
-        email_lower = email.lower().strip()
-        
-        for payment in payments:
-            # Get email from ALL possible fields (Payment Pages store differently)
-            payment_email = (payment.get('email') or '').lower().strip()
-            notes = payment.get('notes') or {}
-            notes_email = (notes.get('email') or notes.get('Email') or '').lower().strip()
-            
-            # Also check contact field (some Payment Pages use this)
-            contact_email = ''
-            if payment.get('contact') and '@' in str(payment.get('contact', '')):
-                contact_email = payment.get('contact', '').lower().strip()
-            
-            # Check any email field matches
-            email_matches = (
-                payment_email == email_lower or 
-                notes_email == email_lower or
-                contact_email == email_lower
-            )
-            
-            payment_id = payment.get('id', '')
-            status = payment.get('status', '')
-            amount_paise = payment.get('amount', 0)
-            
-            # Accept both 'captured' and 'authorized' status
-            valid_status = status in ['captured', 'authorized']
-            
-            if email_matches and valid_status:
-                # Check if already processed
-                if not is_payment_processed(payment_id):
-                    # Calculate credits based on amount
-                    credits_to_add = calculate_credits_from_amount(amount_paise)
-                    if credits_to_add > 0:
-                        # Record and credit
-                        if record_payment(payment_id, email):
-                            add_paid_credits(email, credits_to_add)
-                            credits_added += credits_to_add
-        
-        return credits_added
+        try:
+            pending = payment_sync.pending_payments(email)
+        except Exception:
+            return 0
+        return credit_payments(email, list(creditable_payments(pending, email).values()))
+    processed = processed_payment_ids(list(candidates)) if candidates else set()
+    if len(processed) == len(candidates):
+        # Nothing new in the window: maybe a payment made since it was loaded
+        refreshed = creditable_payments(recent.refresh_for(email, started) or [], email)
+        candidates = {pid: payment for pid, payment in refreshed.items() if pid not in candidates}
+        if not candidates:
+            return 0
+        processed = processed_payment_ids(list(candidates))
+    new_payments = [payment for payment_id, payment in candidates.items() if payment_id not in processed]
+    return credit_payments(email, new_payments)
+
+
+PAYMENT_POLL_COOLDOWN = 30  # seconds between Razorpay polls per session once webhooks are on
+
+
+def payment_webhooks_enabled() -> bool:
+    """Whether webhooks.py credits payments as they are captured (PAYMENT_WEBHOOKS = "on")."""
+    try:
+        return str(st.secrets.get("PAYMENT_WEBHOOKS", "off")).lower() == "on"
     except Exception:
+        return False
+
+
+def refresh_credits(email: str) -> int:
+    """Refresh Credits: credits added since the session's balance was read.
+
+    With webhooks on, payments are usually credited already and re-reading
+    the balance is enough; Razorpay is polled only when nothing new shows
+    up, at most once per PAYMENT_POLL_COOLDOWN, in case a webhook is late
+    or lost. Without webhooks, polls every time.
+    """
+    if not payment_webhooks_enabled():
+        return check_and_credit_pending_payments(email)
+    user = get_user_by_email(email, fresh=True)
+    if user:
+        added = user.get('paid_credits', 0) - st.session_state.paid_credits
+        if added > 0:
+            return added
+    last_poll = st.session_state.get('last_payment_poll', 0.0)
+    if time.monotonic() - last_poll < PAYMENT_POLL_COOLDOWN:
         return 0
+    st.session_state.last_payment_poll = time.monotonic()
+    return check_and_credit_pending_payments(email)
 
 
 def fetch_email_from_payment(payment_id: str) -> str:
@@ -414,7 +582,7 @@ def fetch_email_from_payment(payment_id: str) -> str:
         key_secret = st.secrets["RAZORPAY_KEY_SECRET"]
         
         response = requests.get(
-            f"https://api.razorpay.com/v1/payments/{payment_id}",
+            f"{service_url('RAZORPAY_API_URL', 'https://api.razorpay.com/v1')}/payments/{payment_id}",
             auth=(key_id, key_secret)
         )
         
@@ -427,6 +595,67 @@ def fetch_email_from_payment(payment_id: str) -> str:
         return None
 
 
+# =============================================================================
+# CONCURRENT LOGIN I/O
+# =============================================================================
+
+@st.cache_resource
+def get_data_access():
+    """Async data layer for login paths; None (ASYNC_IO = "off") uses the blocking calls."""
+    if not supabase or str(st.secrets.get("ASYNC_IO", "on")).lower() == "off":
+        return None
+    return DataAccess(
+        st.secrets["SUPABASE_URL"], st.secrets["SUPABASE_KEY"],
+        resend_key=st.secrets.get("RESEND_API_KEY"),
+        resend_url=service_url('RESEND_API_URL', 'https://api.resend.com'),
+        user_fields=USER_FIELDS,
+        recent_payments=get_recent_payments(),
+    )
+
+
+def settle_login(email: str):
+    """Credit new payments and load the user: (user or None, credits added).
+
+    The user read and the Razorpay fetch run concurrently. With webhooks on,
+    a user who already has credits is just read; Razorpay is only polled
+    for a missing user or an empty balance, where a just-made payment
+    matters.
+    """
+    email = email.lower().strip()
+    if payment_webhooks_enabled():
+        user = get_user_by_email(email, fresh=True)
+        if user and user.get('free_credits', 0) + user.get('paid_credits', 0) > 0:
+            return user, 0
+    data = get_data_access()
+    if data is None:
+        pending = check_and_credit_pending_payments(email)
+        return get_user_by_email(email), pending
+    try:
+        user, pending = data.login(email)
+    except Exception:
+        return None, 0
+    if user:
+        remember_user(email, user)
+    else:
+        forget_user(email)
+    return user, pending
+
+
+def send_login_otp(email: str, otp: str) -> bool:
+    """Store an OTP, then email it."""
+    data = get_data_access()
+    if data is None:
+        return save_otp(email, otp) and send_otp_email(email, otp)
+    try:
+        error = data.send_otp(email, otp, otp_email_message(email, otp))
+    except Exception as e:
+        error = str(e)
+    if error:
+        st.error(f"Email error: {error}")
+        return False
+    return True
+
+
 def process_razorpay_return():
     """Process Razorpay redirect after payment - auto-login user."""
     params = st.query_params
@@ -458,8 +687,7 @@ def process_razorpay_return():
         return False
     
     # Record payment and add credit
-    if record_payment(payment_id, email):
-        add_paid_credits(email, 1)
+    if credit_payments(email, [{'id': payment_id, 'credits': 1, 'amount': 12}]):
         user = get_user_by_email(email)
         
         if user:
@@ -491,11 +719,8 @@ def process_return_email():
         st.query_params.clear()
         return False
     
-    # Check for pending payments and credit them
-    pending = check_and_credit_pending_payments(email)
-    
-    # Get user (may have been created by check_and_credit_pending_payments)
-    user = get_user_by_email(email)
+    # Credit pending payments and get the user (may have been created by a payment)
+    user, pending = settle_login(email)
     
     if user:
         st.session_state.email = email
@@ -519,146 +744,175 @@ def process_return_email():
 # QUESTION GENERATION
 # =============================================================================
 
-def generate_questions(topic):
-    """Generate 10 UPSC questions using Claude API."""
-    
-    api_key = None
-    try:
-        api_key = st.secrets["ANTHROPIC_API_KEY"]
-    except (KeyError, FileNotFoundError):
-        api_key = os.environ.get("ANTHROPIC_API_KEY")
-    
-    if not api_key:
-        st.error("⚠️ API not configured. Contact support.")
-        return None
-    
-    client = anthropic.Anthropic(api_key=api_key)
-    
-    system_prompt = """You are an expert UPSC question setter. Generate 10 practice questions from the given topic.
+JOB_POLL_INTERVAL = 0.5  # seconds between job status checks while generating
 
-CRITICAL REQUIREMENT — 5+5 SPLIT:
-• 5 questions from PRIMARY SUBJECT (the obvious angle)
-• 5 questions from CROSS-SUBJECT ANGLES (History, Geography, Economy, Ethics, Environment — whichever connects)
 
-DISTRIBUTE AS:
-- MCQ 1-3: Primary Subject
-- MCQ 4-5: Cross-Subject Angles (DIFFERENT subjects)
-- MAINS 1-2: Primary Subject
-- MAINS 3-5: Cross-Subject Angles (include Ethics case study)
+@st.cache_resource
+def get_prompt_cache_stats():
+    """Shared prompt cache counters for all sessions."""
+    return PromptCacheStats()
 
-FORMAT:
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📌 TOPIC ANALYSIS
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+TOPIC_SIMILARITY_THRESHOLD = 0.8  # Jaccard score at which a reworded topic reuses a cached result
 
-**Topic:** [News item]
-**Primary Subject:** [GS-I/II/III/IV] — [Subject name]
 
-**Cross-Subject Angles:**
-• [Angle 1] — [Different GS Paper] — [Connection]
-• [Angle 2] — [Different GS Paper] — [Connection]
-• [Angle 3] — [Different GS Paper] — [Connection]
+@st.cache_resource
+def get_generation_cache():
+    """Shared result cache: in-process LRU in front of the Supabase table."""
+    cache = GenerationCache(supabase, model=CLAUDE_MODEL, similarity_threshold=TOPIC_SIMILARITY_THRESHOLD)
+    cache.rebuild_index()
+    return cache
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📝 SECTION A: PRIMARY MCQs (Q1-Q3)
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-**Q1** | [Primary Subject] | PRIMARY
+def render_output_box(placeholder, output: str):
+    """Render generated questions into the output box."""
+    placeholder.markdown(f'<div class="output-box"><pre style="white-space:pre-wrap; font-family:system-ui,-apple-system,sans-serif; font-size:0.9rem; line-height:1.7; color:#1e293b;">{output}</pre></div>', unsafe_allow_html=True)
 
-[Question]
-(a) [Option]
-(b) [Option]
-(c) [Option]
-(d) [Option]
 
-✓ **Answer:** [Letter]
-⚠️ **Trap:** [Explain the trap]
-💡 **Key Point:** [1-2 lines]
+def get_generation_mode() -> str:
+    """Generation mode from the GENERATION_MODE secret: 'single', 'fanout' or 'structured'."""
+    try:
+        mode = st.secrets.get("GENERATION_MODE", "single")
+    except Exception:
+        mode = "single"
+    return mode if mode in GENERATION_MODES else "single"
 
------
 
-[Q2, Q3 same format]
+@st.cache_resource
+def get_single_flight():
+    """Shared registry of in-flight generations, keyed by normalized topic."""
+    return SingleFlight()
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📝 SECTION B: CROSS-SUBJECT MCQs (Q4-Q5) 🔀
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
-**Q4** | [Different Subject] | CROSS-ANGLE 🔀
+LLM_MAX_CONCURRENCY = 6  # Claude calls in flight at once, server-wide
 
-[Question linking news to different subject]
-(a)-(d) options
 
-✓ **Answer:** [Letter]
-💡 **Cross-Link:** [How this connects to original news]
+@st.cache_resource
+def get_llm_limiter():
+    """Server-wide concurrency limiter with 429/overload backoff."""
+    return LLMLimiter(max_concurrent=LLM_MAX_CONCURRENCY)
 
------
 
-**Q5** | [Another Subject] | CROSS-ANGLE 🔀
+@st.cache_resource
+def get_metrics_writer():
+    """Background writer for per-generation telemetry rows."""
+    return MetricsWriter(supabase)
+
+
+def build_generation_executor(use_cache: bool = False, priority: int = 0, source: str = "interactive"):
+    """Job executor: generate with the configured mode, coalesced, cached and timed."""
+    client = get_anthropic_client()
+    mode = get_generation_mode()
+    generate = GENERATION_MODES[mode]
+    usage_stats = get_prompt_cache_stats()
+    generation_cache = get_generation_cache()
+    single_flight = get_single_flight()
+    limiter = get_llm_limiter()
+    metrics = get_metrics_writer()
+
+    def execute(topic, on_progress, on_queue):
+        trace = CallTrace(usage_stats)
+        labels = dict(source=source, model=CLAUDE_MODEL, mode=mode)
+        if use_cache:
+            cached = generation_cache.get(topic)
+            if cached is not None:
+                metrics.record(trace.row(OK, cache_hit=True, **labels))
+                return cached
+        if client is None:
+            raise RuntimeError("API not configured. Contact support.")
+
+        def limit(fn):
+            return limiter.call(trace.timed(fn), priority=priority, on_queue=on_queue)
+
+        def run(progress):
+            output = generate(client, topic, on_progress=progress, usage_stats=trace, limit=limit)
+            generation_cache.put(topic, output)
+            return output
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📝 SECTION C: PRIMARY MAINS (M1-M2)
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+        try:
+            # A trending topic clicked by many sessions at once costs one API call
+            output = single_flight.do(generation_cache.key_for(topic), run, trace.progress(on_progress))
+        except Exception as e:
+            metrics.record(trace.row(BUSY if isinstance(e, LLMBusyError) else ERROR, error=str(e), **labels))
+            raise
+        metrics.record(trace.row(OK if trace.api_calls else COALESCED, **labels))
+        return output
 
-**M1** | [Primary Paper] | PRIMARY | 15 marks
+    return execute
 
-"[Question]"
 
-**Answer Framework (250 words):**
-• **Intro (30 words):** [Approach]
-• **Body (150 words):** [Key points]
-• **Conclusion (40 words):** [Balanced ending]
+@st.cache_resource
+def get_history_store():
+    """Users' past generations, reopened from My History."""
+    return HistoryStore(supabase)
 
-**Must Include:** [Cases, committees, articles]
-**Avoid:** [Common mistakes]
 
------
+def history_recorder(mode: str = None, cache_results: bool = False):
+    """on_result for job runners: keep every finished job in its user's history."""
+    history = get_history_store()
+    mode = mode or get_generation_mode()
+    generation_cache = get_generation_cache() if cache_results else None
 
-[M2 same format]
+    def record(job, output):
+        if generation_cache is not None:
+            generation_cache.put(job['topic'], output)
+        history.add(job['email'], job['topic'], output, model=CLAUDE_MODEL, mode=mode)
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-📝 SECTION D: CROSS-SUBJECT MAINS (M3-M5) 🔀
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+    return record
 
-**M3** | [Different Paper] | CROSS-ANGLE 🔀 | 15 marks
-**Cross-Link:** [Why UPSC asks from this angle]
 
------
+@st.cache_resource
+def get_job_store():
+    """Shared job store for interactive and bulk generations."""
+    return JobStore(supabase)
+
 
-**M4** | [Another Paper] | CROSS-ANGLE 🔀
+@st.cache_resource
+def get_job_runner():
+    """Process-wide background worker pool for generation jobs."""
+    runner = JobRunner(
+        get_job_store(), build_generation_executor(),
+        reserve=reserve_query_credit, refund=refund_query_credit, on_result=history_recorder()
+    )
+    runner.resume_pending()
+    return runner
 
------
 
-**M5** | GS-IV | Ethics | CROSS-ANGLE 🔀 | Case Study
+BULK_CONCURRENCY = 4       # bulk topics generated at once, server-wide
+BATCH_API_MIN_TOPICS = 20  # offer the Message Batches API from this many topics
 
-[Ethics case study based on the topic]
-**Ethical Dimensions:** [Values at stake]
-**Framework:** [How to approach]
 
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
+@st.cache_resource
+def get_bulk_runner():
+    """Separate bounded pool so bulk runs never starve single-topic users."""
+    return JobRunner(
+        get_job_store(), build_generation_executor(use_cache=True, priority=1, source="bulk"),
+        reserve=reserve_query_credit, refund=refund_query_credit, on_result=history_recorder(),
+        max_workers=BULK_CONCURRENCY
+    )
 
-RULES:
-1. Exactly 5 primary + 5 cross-subject questions
-2. Cross-subject must be GENUINELY different subjects
-3. Use real UPSC trap patterns
-4. All cases/committees must be REAL
-5. Balanced conclusions always"""
 
-    try:
-        with st.spinner("🧠 Analyzing topic and generating questions… (20-30 seconds)"):
-            response = client.messages.create(
-                model="claude-sonnet-4-20250514",
-                max_tokens=6000,
-                system=system_prompt,
-                messages=[{
-                    "role": "user",
-                    "content": f"Generate 10 UPSC questions for:\n\n{topic}\n\nRemember: 5 from primary subject + 5 from cross-subject angles."
-                }]
-            )
-        return response.content[0].text
-    except Exception as e:
-        st.error(f"Error: {str(e)}")
+@st.cache_resource
+def get_message_batch_runner():
+    """Message Batches API runner for large, non-urgent bulk runs."""
+    client = get_anthropic_client()
+    if client is None:
         return None
+    # Batch calls bypass the limiter, so let the SDK retry them
+    runner = MessageBatchRunner(
+        client.with_options(max_retries=ANTHROPIC_MAX_RETRIES), get_job_store(),
+        reserve=reserve_query_credit, refund=refund_query_credit,
+        on_result=history_recorder(mode="batch", cache_results=True)
+    )
+    runner.resume_pending()
+    return runner
+
+
+@st.cache_resource
+def get_cache_warmer():
+    """Admin warm-up of trending topics, queued behind user and bulk generations."""
+    execute = build_generation_executor(priority=2, source="warmup")
+    return CacheWarmer(get_generation_cache(), lambda topic: execute(topic, None, None))
 
 
 # =============================================================================
@@ -767,11 +1021,8 @@ def show_email_entry():
                     # Small delay to ensure loading indicator renders
                     time.sleep(0.1)
                     
-                    # Check for pending payments
-                    pending = check_and_credit_pending_payments(email)
-                    
-                    # Get user (may have been created by check_and_credit_pending_payments)
-                    user = get_user_by_email(email)
+                    # Credit pending payments and get the user (may have been created by a payment)
+                    user, pending = settle_login(email)
                     
                     # Clear loading
                     loading_placeholder.empty()
@@ -873,7 +1124,7 @@ def show_email_entry():
                         
                         # Generate and send OTP
                         otp = generate_otp()
-                        if save_otp(email_input, otp) and send_otp_email(email_input, otp):
+                        if send_login_otp(email_input, otp):
                             loading_placeholder.empty()
                             st.session_state.otp_sent = True
                             st.session_state.otp_email = email_input.lower().strip()
@@ -950,10 +1201,8 @@ def show_email_entry():
                             # OTP verified - login or create user
                             email = st.session_state.otp_email
                             
-                            # Check for pending Razorpay payments BEFORE loading user
-                            pending_credits = check_and_credit_pending_payments(email)
-                            
-                            user = get_user_by_email(email)
+                            # Credit pending Razorpay payments and load the user together
+                            user, pending_credits = settle_login(email)
                             
                             loading_placeholder.empty()
                             
@@ -992,7 +1241,7 @@ def show_email_entry():
                 st.markdown("<p style='text-align: center; color: #64748b; font-size: 0.85rem;'>Didn't receive OTP?</p>", unsafe_allow_html=True)
                 if st.button("🔄 Resend OTP", use_container_width=True):
                     otp = generate_otp()
-                    if save_otp(st.session_state.otp_email, otp) and send_otp_email(st.session_state.otp_email, otp):
+                    if send_login_otp(st.session_state.otp_email, otp):
                         st.success("✅ New OTP sent! Check your email.")
                     else:
                         st.error("Could not resend OTP. Please try again.")
@@ -1044,7 +1293,7 @@ def show_payment_section():
             if st.session_state.logged_in:
                 if st.button("🔄 Refresh Credits", use_container_width=True, type="primary", key="refresh_old"):
                     with st.spinner("Checking for payments..."):
-                        pending = check_and_credit_pending_payments(st.session_state.email)
+                        pending = refresh_credits(st.session_state.email)
                     if pending > 0:
                         user = get_user_by_email(st.session_state.email)
                         if user:
@@ -1059,6 +1308,309 @@ def show_payment_section():
             st.error("Payment not configured. Contact support.")
 
 
+def show_generated_output(output: str, celebrate: bool = True):
+    """Display generated questions with download and buy-more options."""
+    st.markdown("---")
+    st.markdown("## ✅ Your Practice Questions")
+    render_output_box(st, output)
+    
+    st.download_button(
+        "📥 Download as Text File", output,
+        f"upsc_questions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
+        mime="text/plain"
+    )
+    
+    if st.session_state.logged_in:
+        new_total = st.session_state.free_credits + st.session_state.paid_credits
+        if new_total == 0:
+            st.markdown("---")
+            st.info("🎯 **Liked it?** Get more queries below!")
+            if st.button("💳 Buy More Credits (₹12)", use_container_width=True, type="primary", key="buy_after_generate"):
+                st.session_state.show_payment = True
+                st.rerun()
+    
+    if celebrate:
+        st.balloons()
+
+
+def show_active_job():
+    """Poll the session's generation job until it finishes, then show the result."""
+    runner = get_job_runner()
+    job_id = st.session_state.active_job_id
+    job = runner.store.get(job_id)
+    
+    if job is None:
+        st.session_state.active_job_id = None
+        st.query_params.pop('job', None)
+        return
+    
+    was_running = job['status'] not in FINISHED
+    if was_running:
+        # Show prominent loading indicator until the first text arrives
+        loading_placeholder = st.empty()
+        generating_html = """
+        <div style="background: linear-gradient(135deg, #fef3c7 0%, #fde68a 100%); border: 2px solid #f59e0b; border-radius: 12px; padding: 2rem; text-align: center; margin: 1rem 0;">
+            <div style="font-size: 3rem; margin-bottom: 0.5rem;">⏳</div>
+            <h2 style="margin: 0; color: #92400e;">Generating Questions...</h2>
+            <p style="margin: 0.5rem 0 0 0; color: #a16207; font-size: 1.1rem;">Questions start appearing in a few seconds. Safe to refresh — your questions keep generating.</p>
+            <p style="margin: 1rem 0 0 0; color: #b45309; font-size: 0.9rem;">🤖 AI is analyzing multi-angle perspectives...</p>
+        </div>
+        """
+        loading_placeholder.markdown(generating_html, unsafe_allow_html=True)
+        showing_queue = False
+        
+        while job and job['status'] not in FINISHED:
+            time.sleep(JOB_POLL_INTERVAL)
+            partial = runner.progress(job_id)
+            queue_status = runner.queue_status(job_id)
+            # Only render whole lines so half-written options/markers never flash up
+            if "\n" in partial:
+                render_output_box(loading_placeholder, partial[:partial.rfind("\n")])
+            elif queue_status:
+                # Server is at its Claude limit: show the line instead of an error
+                position, eta = queue_status
+                loading_placeholder.markdown(f"""
+                <div style="background: linear-gradient(135deg, #fef3c7 0%, #fde68a 100%); border: 2px solid #f59e0b; border-radius: 12px; padding: 2rem; text-align: center; margin: 1rem 0;">
+                    <div style="font-size: 3rem; margin-bottom: 0.5rem;">🚦</div>
+                    <h2 style="margin: 0; color: #92400e;">High demand — you're #{position} in line</h2>
+                    <p style="margin: 0.5rem 0 0 0; color: #a16207; font-size: 1.1rem;">Estimated wait: about {max(5, int(round(eta / 5.0)) * 5)} seconds. Your spot is saved even if you refresh.</p>
+                    <p style="margin: 1rem 0 0 0; color: #b45309; font-size: 0.9rem;">If generation fails, your credit is refunded.</p>
+                </div>
+                """, unsafe_allow_html=True)
+                showing_queue = True
+            elif showing_queue:
+                loading_placeholder.markdown(generating_html, unsafe_allow_html=True)
+                showing_queue = False
+            job = runner.store.get(job_id)
+        
+        loading_placeholder.empty()
+    
+    if job and job['status'] == DONE:
+        if st.session_state.logged_in and st.session_state.email == job['email']:
+            user = get_user_by_email(job['email'], fresh=True)
+            if user:
+                sync_session_credits(user)
+        show_generated_output(job['result'], celebrate=was_running)
+    else:
+        st.error(f"Error: {job['error'] if job else 'Job not found.'}")
+        st.session_state.active_job_id = None
+        st.query_params.pop('job', None)
+
+
+def show_bulk_entry():
+    """Bulk mode: many topics from a CSV or one per line, run in the background."""
+    if st.session_state.active_batch_id:
+        show_active_batch()
+        if st.button("➕ Start another bulk run", key="new_bulk_run"):
+            st.session_state.active_batch_id = None
+            st.query_params.pop('batch', None)
+            st.rerun()
+        return
+    
+    uploaded = st.file_uploader("Upload topics (.csv or .txt)", type=["csv", "txt"], key="bulk_file")
+    bulk_text = st.text_area(
+        "bulk_topics",
+        placeholder="One topic per line, or paste a CSV with a 'topic' column:\nRBI holds repo rate at 6.5%\nIndia-China LAC disengagement begins\nSupreme Court on bulldozer justice",
+        height=180,
+        label_visibility="collapsed",
+        key="bulk_input"
+    )
+    
+    raw = uploaded.getvalue().decode("utf-8", errors="ignore") if uploaded else bulk_text
+    topics = parse_topics(raw)
+    total_credits = st.session_state.free_credits + st.session_state.paid_credits
+    st.caption(f"📋 {len(topics)} topic(s) • needs {len(topics)} credit(s) • you have {total_credits} • max {MAX_BULK_TOPICS} per run")
+    
+    use_batch_api = False
+    if len(topics) >= BATCH_API_MIN_TOPICS:
+        use_batch_api = st.checkbox(
+            "🐢 Economy mode — submit through the Message Batches API (lower cost, results can take a few hours)",
+            value=False,
+            key="bulk_batch_api"
+        )
+    
+    if st.button(f"🚀 Generate {len(topics)} Topic(s)", use_container_width=True, type="primary", key="bulk_generate", disabled=not topics):
+        # Check stored balance up front: a bulk run must never start half-funded
+        user = get_user_by_email(st.session_state.email, fresh=True)
+        if user:
+            sync_session_credits(user)
+        available = st.session_state.free_credits + st.session_state.paid_credits
+        if available < len(topics):
+            st.error(f"You need {len(topics)} credits but have {available}. Remove some topics or buy more credits.")
+            return
+        
+        group_id = str(uuid.uuid4())
+        try:
+            batch_runner = get_message_batch_runner() if use_batch_api else None
+            if batch_runner is not None:
+                batch_runner.submit(st.session_state.email, topics, group_id)
+            else:
+                bulk_runner = get_bulk_runner()
+                for topic in topics:
+                    bulk_runner.submit(st.session_state.email, topic, group_id=group_id)
+        except Exception as e:
+            st.error(f"Error: {str(e)}")
+            return
+        
+        st.session_state.active_batch_id = group_id
+        st.query_params['batch'] = group_id
+        st.rerun()
+
+
+def show_active_batch():
+    """Show per-topic progress of the session's bulk run and the zip download."""
+    store = get_job_store()
+    group_id = st.session_state.active_batch_id
+    jobs = store.by_group(group_id)
+    if not jobs:
+        st.session_state.active_batch_id = None
+        st.query_params.pop('batch', None)
+        st.warning("Bulk run not found.")
+        return
+    
+    progress_placeholder = st.empty()
+    status_placeholder = st.empty()
+    
+    def render(jobs):
+        finished = sum(1 for job in jobs if job['status'] in FINISHED)
+        progress_placeholder.progress(finished / len(jobs), text=f"{finished} of {len(jobs)} topics finished")
+        icons = {DONE: "✅", FAILED: "❌"}
+        status_placeholder.markdown("\n".join(
+            f"{icons.get(job['status'], '⏳')} {job['topic']}" + (f" — _{job['error']}_" if job['status'] == FAILED else "")
+            for job in jobs
+        ))
+    
+    render(jobs)
+    batch_api = any(job.get('provider_batch_id') for job in jobs)
+    if batch_api and any(job['status'] not in FINISHED for job in jobs):
+        st.info("🐢 Economy run submitted. Results can take a few hours — come back to this page link later.")
+        return
+    
+    while any(job['status'] not in FINISHED for job in jobs):
+        time.sleep(JOB_POLL_INTERVAL * 2)
+        jobs = store.by_group(group_id)
+        render(jobs)
+    
+    if st.session_state.logged_in:
+        user = get_user_by_email(st.session_state.email, fresh=True)
+        if user:
+            sync_session_credits(user)
+    
+    done = sum(1 for job in jobs if job['status'] == DONE)
+    st.success(f"✅ {done} of {len(jobs)} topics generated.")
+    if done:
+        st.download_button(
+            "📦 Download All (.zip)", build_results_zip(jobs), results_zip_name(),
+            mime="application/zip", type="primary", key="bulk_download"
+        )
+
+
+def load_more_history():
+    """Append the next page of history metadata."""
+    state = st.session_state.history
+    entries, state['more'] = get_history_store().page(st.session_state.email, before_id=state['entries'][-1]['id'])
+    state['entries'] += entries
+
+
+def open_history_entry(entry_id: int):
+    """Fetch and decompress one past result; only the open one is kept in the session."""
+    state = st.session_state.history
+    state['open'] = entry_id
+    state['body'] = get_history_store().body(st.session_state.email, entry_id)
+
+
+def show_history():
+    """My History: past results newest first, a page of metadata at a time."""
+    st.markdown("## 📜 My History")
+    if st.button("← Back to Generator", key="close_history"):
+        st.session_state.show_history = False
+        st.session_state.history = None
+        st.rerun()
+    
+    state = st.session_state.history
+    if state is None:
+        entries, more = get_history_store().page(st.session_state.email)
+        state = st.session_state.history = {'entries': entries, 'more': more, 'open': None, 'body': None}
+    
+    if not state['entries']:
+        st.info("No questions generated yet. Your results will appear here.")
+        return
+    
+    st.caption("Reopen or download any past result — no credit needed.")
+    for entry in state['entries']:
+        created = datetime.fromisoformat(str(entry['created_at']).replace('Z', '+00:00'))
+        st.markdown("---")
+        st.markdown(f"**{entry['topic'][:120]}**  \n🕒 {created.strftime('%d %b %Y, %H:%M')} UTC • {entry['chars'] // 1000 or 1}k characters")
+        if state['open'] == entry['id']:
+            if state['body'] is None:
+                st.error("Could not load this result. Please try again.")
+                continue
+            render_output_box(st, state['body'])
+            st.download_button(
+                "📥 Download as Text File", state['body'],
+                f"upsc_questions_{created.strftime('%Y%m%d_%H%M%S')}.txt",
+                mime="text/plain", key=f"history_download_{entry['id']}"
+            )
+        else:
+            st.button("📖 Open", key=f"history_open_{entry['id']}", on_click=open_history_entry, args=(entry['id'],))
+    
+    if state['more']:
+        st.markdown("---")
+        st.button("⬇️ Load more", key="history_more", on_click=load_more_history)
+
+
+# (label, hours, chart bucket minutes)
+METRICS_WINDOWS = [("Last hour", 1, 5), ("Last 24 hours", 24, 60), ("Last 7 days", 168, 1440)]
+
+
+def show_metrics_dashboard():
+    """Admin-only latency, token, cache and error metrics over time windows."""
+    st.markdown("## 📈 Performance Dashboard")
+    if st.button("← Back to app", key="close_metrics"):
+        st.session_state.show_metrics = False
+        st.rerun()
+    
+    writer = get_metrics_writer()
+    rows = writer.rows_since(METRICS_WINDOWS[-1][1])
+    
+    def seconds(ms):
+        return round(ms / 1000, 2) if ms is not None else None
+    
+    table = []
+    for label, hours, _ in METRICS_WINDOWS:
+        summary = summarize(within(rows, hours))
+        table.append({
+            "Window": label,
+            "Queries": summary['queries'],
+            "p50 (s)": seconds(summary['p50_ms']),
+            "p95 (s)": seconds(summary['p95_ms']),
+            "p99 (s)": seconds(summary['p99_ms']),
+            "First output p50 (s)": seconds(summary['ttft_p50_ms']),
+            "Queue wait p95 (s)": seconds(summary['queue_wait_p95_ms']),
+            "Input tok/query": round(summary['input_tokens_per_query']),
+            "Output tok/query": round(summary['output_tokens_per_query']),
+            "Cached tok/query": round(summary['cache_read_tokens_per_query']),
+            "Cache hit %": round(summary['cache_hit_rate'] * 100, 1),
+            "Error %": round(summary['error_rate'] * 100, 1),
+        })
+    st.dataframe(table, use_container_width=True, hide_index=True)
+    
+    label = st.selectbox("Chart window", [w[0] for w in METRICS_WINDOWS], index=1, key="metrics_window")
+    _, hours, bucket_minutes = next(w for w in METRICS_WINDOWS if w[0] == label)
+    buckets = bucketize(within(rows, hours), bucket_minutes)
+    if not buckets:
+        st.info("No generations recorded in this window yet.")
+    else:
+        st.markdown("**Latency (s)**")
+        st.line_chart([{"at": b['at'], "p50": seconds(b['p50_ms']), "p95": seconds(b['p95_ms']), "p99": seconds(b['p99_ms'])} for b in buckets], x="at")
+        st.markdown("**Cache hit and error rate (%)**")
+        st.line_chart([{"at": b['at'], "cache hit": b['cache_hit_rate'] * 100, "errors": b['error_rate'] * 100} for b in buckets], x="at")
+        st.markdown("**Queries**")
+        st.bar_chart([{"at": b['at'], "queries": b['queries']} for b in buckets], x="at")
+    
+    st.caption(f"{len(rows)} rows in the last 7 days • metrics writes dropped: {writer.dropped}, failed: {writer.failed}")
+
+
 # =============================================================================
 # SESSION STATE
 # =============================================================================
@@ -1098,6 +1650,18 @@ if 'new_user_mode' not in st.session_state:
 if 'otp_sent' not in st.session_state:
     st.session_state.otp_sent = False
 
+if 'active_job_id' not in st.session_state:
+    st.session_state.active_job_id = st.query_params.get('job')
+
+if 'active_batch_id' not in st.session_state:
+    st.session_state.active_batch_id = st.query_params.get('batch')
+if 'show_metrics' not in st.session_state:
+    st.session_state.show_metrics = False
+
+if 'show_history' not in st.session_state:
+    st.session_state.show_history = False
+    st.session_state.history = None
+
 
 # =============================================================================
 # PROCESS RAZORPAY RETURN
@@ -1140,7 +1704,7 @@ with st.sidebar:
         # Refresh credits button
         if st.button("🔄 Refresh Credits", use_container_width=True, key="refresh_sidebar"):
             with st.spinner("Checking..."):
-                pending = check_and_credit_pending_payments(st.session_state.email)
+                pending = refresh_credits(st.session_state.email)
             if pending > 0:
                 user = get_user_by_email(st.session_state.email)
                 if user:
@@ -1151,8 +1715,49 @@ with st.sidebar:
             else:
                 st.info("No new payments")
         
+        if st.button("📜 My History", use_container_width=True, key="open_history"):
+            st.session_state.show_history = True
+            st.session_state.history = None
+            st.rerun()
+        
         st.markdown("---")
         
+        if is_admin(st.session_state.email):
+            for index in get_missing_indexes():
+                st.warning(f"Missing database index `{index}` ({EXPECTED_INDEXES[index]}). Run `python migrate.py`.")
+            with st.expander("⚙️ Server Stats"):
+                conn_stats = get_anthropic_connection_stats()
+                st.markdown(f"🔌 Claude connections — new: **{conn_stats.new}**, reused: **{conn_stats.reused}**")
+                cache_totals = get_prompt_cache_stats().totals()
+                st.markdown(f"🧠 Prompt cache ({cache_totals['calls']} calls) — read: **{cache_totals['cache_read_tokens']}**, write: **{cache_totals['cache_write_tokens']}** tokens")
+                result_stats = get_generation_cache().stats()
+                st.markdown(f"📦 Result cache — hits: **{result_stats['memory_hits']}** mem / **{result_stats['db_hits']}** db / **{result_stats['near_hits']}** similar, misses: **{result_stats['misses']}**, evictions: **{result_stats['evictions']}**, entries: **{result_stats['entries']}**")
+                limiter_stats = get_llm_limiter().stats()
+                st.markdown(f"🚦 Limiter — active: **{limiter_stats['active']}**/{LLM_MAX_CONCURRENCY}, waiting: **{limiter_stats['waiting']}**, throttled: **{limiter_stats['throttled']}**, gave up: **{limiter_stats['gave_up']}**")
+                flight_stats = get_single_flight().stats()
+                st.markdown(f"🔗 Generations — API calls: **{flight_stats['executed']}**, coalesced: **{flight_stats['coalesced']}**, in flight: **{flight_stats['in_flight']}**")
+            with st.expander("🔥 Warm Cache"):
+                warmer = get_cache_warmer()
+                warm_text = st.text_area("Trending topics, one per line", height=150, key="warm_topics")
+                warm_force = st.checkbox("Regenerate cached topics", key="warm_force")
+                if st.button("Warm up", use_container_width=True):
+                    warm_list = parse_topics(warm_text, max_topics=500)
+                    if not warm_list:
+                        st.warning("Enter at least one topic")
+                    elif not warmer.start(warm_list, force=warm_force):
+                        st.warning("A warm-up is already running")
+                warm_status = warmer.status()
+                if warm_status['started_at']:
+                    done = warm_status['generated'] + warm_status['cached'] + warm_status['failed']
+                    label = "Running" if warm_status['running'] else "Last run"
+                    st.markdown(f"{label}: **{done}**/{warm_status['total']} — generated **{warm_status['generated']}**, already cached **{warm_status['cached']}**, failed **{warm_status['failed']}**")
+                    for error in warm_status['errors'][-5:]:
+                        st.caption(f"⚠️ {error}")
+            if st.button("📈 Performance Dashboard", use_container_width=True, key="open_metrics"):
+                st.session_state.show_metrics = True
+                st.rerun()
+            st.markdown("---")
+        
         if st.button("Logout", use_container_width=True):
             st.session_state.logged_in = False
             st.session_state.email = None
@@ -1161,6 +1766,14 @@ with st.sidebar:
             st.session_state.otp_sent = False
             st.session_state.otp_email = None
             st.session_state.show_payment = False
+            st.session_state.active_job_id = None
+            st.session_state.active_batch_id = None
+            st.session_state.show_metrics = False
+            st.session_state.show_history = False
+            st.session_state.history = None
+            st.session_state.user_cache = {}
+            st.query_params.pop('job', None)
+            st.query_params.pop('batch', None)
             st.rerun()
     else:
         st.markdown("👇 **Enter email below to start**")
@@ -1241,7 +1854,15 @@ if st.session_state.get('is_new_user'):
 # MAIN CONTENT
 # =============================================================================
 
-if not st.session_state.logged_in:
+if st.session_state.show_metrics and st.session_state.logged_in and is_admin(st.session_state.email):
+    # ── ADMIN: PERFORMANCE DASHBOARD ──
+    show_metrics_dashboard()
+
+elif st.session_state.show_history and st.session_state.logged_in:
+    # ── MY HISTORY ──
+    show_history()
+
+elif not st.session_state.logged_in:
     # ── NOT LOGGED IN ──
     
     # Clean header with Writernical branding
@@ -1253,6 +1874,15 @@ if not st.session_state.logged_in:
     </div>
     """, unsafe_allow_html=True)
     
+    # Page was reloaded while a job was running: its result is still here
+    if st.session_state.active_job_id or st.session_state.active_batch_id:
+        st.info("🔄 Your questions from before the refresh are below. Log in again to see your credits.")
+        if st.session_state.active_job_id:
+            show_active_job()
+        if st.session_state.active_batch_id:
+            show_active_batch()
+        st.markdown("---")
+    
     show_email_entry()
 
 else:
@@ -1323,7 +1953,7 @@ else:
             </div>
             """, unsafe_allow_html=True)
             
-            pending = check_and_credit_pending_payments(st.session_state.email)
+            pending = refresh_credits(st.session_state.email)
             loading_placeholder.empty()
             
             if pending > 0:
@@ -1372,75 +2002,65 @@ else:
             """, height=0)
             st.session_state.scroll_to_query = False
         
-        topic_text = st.text_area(
-            "topic",
-            placeholder="Examples:\n• RBI holds repo rate at 6.5%\n• India-China LAC disengagement begins\n• Supreme Court on bulldozer justice\n• Governor delays NEET bill in Tamil Nadu",
-            height=100,
-            label_visibility="collapsed",
-            key="query_input"
+        bulk_mode = st.toggle(
+            "📚 Bulk mode — many topics at once (CSV or one per line)",
+            value=bool(st.session_state.active_batch_id),
+            key="bulk_mode"
         )
         
-        col1, col2, col3 = st.columns([1, 2, 1])
-        with col2:
-            clicked = st.button("🚀 Generate 10 Questions", use_container_width=True, type="primary")
-        
-        if clicked:
-            if not topic_text or len(topic_text.strip()) < 5:
-                st.warning("Please enter a topic (at least a few words)")
-            else:
-                # Show prominent loading indicator
-                loading_placeholder = st.empty()
-                loading_placeholder.markdown("""
-                <div style="background: linear-gradient(135deg, #fef3c7 0%, #fde68a 100%); border: 2px solid #f59e0b; border-radius: 12px; padding: 2rem; text-align: center; margin: 1rem 0;">
-                    <div style="font-size: 3rem; margin-bottom: 0.5rem;">⏳</div>
-                    <h2 style="margin: 0; color: #92400e;">Generating Questions...</h2>
-                    <p style="margin: 0.5rem 0 0 0; color: #a16207; font-size: 1.1rem;">This takes 20-30 seconds. Please don't refresh!</p>
-                    <p style="margin: 1rem 0 0 0; color: #b45309; font-size: 0.9rem;">🤖 AI is analyzing multi-angle perspectives...</p>
-                </div>
-                """, unsafe_allow_html=True)
-                
-                output = generate_questions(topic_text)
-                
-                # Clear loading
-                loading_placeholder.empty()
-                
-                if output:
-                    # Deduct credit - free first, then paid
-                    if st.session_state.free_credits > 0:
-                        st.session_state.free_credits -= 1
-                    else:
-                        st.session_state.paid_credits -= 1
-                    
-                    st.session_state.total_queries += 1
-                    
-                    # Update database
-                    update_user_credits(
-                        st.session_state.email,
-                        st.session_state.free_credits,
-                        st.session_state.paid_credits,
-                        st.session_state.total_queries
-                    )
-                    
-                    st.markdown("---")
-                    st.markdown("## ✅ Your Practice Questions")
-                    st.markdown(f'<div class="output-box"><pre style="white-space:pre-wrap; font-family:system-ui,-apple-system,sans-serif; font-size:0.9rem; line-height:1.7; color:#1e293b;">{output}</pre></div>', unsafe_allow_html=True)
-                    
-                    st.download_button(
-                        "📥 Download as Text File", output,
-                        f"upsc_questions_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
-                        mime="text/plain"
-                    )
-                    
-                    new_total = st.session_state.free_credits + st.session_state.paid_credits
-                    if new_total == 0:
-                        st.markdown("---")
-                        st.info("🎯 **Liked it?** Get more queries below!")
-                        if st.button("💳 Buy More Credits (₹12)", use_container_width=True, type="primary", key="buy_after_generate"):
-                            st.session_state.show_payment = True
-                            st.rerun()
+        if bulk_mode:
+            show_bulk_entry()
+        else:
+            topic_text = st.text_area(
+                "topic",
+                placeholder="Examples:\n• RBI holds repo rate at 6.5%\n• India-China LAC disengagement begins\n• Supreme Court on bulldozer justice\n• Governor delays NEET bill in Tamil Nadu",
+                height=100,
+                label_visibility="collapsed",
+                key="query_input"
+            )
+            
+            fresh_variant = st.checkbox(
+                "🔄 Fresh variant (don't reuse questions already generated for this topic)",
+                value=False,
+                key="fresh_variant"
+            )
+            
+            col1, col2, col3 = st.columns([1, 2, 1])
+            with col2:
+                clicked = st.button("🚀 Generate 10 Questions", use_container_width=True, type="primary")
+            
+            if clicked:
+                if not topic_text or len(topic_text.strip()) < 5:
+                    st.warning("Please enter a topic (at least a few words)")
+                else:
+                    # Same topic generated recently? Serve it instantly (still uses a credit)
+                    trace = CallTrace()
+                    output = None if fresh_variant else get_generation_cache().get(topic_text)
                     
-                    st.balloons()
-        
+                    if output is not None:
+                        get_metrics_writer().record(trace.row(OK, cache_hit=True, source="interactive", model=CLAUDE_MODEL, mode=get_generation_mode()))
+                        user = consume_query_credit(st.session_state.email)
+                        if user:
+                            sync_session_credits(user)
+                            get_history_store().add(st.session_state.email, topic_text, output,
+                                                    model=CLAUDE_MODEL, mode=get_generation_mode())
+                            st.session_state.active_job_id = None
+                            show_generated_output(output)
+                        else:
+                            st.error("Could not use a credit. Please refresh credits and try again.")
+                    else:
+                        # Runs in the background so a refresh doesn't lose the result
+                        try:
+                            job_id = get_job_runner().submit(st.session_state.email, topic_text)
+                        except Exception as e:
+                            st.error(f"Error: {str(e)}")
+                        else:
+                            st.session_state.active_job_id = job_id
+                            st.query_params['job'] = job_id
+            
+            if st.session_state.active_job_id:
+                show_active_job()
+            
         # Show Buy Credits option at bottom when user has credits
         st.markdown("---")
         if st.button("💳 Buy More Credits (₹12)", use_container_width=True, key="buy_main"):
@@ -0,0 +1,334 @@
+"""
+STRUCTURED QUESTIONS
+====================
+JSON schema for the 10 questions, compact result types, and a streaming
+parser that hands over each question as soon as its JSON object closes, so
+questions can be rendered, cached or stored one at a time without waiting
+for (or re-parsing) the whole completion.
+
+SCHEMA:
+    {
+      "analysis": {"topic": str, "primary_subject": str,
+                   "angles": [{"angle": str, "paper": str, "connection": str}]},
+      "mcqs":  [{"number": int, "subject": str, "cross": bool, "stem": str,
+                 "options": [str, str, str, str], "answer": "a"-"d",
+                 "trap": str, "key_point": str}],
+      "mains": [{"number": int, "paper": str, "cross": bool, "marks": int,
+                 "question": str, "framework": [str], "must_include": str,
+                 "avoid": str}]
+    }
+"""
+
+import json
+from dataclasses import asdict, dataclass
+
+RULE = "━" * 46
+
+STRUCTURED_SYSTEM_PROMPT = """You are an expert UPSC question setter. Generate 10 practice questions from the given topic.
+
+CRITICAL REQUIREMENT — 5+5 SPLIT:
+• 5 questions from PRIMARY SUBJECT (the obvious angle)
+• 5 questions from CROSS-SUBJECT ANGLES (History, Geography, Economy, Ethics, Environment — whichever connects)
+
+DISTRIBUTE AS:
+- MCQ 1-3: Primary Subject
+- MCQ 4-5: Cross-Subject Angles (DIFFERENT subjects)
+- MAINS 1-2: Primary Subject
+- MAINS 3-5: Cross-Subject Angles (M5 is a GS-IV Ethics case study)
+
+OUTPUT: a single JSON object and nothing else — no markdown fences, no prose.
+Write the keys in exactly this order so each part can be used as soon as it is written:
+
+{
+  "analysis": {
+    "topic": "<the news item>",
+    "primary_subject": "<GS-I/II/III/IV> — <subject name>",
+    "angles": [
+      {"angle": "<angle>", "paper": "<different GS paper>", "connection": "<how it connects>"}
+    ]
+  },
+  "mcqs": [
+    {
+      "number": 1,
+      "subject": "<subject>",
+      "cross": false,
+      "stem": "<question>",
+      "options": ["<a>", "<b>", "<c>", "<d>"],
+      "answer": "<a|b|c|d>",
+      "trap": "<the trap, or for cross-angle MCQs how the news links to this subject>",
+      "key_point": "<1-2 lines>"
+    }
+  ],
+  "mains": [
+    {
+      "number": 1,
+      "paper": "<GS paper>",
+      "cross": false,
+      "marks": 15,
+      "question": "<question or ethics case study>",
+      "framework": ["Intro (30 words): <approach>", "Body (150 words): <key points>", "Conclusion (40 words): <balanced ending>"],
+      "must_include": "<real cases, committees, articles>",
+      "avoid": "<common mistakes>"
+    }
+  ]
+}
+
+"analysis.angles" has 3 entries, "mcqs" 5 (numbers 1-5), "mains" 5 (numbers 1-5).
+Set "cross" to true for MCQ 4-5 and Mains 3-5.
+Options carry no "(a)" prefixes. Escape quotes inside strings.
+
+RULES:
+1. Exactly 5 primary + 5 cross-subject questions
+2. Cross-subject must be GENUINELY different subjects
+3. Use real UPSC trap patterns
+4. All cases/committees must be REAL
+5. Balanced conclusions always"""
+
+
+# =============================================================================
+# RESULT TYPES
+# =============================================================================
+
+@dataclass
+class Angle:
+    __slots__ = ('angle', 'paper', 'connection')
+    angle: str
+    paper: str
+    connection: str
+
+
+@dataclass
+class TopicAnalysis:
+    __slots__ = ('topic', 'primary_subject', 'angles')
+    topic: str
+    primary_subject: str
+    angles: list
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        angles = [Angle(str(a.get('angle', '')), str(a.get('paper', '')), str(a.get('connection', '')))
+                  for a in data.get('angles') or []]
+        return cls(str(data.get('topic', '')), str(data.get('primary_subject', '')), angles)
+
+    def to_text(self) -> str:
+        lines = [RULE, "📌 TOPIC ANALYSIS", RULE, "",
+                 f"**Topic:** {self.topic}", f"**Primary Subject:** {self.primary_subject}", "",
+                 "**Cross-Subject Angles:**"]
+        lines += [f"• {a.angle} — {a.paper} — {a.connection}" for a in self.angles]
+        return "\n".join(lines)
+
+
+@dataclass
+class MCQ:
+    __slots__ = ('number', 'subject', 'cross', 'stem', 'options', 'answer', 'trap', 'key_point')
+    number: int
+    subject: str
+    cross: bool
+    stem: str
+    options: tuple
+    answer: str
+    trap: str
+    key_point: str
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        return cls(
+            int(data.get('number') or 0), str(data.get('subject', '')), bool(data.get('cross')),
+            str(data.get('stem', '')), tuple(str(o) for o in data.get('options') or ()),
+            str(data.get('answer', '')).strip().lower().strip('()'), str(data.get('trap', '')),
+            str(data.get('key_point', '')),
+        )
+
+    def to_text(self) -> str:
+        tag = "CROSS-ANGLE 🔀" if self.cross else "PRIMARY"
+        lines = [f"**Q{self.number}** | {self.subject} | {tag}", "", self.stem]
+        lines += [f"({letter}) {option}" for letter, option in zip("abcd", self.options)]
+        lines += ["", f"✓ **Answer:** ({self.answer})"]
+        lines.append(f"💡 **Cross-Link:** {self.trap}" if self.cross else f"⚠️ **Trap:** {self.trap}")
+        if self.key_point:
+            lines.append(f"💡 **Key Point:** {self.key_point}")
+        return "\n".join(lines)
+
+
+@dataclass
+class MainsQuestion:
+    __slots__ = ('number', 'paper', 'cross', 'marks', 'question', 'framework', 'must_include', 'avoid')
+    number: int
+    paper: str
+    cross: bool
+    marks: int
+    question: str
+    framework: tuple
+    must_include: str
+    avoid: str
+
+    @classmethod
+    def from_dict(cls, data: dict):
+        framework = data.get('framework') or ()
+        if isinstance(framework, str):
+            framework = [framework]
+        return cls(
+            int(data.get('number') or 0), str(data.get('paper', '')), bool(data.get('cross')),
+            int(data.get('marks') or 15), str(data.get('question', '')), tuple(str(f) for f in framework),
+            str(data.get('must_include', '')), str(data.get('avoid', '')),
+        )
+
+    def to_text(self) -> str:
+        tag = "CROSS-ANGLE 🔀" if self.cross else "PRIMARY"
+        lines = [f"**M{self.number}** | {self.paper} | {tag} | {self.marks} marks", "", f"\"{self.question}\""]
+        if self.framework:
+            lines += ["", "**Answer Framework (250 words):**"] + [f"• {point}" for point in self.framework]
+        if self.must_include:
+            lines += ["", f"**Must Include:** {self.must_include}"]
+        if self.avoid:
+            lines.append(f"**Avoid:** {self.avoid}")
+        return "\n".join(lines)
+
+
+@dataclass
+class StructuredQuestions:
+    __slots__ = ('analysis', 'mcqs', 'mains')
+    analysis: TopicAnalysis
+    mcqs: list
+    mains: list
+
+    def add(self, item):
+        """File a parsed item (analysis, MCQ or Mains) in its place."""
+        if isinstance(item, TopicAnalysis):
+            self.analysis = item
+        elif isinstance(item, MCQ):
+            self.mcqs.append(item)
+        elif isinstance(item, MainsQuestion):
+            self.mains.append(item)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2)
+
+    @classmethod
+    def from_json(cls, text: str):
+        data = json.loads(text)
+        return cls(
+            TopicAnalysis.from_dict(data.get('analysis') or {}),
+            [MCQ.from_dict(q) for q in data.get('mcqs') or []],
+            [MainsQuestion.from_dict(q) for q in data.get('mains') or []],
+        )
+
+    def to_text(self) -> str:
+        """Render in the same layout as the free-form modes."""
+        blocks = []
+        if self.analysis is not None:
+            blocks.append(self.analysis.to_text())
+        sections = [
+            ("📝 SECTION A: PRIMARY MCQs (Q1-Q3)", [q for q in self.mcqs if not q.cross]),
+            ("📝 SECTION B: CROSS-SUBJECT MCQs (Q4-Q5) 🔀", [q for q in self.mcqs if q.cross]),
+            ("📝 SECTION C: PRIMARY MAINS (M1-M2)", [q for q in self.mains if not q.cross]),
+            ("📝 SECTION D: CROSS-SUBJECT MAINS (M3-M5) 🔀", [q for q in self.mains if q.cross]),
+        ]
+        for header, questions in sections:
+            if questions:
+                blocks.append(f"{RULE}\n{header}\n{RULE}\n\n" + "\n\n-----\n\n".join(q.to_text() for q in questions))
+        return "\n\n".join(blocks)
+
+
+# =============================================================================
+# STREAMING PARSER
+# =============================================================================
+
+# Parent key of an object -> type built from it once the object closes
+ITEM_TYPES = {
+    'analysis': TopicAnalysis,
+    'mcqs': MCQ,
+    'mains': MainsQuestion,
+}
+
+
+class StreamingQuestionParser:
+    """Incremental JSON scanner: feed() chunks, get back finished items.
+
+    Each character is scanned once, tracking string/escape state and a stack
+    of open containers with the key they belong to. When an object directly
+    under "analysis", "mcqs" or "mains" closes, only that slice is decoded.
+    Text before the first "{" (e.g. a ```json fence) is skipped. Consumed
+    text is dropped, so memory stays at roughly one open question.
+    """
+
+    def __init__(self):
+        self._buf = ""
+        self._pos = 0
+        self._stack = []        # [container char, owning key, last key seen]
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+        self._last_string = None
+        self._capture = None    # (buffer offset of '{', item type, stack depth)
+        self.done = False
+        self.result = StructuredQuestions(None, [], [])
+
+    def feed(self, chunk: str) -> list:
+        """Consume more streamed text; return the items completed by it."""
+        items = []
+        self._buf += chunk
+        buf = self._buf
+        pos = self._pos
+        while pos < len(buf) and not self.done:
+            ch = buf[pos]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+                    self._last_string = buf[self._string_start:pos]
+            elif not self._stack:
+                if ch == '{':
+                    self._stack.append(['{', None, None])
+            elif ch == '"':
+                self._in_string = True
+                self._string_start = pos + 1
+            elif ch == ':':
+                self._stack[-1][2] = self._last_string
+            elif ch in '{[':
+                parent = self._stack[-1]
+                owner = parent[2] if parent[0] == '{' else parent[1]
+                self._stack.append([ch, owner, None])
+                item_type = ITEM_TYPES.get(owner)
+                if ch == '{' and item_type is not None and self._capture is None and self._expects_item(owner, parent):
+                    self._capture = (pos, item_type, len(self._stack))
+            elif ch in '}]':
+                if self._capture is not None and len(self._stack) == self._capture[2]:
+                    start, item_type, _ = self._capture
+                    self._capture = None
+                    item = self._build(item_type, buf[start:pos + 1])
+                    if item is not None:
+                        self.result.add(item)
+                        items.append(item)
+                self._stack.pop()
+                if not self._stack:
+                    self.done = True
+            pos += 1
+
+        # Keep only what an open capture or string still needs
+        keep = min(x for x in (pos, self._capture[0] if self._capture else pos,
+                               self._string_start if self._in_string else pos))
+        self._buf = buf[keep:]
+        self._pos = pos - keep
+        self._string_start -= keep
+        if self._capture is not None:
+            self._capture = (self._capture[0] - keep,) + self._capture[1:]
+        return items
+
+    @staticmethod
+    def _expects_item(owner: str, parent: list) -> bool:
+        # "analysis" is an object value; "mcqs"/"mains" hold objects in an array
+        return parent[0] == '{' if owner == 'analysis' else parent[0] == '['
+
+    @staticmethod
+    def _build(item_type, text: str):
+        try:
+            return item_type.from_dict(json.loads(text))
+        except (ValueError, TypeError, AttributeError):
+            return None
@@ -0,0 +1,226 @@
+"""
+GENERATION TELEMETRY
+====================
+One metrics row per generation request: queue wait, time to first output,
+total latency, token counts, model, outcome and whether the result came from
+the cache. Rows are written by a background thread so a slow metrics insert
+never delays a student's questions.
+
+SUPABASE TABLE: migrations/010_llm_metrics.sql (optional; without it recent
+rows are kept in memory)
+"""
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+
+METRICS_TABLE = 'llm_metrics'
+METRICS_PAGE_SIZE = 1000   # Supabase's default cap on rows per response
+
+OK = 'ok'
+COALESCED = 'coalesced'
+BUSY = 'busy'
+ERROR = 'error'
+
+TOKEN_FIELDS = ('input_tokens', 'output_tokens', 'cache_read_tokens', 'cache_write_tokens')
+
+
+def _ms(seconds):
+    return None if seconds is None else int(round(seconds * 1000))
+
+
+class CallTrace:
+    """Timings and token counts for one generation.
+
+    Pass it as usage_stats (it forwards to the shared stats), wrap each API
+    call with timed() and the progress callback with progress().
+    """
+
+    def __init__(self, usage_stats=None):
+        self.usage_stats = usage_stats
+        self.started = time.perf_counter()
+        self.first_call = None
+        self.first_output = None
+        self.api_calls = 0
+        self.tokens = dict.fromkeys(TOKEN_FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def record(self, usage):
+        entry = self.usage_stats.record(usage) if self.usage_stats is not None else {
+            'input_tokens': usage.input_tokens,
+            'output_tokens': usage.output_tokens,
+            'cache_read_tokens': usage.cache_read_input_tokens or 0,
+            'cache_write_tokens': usage.cache_creation_input_tokens or 0,
+        }
+        with self._lock:
+            for key in TOKEN_FIELDS:
+                self.tokens[key] += entry[key]
+        return entry
+
+    def timed(self, fn):
+        """Wrap an API call; the first one to start ends the queue wait."""
+        def call():
+            with self._lock:
+                if self.first_call is None:
+                    self.first_call = time.perf_counter()
+                self.api_calls += 1
+            return fn()
+        return call
+
+    def progress(self, on_progress):
+        def report(text):
+            if self.first_output is None:
+                self.first_output = time.perf_counter()
+            if on_progress is not None:
+                on_progress(text)
+        return report
+
+    def row(self, outcome: str, cache_hit: bool = False, error: str = None, **fields) -> dict:
+        row = {
+            'at': datetime.now(timezone.utc).isoformat(),
+            'outcome': outcome,
+            'cache_hit': cache_hit,
+            'queue_wait_ms': _ms(self.first_call - self.started) if self.first_call else None,
+            'ttft_ms': _ms(self.first_output - self.started) if self.first_output else None,
+            'latency_ms': _ms(time.perf_counter() - self.started),
+            'api_calls': self.api_calls,
+            'error': error[:500] if error else None,
+        }
+        row.update(self.tokens)
+        row.update(fields)
+        return row
+
+
+class MetricsWriter:
+    """Non-blocking metrics sink.
+
+    record() only enqueues; a daemon thread inserts rows in batches. Recent
+    rows are also kept in memory, which is what the dashboard reads when
+    there is no Supabase client. If the queue is full the row is dropped and
+    counted rather than blocking the caller.
+    """
+
+    def __init__(self, supabase=None, batch_size: int = 50, flush_seconds: float = 2.0,
+                 max_pending: int = 5000, keep_recent: int = 20000):
+        self.supabase = supabase
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.recent = deque(maxlen=keep_recent)
+        self.dropped = 0
+        self.failed = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        threading.Thread(target=self._drain, name="upsc-metrics", daemon=True).start()
+
+    def record(self, row: dict):
+        with self._lock:
+            self.recent.append(row)
+        if self.supabase is None:
+            return
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self.dropped += 1
+
+    def _drain(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_seconds
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self.supabase.table(METRICS_TABLE).insert(batch).execute()
+            except Exception:
+                self.failed += len(batch)
+
+    def rows_since(self, hours: float) -> list:
+        """Every row from the last `hours`, from Supabase if configured, else memory.
+
+        Supabase rows are read newest first in keyset pages on id, so a busy
+        week is read in full rather than cut off at one response's row cap.
+        """
+        since = (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat()
+        if self.supabase is not None:
+            try:
+                rows = []
+                while True:
+                    query = self.supabase.table(METRICS_TABLE).select('*').gte('at', since)
+                    if rows:
+                        query = query.lt('id', rows[-1]['id'])
+                    page = query.order('id', desc=True).limit(METRICS_PAGE_SIZE).execute().data or []
+                    rows.extend(page)
+                    if len(page) < METRICS_PAGE_SIZE:
+                        return rows
+            except Exception:
+                pass
+        with self._lock:
+            return [row for row in self.recent if row['at'] >= since]
+
+
+# =============================================================================
+# SUMMARIES
+# =============================================================================
+
+def percentile(values: list, pct: float):
+    """Nearest-rank percentile of a list, None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(rows: list) -> dict:
+    """Latency percentiles, tokens per query, cache hit and error rates."""
+    total = len(rows)
+    live = [r for r in rows if not r.get('cache_hit') and r.get('outcome') == OK]
+    latencies = [r['latency_ms'] for r in live if r.get('latency_ms') is not None]
+    ttfts = [r['ttft_ms'] for r in live if r.get('ttft_ms') is not None]
+    waits = [r['queue_wait_ms'] for r in live if r.get('queue_wait_ms') is not None]
+    hits = sum(1 for r in rows if r.get('cache_hit') or r.get('outcome') == COALESCED)
+    errors = sum(1 for r in rows if r.get('outcome') in (BUSY, ERROR))
+    summary = {
+        'queries': total,
+        'api_generations': len(live),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'ttft_p50_ms': percentile(ttfts, 50),
+        'queue_wait_p95_ms': percentile(waits, 95),
+        'cache_hit_rate': hits / total if total else 0.0,
+        'error_rate': errors / total if total else 0.0,
+        'busy_errors': sum(1 for r in rows if r.get('outcome') == BUSY),
+    }
+    for key in TOKEN_FIELDS:
+        summary[f'{key}_per_query'] = (sum(r.get(key) or 0 for r in live) / len(live)) if live else 0.0
+    return summary
+
+
+def _parse_at(value) -> datetime:
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+
+
+def within(rows: list, hours: float) -> list:
+    """Rows recorded in the last `hours`."""
+    since = datetime.now(timezone.utc) - timedelta(hours=hours)
+    return [row for row in rows if _parse_at(row['at']) >= since]
+
+
+def bucketize(rows: list, bucket_minutes: int) -> list:
+    """summarize() per time bucket, oldest first, for charts."""
+    buckets = {}
+    for row in rows:
+        at = _parse_at(row['at'])
+        start = at.replace(second=0, microsecond=0)
+        start -= timedelta(minutes=(start.hour * 60 + start.minute) % bucket_minutes)
+        buckets.setdefault(start, []).append(row)
+    return [dict(summarize(bucket), at=start) for start, bucket in sorted(buckets.items())]
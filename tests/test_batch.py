@@ -0,0 +1,152 @@
+from types import SimpleNamespace
+
+import pytest
+
+import batch
+from batch import MessageBatchRunner
+from jobs import DONE, FAILED, JobStore
+
+
+def succeeded(job_id, text='questions', stop_reason='end_turn'):
+    message = SimpleNamespace(content=[SimpleNamespace(text=text)], stop_reason=stop_reason)
+    return SimpleNamespace(custom_id=job_id, result=SimpleNamespace(type='succeeded', message=message))
+
+
+class Batches:
+    """messages.batches with a results() that raises the first `failures` times."""
+
+    def __init__(self, failures=0, stop_reason='end_turn'):
+        self.entries = []
+        self.failures = failures
+        self.stop_reason = stop_reason
+
+    def create(self, requests):
+        self.entries = [succeeded(r['custom_id'], stop_reason=self.stop_reason) for r in requests]
+        return SimpleNamespace(id='msgbatch_1')
+
+    def retrieve(self, batch_id):
+        return SimpleNamespace(processing_status='ended')
+
+    def results(self, batch_id):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError("results stream dropped")
+        return iter(self.entries)
+
+
+class Credits:
+    """reserve/refund by job against an in-memory balance, as migrations/011 does them."""
+
+    def __init__(self, balance=2, lands_then_raises=False):
+        self.store = None
+        self.balance = balance
+        self.lands_then_raises = lands_then_raises
+        self.reserved = []
+        self.refunds = []
+
+    def reserve(self, job):
+        if self.balance <= 0 or not self.store.mark_charged(job['id'], credit='paid'):
+            return None
+        self.balance -= 1
+        self.reserved.append(job['id'])
+        if self.lands_then_raises:
+            raise TimeoutError("rpc timed out after the debit")
+        return 'paid'
+
+    def refund(self, job):
+        if not self.store.mark_charged(job['id'], charged=False, credit=None):
+            return None
+        self.balance += 1
+        self.refunds.append(job['id'])
+        return {'paid_credits': self.balance}
+
+
+@pytest.fixture(autouse=True)
+def no_pollers(monkeypatch):
+    # Poll in the test's thread instead
+    monkeypatch.setattr(MessageBatchRunner, '_start_poller', lambda self, batch_id: None)
+    monkeypatch.setattr(batch, 'REFUND_RETRY_SECONDS', 0)
+
+
+def run_batch(batches, credits, topics=('Monetary policy', 'Fiscal deficit'), store=None):
+    store = store or JobStore()
+    credits.store = store
+    runner = MessageBatchRunner(SimpleNamespace(messages=SimpleNamespace(batches=batches)),
+                                store, credits.reserve, credits.refund, poll_seconds=0)
+    job_ids = runner.submit('student@gmail.com', list(topics), group_id='group-1')
+    runner._poll('msgbatch_1')
+    return store, [store.get(job_id) for job_id in job_ids]
+
+
+def test_results_are_charged_once_and_delivered():
+    credits = Credits()
+    store, jobs = run_batch(Batches(), credits)
+    assert [job['status'] for job in jobs] == [DONE, DONE]
+    assert credits.balance == 0 and all(job['charged'] and job['credit'] == 'paid' for job in jobs)
+
+
+def test_result_without_a_credit_is_not_delivered():
+    credits = Credits(balance=1)
+    store, jobs = run_batch(Batches(), credits)
+    assert jobs[0]['status'] == DONE
+    assert jobs[1]['status'] == FAILED and jobs[1]['error'] == "No credits left."
+    assert jobs[1].get('result') is None and not jobs[1]['charged']
+
+
+def test_reserve_that_lands_then_raises_is_refunded():
+    credits = Credits(lands_then_raises=True)
+    store, jobs = run_batch(Batches(), credits)
+    assert [job['status'] for job in jobs] == [FAILED, FAILED]
+    assert credits.balance == 2 and credits.refunds == credits.reserved
+    assert not any(job['charged'] for job in jobs)
+
+
+def test_already_charged_job_is_delivered_without_a_second_charge():
+    credits = Credits()
+    store = JobStore()
+    create = store.create
+    # As if reserved by an earlier poller that stopped before marking them DONE
+    store.create = lambda *args, **extra: create(*args, charged=True, credit='paid', **extra)
+    store, jobs = run_batch(Batches(), credits, store=store)
+    assert [job['status'] for job in jobs] == [DONE, DONE]
+    assert credits.reserved == [] and credits.balance == 2
+
+
+def test_results_stream_is_retried():
+    store, jobs = run_batch(Batches(failures=2), Credits())
+    assert [job['status'] for job in jobs] == [DONE, DONE]
+
+
+def test_unreadable_results_fail_the_batch(capsys):
+    credits = Credits()
+    store, jobs = run_batch(Batches(failures=batch.RESULT_ATTEMPTS), credits)
+    assert [job['status'] for job in jobs] == [FAILED, FAILED] and credits.reserved == []
+    assert 'could not read results' in capsys.readouterr().err
+
+
+def test_comma_bearing_topics_one_per_line_are_kept_whole():
+    text = ("RBI holds repo rate, keeps stance neutral\n"
+            "Governor delays NEET bill\n"
+            "SC on electoral bonds, disclosure and privacy\n")
+    assert batch.parse_topics(text) == [
+        "RBI holds repo rate, keeps stance neutral",
+        "Governor delays NEET bill",
+        "SC on electoral bonds, disclosure and privacy",
+    ]
+
+
+def test_csv_with_a_topic_column_is_read_as_csv():
+    text = "date,topic\n2024-06-07,\"RBI holds repo rate, keeps stance\"\n2024-06-08,Governor delays NEET bill\n"
+    assert batch.parse_topics(text) == ["RBI holds repo rate, keeps stance", "Governor delays NEET bill"]
+
+
+def test_headerless_csv_with_even_columns_keeps_the_first():
+    text = "RBI holds repo rate\tEconomy\nGovernor delays NEET bill\tPolity\n"
+    assert batch.parse_topics(text) == ["RBI holds repo rate", "Governor delays NEET bill"]
+
+
+def test_truncated_result_is_neither_charged_nor_delivered():
+    credits = Credits()
+    store, jobs = run_batch(Batches(stop_reason='max_tokens'), credits)
+    assert [job['status'] for job in jobs] == [FAILED, FAILED] and credits.reserved == []
+    assert 'max_tokens' in jobs[0]['error'] and jobs[0].get('result') is None
@@ -0,0 +1,66 @@
+from data_access import DataAccess
+
+
+class Recorder(DataAccess):
+    """DataAccess whose OTP insert and email only record what happened."""
+
+    def __init__(self, save_error=None):
+        super().__init__('http://127.0.0.1:9', 'key')
+        self.save_error = save_error
+        self.sent = []
+
+    async def save_otp_async(self, email, otp):
+        if self.save_error:
+            raise self.save_error
+
+    async def send_email_async(self, message):
+        self.sent.append(message)
+
+
+def test_otp_is_emailed_after_it_is_saved():
+    data = Recorder()
+    assert data.send_otp('Student@Gmail.com', '123456', {'to': 'student@gmail.com'}) is None
+    assert data.sent == [{'to': 'student@gmail.com'}]
+
+
+def test_otp_that_was_not_saved_is_never_emailed():
+    data = Recorder(save_error=ConnectionError("insert failed"))
+    assert data.send_otp('student@gmail.com', '123456', {'to': 'student@gmail.com'}) == "insert failed"
+    assert data.sent == []
+
+
+class Login(DataAccess):
+    """DataAccess whose shared payments window is down, with canned index and credit calls."""
+
+    def __init__(self, pending):
+        super().__init__('http://127.0.0.1:9', 'key', recent_payments=Down())
+        self.pending = pending
+        self.credited = []
+
+    async def fetch_user_async(self, email):
+        return {'email': email, 'paid_credits': 0}
+
+    async def recorded_payment_ids_async(self, email):
+        return set()
+
+    async def pending_payments_async(self, email):
+        return self.pending
+
+    async def credit_payments_async(self, email, payments):
+        self.credited.extend(payments)
+        return {'credits_added': sum(p['credits'] for p in payments), 'paid_credits': len(payments)}
+
+
+class Down:
+    def payments_for(self, email):
+        raise ConnectionError("razorpay unavailable")
+
+
+def test_login_without_the_window_credits_every_indexed_payment():
+    # More than one Razorpay page (count=100) of payments in the lookback window
+    pending = [{'id': f'pay_{n}', 'email': 'student@gmail.com', 'amount': 1200, 'status': 'captured'}
+               for n in range(150)]
+    data = Login(pending)
+    user, added = data.login('student@gmail.com')
+    assert [p['id'] for p in data.credited] == [p['id'] for p in pending]
+    assert added > 0 and user['email'] == 'student@gmail.com'
@@ -0,0 +1,166 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import anthropic
+import httpx
+import pytest
+
+from generation import GENERATION_MODES, LLMBusyError, LLMLimiter, build_anthropic_client
+
+
+def overloaded():
+    request = httpx.Request('POST', 'https://api.anthropic.com/v1/messages')
+    response = httpx.Response(529, request=request, headers={'retry-after': '0'})
+    return anthropic.InternalServerError("overloaded", response=response, body={'type': 'overloaded_error'})
+
+
+def test_client_behind_the_limiter_does_not_retry_on_its_own():
+    assert build_anthropic_client('sk-test', max_retries=0).max_retries == 0
+
+
+def test_limiter_retries_overloads_then_gives_up():
+    limiter, calls = LLMLimiter(max_attempts=3, base_delay=0), []
+
+    def fn():
+        calls.append(1)
+        raise overloaded()
+
+    with pytest.raises(LLMBusyError):
+        limiter.call(fn)
+    assert len(calls) == 3 and limiter.stats()['gave_up'] == 1
+
+
+def test_limiter_does_not_retry_other_errors():
+    limiter, calls = LLMLimiter(base_delay=0), []
+
+    def fn():
+        calls.append(1)
+        raise ValueError("bad request")
+
+    with pytest.raises(ValueError):
+        limiter.call(fn)
+    assert len(calls) == 1
+
+
+def test_on_queue_runs_without_the_lock_held():
+    limiter = LLMLimiter(max_concurrent=1)
+    release, reports, lock_free = threading.Event(), [], []
+
+    def on_queue(position, eta):
+        reports.append(position)
+        # A slow job-store write here must not block other threads on the limiter
+        probe = threading.Thread(target=limiter.stats, daemon=True)
+        probe.start()
+        probe.join(0.5)
+        lock_free.append(not probe.is_alive())
+        if position:
+            release.set()
+
+    def holder():
+        with limiter.slot():
+            release.wait(5)
+
+    first = threading.Thread(target=holder)
+    first.start()
+    while limiter.active == 0:
+        time.sleep(0.01)
+    with limiter.slot(on_queue=on_queue):
+        pass
+    first.join()
+    assert reports[0] == 1 and reports[-1] == 0
+    assert lock_free and all(lock_free)
+
+
+def test_waiters_are_served_by_priority():
+    limiter = LLMLimiter(max_concurrent=1)
+    order, gate = [], threading.Event()
+
+    def holder():
+        with limiter.slot():
+            gate.wait(5)
+
+    def waiter(priority):
+        with limiter.slot(priority):
+            order.append(priority)
+
+    first = threading.Thread(target=holder)
+    first.start()
+    while limiter.active == 0:
+        time.sleep(0.01)
+    waiters = [threading.Thread(target=waiter, args=(p,)) for p in (2, 0, 1)]
+    for thread in waiters:
+        thread.start()
+    while limiter.stats()['waiting'] < 3:
+        time.sleep(0.01)
+    gate.set()
+    for thread in [first] + waiters:
+        thread.join()
+    assert order == [0, 1, 2]
+
+
+def test_failing_on_queue_does_not_leak_the_slot():
+    limiter = LLMLimiter(max_concurrent=1)
+
+    def on_queue(position, eta):
+        raise ConnectionError("job store unavailable")
+
+    with pytest.raises(ConnectionError):
+        with limiter.slot(on_queue=on_queue):
+            pass
+    assert limiter.active == 0
+
+
+def test_waiters_released_together_all_start_promptly():
+    limiter = LLMLimiter(max_concurrent=4)
+    limiter.pause(0.2)
+    resumes = time.monotonic() + 0.2
+    started, all_in = [], threading.Barrier(4, timeout=5)
+
+    def waiter():
+        with limiter.slot():
+            started.append(time.monotonic())
+            all_in.wait()
+
+    threads = [threading.Thread(target=waiter) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # The pause ends on time and each slot taken hands the queue on, with no 1s poll
+    assert len(started) == 4 and max(started) - resumes < 0.5
+
+
+class Stream:
+    def __init__(self, message):
+        self.message = message
+        self.text_stream = [message.content[0].text]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def get_final_message(self):
+        return self.message
+
+
+def client_stopping_at(stop_reason):
+    message = SimpleNamespace(content=[SimpleNamespace(text='{"analysis": {"topic": "x"')],
+                              stop_reason=stop_reason, usage=None)
+    messages = SimpleNamespace(create=lambda **request: message, stream=lambda **request: Stream(message))
+    return SimpleNamespace(messages=messages)
+
+
+@pytest.mark.parametrize('mode', sorted(GENERATION_MODES))
+@pytest.mark.parametrize('streamed', [False, True])
+def test_truncated_output_is_rejected_in_every_mode(mode, streamed):
+    progress = (lambda text: None) if streamed else None
+    with pytest.raises(RuntimeError, match="max_tokens"):
+        GENERATION_MODES[mode](client_stopping_at('max_tokens'), 'Monetary policy', on_progress=progress)
+
+
+def test_interrupted_stream_is_rejected():
+    with pytest.raises(RuntimeError, match="interrupted"):
+        GENERATION_MODES['single'](client_stopping_at(None), 'Monetary policy', on_progress=lambda text: None)
@@ -0,0 +1,111 @@
+import threading
+import time
+
+from generation_cache import GenerationCache, SingleFlight, TopicLSHIndex, normalize_topic
+
+
+def test_negated_topic_gets_its_own_key():
+    assert normalize_topic('Supreme Court will not hear plea') != normalize_topic('Supreme Court will hear plea')
+
+
+def test_contracted_negations_keep_their_meaning():
+    assert normalize_topic("SC won't hear plea") == normalize_topic('SC will not hear plea')
+    assert normalize_topic("Centre can't levy cess") == normalize_topic('Centre cannot levy cess')
+    assert normalize_topic("Centre can't levy cess") != normalize_topic('Centre can levy cess')
+
+
+def test_meaning_bearing_words_are_kept():
+    assert normalize_topic('Polls before monsoon session') != normalize_topic('Polls after monsoon session')
+
+
+def test_filler_still_folds_to_one_key():
+    assert normalize_topic('The Impact of GST on States!') == normalize_topic('impact  GST states')
+
+
+
+def test_contradicting_headline_is_not_a_near_match():
+    cache = GenerationCache()
+    cache.put('RBI holds repo rate at 6.5%', 'hold questions')
+    assert cache.get('RBI cuts repo rate to 6.5%') is None
+
+
+def test_verb_swapped_paraphrase_is_not_a_near_match():
+    # Same shape as the contradiction above, so it cannot be told apart from one
+    cache = GenerationCache()
+    cache.put('Tamil Nadu Governor returns NEET bill', 'returns questions')
+    assert cache.get('Governor delays NEET bill in TN') is None
+
+
+def test_numbers_and_negations_block_near_matches():
+    index = TopicLSHIndex()
+    index.add('a', 'Fiscal deficit target 4.5 percent for 2025')
+    index.add('b', 'Supreme Court hears plea on electoral bonds')
+    assert index.query('Fiscal deficit target 5.1 percent for 2025')[0] is None
+    assert index.query('Supreme Court never hears plea on electoral bonds')[0] is None
+
+
+def test_rewording_with_filler_still_reuses_the_result():
+    cache = GenerationCache()
+    cache.put('RBI holds repo rate at 6.5%', 'hold questions')
+    assert cache.get('Latest: repo rate RBI holds at 6.5%') == 'hold questions'
+    assert cache.get('RBI hold repo rates 6.5% (analysis)') == 'hold questions'
+
+
+def test_negated_topic_misses_the_cache():
+    cache = GenerationCache()
+    cache.put('Supreme Court will hear plea on electoral bonds', 'questions')
+    assert cache.get('Supreme Court will not hear plea on electoral bonds') is None
+
+
+def test_single_flight_runs_concurrent_callers_once():
+    flight, gate, calls = SingleFlight(), threading.Event(), []
+    progress_seen = []
+
+    def generate(on_progress):
+        calls.append(1)
+        on_progress("partial")
+        gate.wait(5)
+        return "questions"
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(flight.do('rbi repo rate', generate)))
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+    followers = [threading.Thread(target=lambda: results.append(
+        flight.do('rbi repo rate', generate, progress_seen.append))) for _ in range(3)]
+    for thread in followers:
+        thread.start()
+    while flight.stats()['coalesced'] < 3:
+        time.sleep(0.01)
+    gate.set()
+    for thread in [leader] + followers:
+        thread.join()
+    assert results == ["questions"] * 4 and len(calls) == 1
+    assert progress_seen == ["partial"] * 3
+    assert flight.stats() == {'executed': 1, 'coalesced': 3, 'in_flight': 0}
+
+
+def test_single_flight_shares_the_error_then_runs_again():
+    flight, gate, errors = SingleFlight(), threading.Event(), []
+
+    def failing(on_progress):
+        gate.wait(5)
+        raise RuntimeError("overloaded")
+
+    def call():
+        try:
+            flight.do('rbi repo rate', failing)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=call) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    while flight.stats()['coalesced'] < 1:
+        time.sleep(0.01)
+    gate.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ["overloaded"] * 2
+    assert flight.do('rbi repo rate', lambda on_progress: "fresh") == "fresh"
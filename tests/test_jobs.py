@@ -0,0 +1,149 @@
+import pytest
+
+import jobs
+from jobs import DONE, FAILED, JobRunner, JobStore
+
+
+class Credits:
+    """reserve/refund by job against an in-memory balance, as migrations/011 does them."""
+
+    def __init__(self, store, balance=1):
+        self.store = store
+        self.balance = balance
+        self.refunds = []
+
+    def reserve(self, job):
+        if self.balance <= 0 or not self.store.mark_charged(job['id'], credit='paid'):
+            return None
+        self.balance -= 1
+        return 'paid'
+
+    def refund(self, job):
+        if not self.store.mark_charged(job['id'], charged=False, credit=None):
+            return None
+        self.refunds.append(job['id'])
+        self.balance += 1
+        return {'paid_credits': self.balance}
+
+
+class Outage:
+    """Wraps a credit call so it raises the first `failures` times, optionally after it lands."""
+
+    def __init__(self, fn, failures, lands=False):
+        self.fn = fn
+        self.failures = failures
+        self.lands = lands
+
+    def __call__(self, job):
+        if self.failures > 0:
+            self.failures -= 1
+            if self.lands:
+                self.fn(job)
+            raise ConnectionError("supabase unavailable")
+        return self.fn(job)
+
+
+@pytest.fixture(autouse=True)
+def no_retry_wait(monkeypatch):
+    monkeypatch.setattr(jobs, 'REFUND_RETRY_SECONDS', 0)
+
+
+def failing(topic, on_progress, on_queue):
+    raise RuntimeError("overloaded")
+
+
+def succeeding(topic, on_progress, on_queue):
+    on_progress("partial")
+    return f"questions about {topic}"
+
+
+def run_one(store, execute, reserve, refund, **runner_args):
+    runner = JobRunner(store, execute, reserve, refund, max_workers=1, **runner_args)
+    job = store.create('student@gmail.com', 'Monetary policy')
+    runner._run(job)
+    return store.get(job['id'])
+
+
+def test_successful_job_keeps_its_credit():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = run_one(store, succeeding, credits.reserve, credits.refund)
+    assert job['status'] == DONE and job['result'] == 'questions about Monetary policy'
+    assert job['charged'] and credits.balance == 0 and credits.refunds == []
+
+
+def test_failed_job_is_refunded_once():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = run_one(store, failing, credits.reserve, credits.refund)
+    assert job['status'] == FAILED and job['error'] == 'overloaded'
+    assert not job['charged'] and credits.balance == 1 and len(credits.refunds) == 1
+
+
+def test_no_credit_fails_without_refund():
+    store = JobStore()
+    credits = Credits(store, balance=0)
+    job = run_one(store, succeeding, credits.reserve, credits.refund)
+    assert job['status'] == FAILED and job['error'] == "No credits left." and credits.refunds == []
+
+
+def test_refund_outage_still_ends_failed(capsys):
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = run_one(store, failing, credits.reserve, Outage(credits.refund, failures=99))
+    assert job['status'] == FAILED and credits.balance == 0
+    assert 'could not refund' in capsys.readouterr().err
+
+
+def test_refund_is_retried_through_a_brief_outage():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = run_one(store, failing, credits.reserve, Outage(credits.refund, failures=1))
+    assert job['status'] == FAILED and not job['charged']
+    assert credits.balance == 1 and len(credits.refunds) == 1
+
+
+def test_reservation_that_raised_after_landing_is_given_back():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = run_one(store, succeeding, Outage(credits.reserve, failures=1, lands=True), credits.refund)
+    assert job['status'] == FAILED and credits.balance == 1 and len(credits.refunds) == 1
+
+
+def test_reservation_that_never_landed_refunds_nothing():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = run_one(store, succeeding, Outage(credits.reserve, failures=1), credits.refund)
+    assert job['status'] == FAILED and credits.balance == 1 and credits.refunds == []
+
+
+def test_a_credit_is_refunded_at_most_once_per_reservation():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    runner = JobRunner(store, failing, credits.reserve, credits.refund, max_workers=1)
+    job = store.create('student@gmail.com', 'Monetary policy')
+    runner._run(job)
+    # A repeated error path, or another worker failing the same job
+    runner._fail(job, True, "again")
+    runner._fail(job, True, "again")
+    assert credits.balance == 1 and len(credits.refunds) == 1
+
+
+def test_resumed_job_runs_on_the_credit_it_holds():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+    job = store.create('student@gmail.com', 'Monetary policy')
+    credits.reserve(job)
+    JobRunner(store, succeeding, credits.reserve, credits.refund, max_workers=1)._run(store.get(job['id']))
+    assert store.get(job['id'])['status'] == DONE and credits.balance == 0
+
+
+def test_on_result_error_does_not_fail_a_finished_job():
+    store = JobStore()
+    credits = Credits(store, balance=1)
+
+    def on_result(job, output):
+        raise RuntimeError("history table missing")
+
+    job = run_one(store, succeeding, credits.reserve, credits.refund, on_result=on_result)
+    assert job['status'] == DONE and credits.refunds == []
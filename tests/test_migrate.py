@@ -0,0 +1,28 @@
+import os
+
+from migrate import EXPECTED_INDEXES, MIGRATIONS_DIR, migration_files
+
+
+def migrations_sql():
+    return ''.join(open(os.path.join(MIGRATIONS_DIR, name), encoding='utf-8').read()
+                   for _, name in migration_files())
+
+
+def test_versions_are_consecutive():
+    versions = [version for version, _ in migration_files()]
+    assert versions == list(range(1, len(versions) + 1))
+
+
+def test_every_table_the_app_writes_is_migrated():
+    sql = migrations_sql()
+    for table in ('users', 'otp_codes', 'payments', 'generation_history', 'generation_jobs',
+                  'generation_cache', 'llm_metrics', 'razorpay_payments'):
+        assert f"create table if not exists {table} " in sql
+
+
+def test_every_expected_index_is_created_by_a_migration():
+    sql = migrations_sql()
+    for name in EXPECTED_INDEXES:
+        # The unique constraints' indexes are named by Postgres
+        if not name.endswith('_key'):
+            assert f"create index if not exists {name} " in sql or f"create unique index if not exists {name} " in sql
@@ -0,0 +1,106 @@
+import json
+import threading
+from types import SimpleNamespace
+
+import pytest
+import requests
+
+from payments import billing_email, creditable_payments
+from webhooks import SIGNATURE_HEADER, WEBHOOK_PATH, handle_event, make_server, sign
+
+SECRET = 'whsec_test'
+
+
+def payment(email='', notes_email='', contact='+919999999999', amount=2400, status='captured'):
+    return {'id': 'pay_1', 'amount': amount, 'status': status, 'email': email,
+            'notes': {'email': notes_email} if notes_email else {}, 'contact': contact}
+
+
+def captured(entity):
+    return {'event': 'payment.captured', 'payload': {'payment': {'entity': entity}}}
+
+
+class Query:
+    def __init__(self, data):
+        self.data = data
+
+    def select(self, *columns):
+        return self
+
+    def in_(self, column, values):
+        self.data = [row for row in self.data if row[column] in values]
+        return self
+
+    def execute(self):
+        return SimpleNamespace(data=self.data)
+
+
+class Supabase:
+    """users table and credit_payments, enough for handle_event."""
+
+    def __init__(self, *emails):
+        self.users = [{'email': email} for email in emails]
+        self.credited = []
+
+    def table(self, name):
+        return Query(list(self.users))
+
+    def rpc(self, name, params):
+        self.credited.append((params['p_email'], [row['id'] for row in params['p_payments']]))
+        return Query([{'credits_added': params['p_payments'][0]['credits']}])
+
+
+def test_polling_matches_every_email_a_payment_carries():
+    paid = payment(email='checkout@gmail.com', notes_email='account@gmail.com')
+    assert set(creditable_payments([paid], 'account@gmail.com')) == {'pay_1'}
+    assert set(creditable_payments([paid], 'checkout@gmail.com')) == {'pay_1'}
+    assert creditable_payments([payment(email='a@gmail.com', status='failed')], 'a@gmail.com') == {}
+
+
+def test_billing_email_prefers_an_existing_account():
+    paid = payment(email='checkout@gmail.com', notes_email='account@gmail.com')
+    assert billing_email(paid) == 'checkout@gmail.com'
+    assert billing_email(paid, {'account@gmail.com'}) == 'account@gmail.com'
+    assert billing_email(payment(contact='Contact@Gmail.com ')) == 'contact@gmail.com'
+
+
+def test_webhook_credits_the_existing_account_not_the_checkout_address():
+    supabase = Supabase('account@gmail.com')
+    status, _ = handle_event(supabase, captured(payment(email='checkout@gmail.com',
+                                                        notes_email='account@gmail.com')))
+    assert status == 200 and supabase.credited == [('account@gmail.com', ['pay_1'])]
+
+
+def test_webhook_credits_a_new_address_when_no_account_matches():
+    supabase = Supabase('someone-else@gmail.com')
+    status, _ = handle_event(supabase, captured(payment(email='new@gmail.com')))
+    assert status == 200 and supabase.credited == [('new@gmail.com', ['pay_1'])]
+
+
+def test_webhook_ignores_payments_without_email_or_credits():
+    supabase = Supabase()
+    assert handle_event(supabase, captured(payment(email='a@gmail.com', amount=500)))[0] == 200
+    assert handle_event(supabase, captured(payment()))[0] == 200
+    assert handle_event(supabase, {'event': 'refund.created'})[0] == 200
+    assert supabase.credited == []
+
+
+@pytest.fixture
+def webhook_url():
+    server = make_server(Supabase(), SECRET, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}{WEBHOOK_PATH}"
+    server.shutdown()
+
+
+@pytest.mark.parametrize('event', [[1, 2], 'payment.captured', None])
+def test_webhook_rejects_a_body_that_is_not_an_object(webhook_url, event):
+    body = json.dumps(event).encode()
+    response = requests.post(webhook_url, data=body, headers={SIGNATURE_HEADER: sign(body, SECRET)}, timeout=5)
+    assert response.status_code == 400
+
+
+def test_webhook_rejects_a_bad_signature(webhook_url):
+    body = json.dumps(captured(payment(email='a@gmail.com'))).encode()
+    response = requests.post(webhook_url, data=body, headers={SIGNATURE_HEADER: sign(body, 'wrong')}, timeout=5)
+    assert response.status_code == 400
@@ -0,0 +1,32 @@
+from types import SimpleNamespace
+
+from razorpay_sync import RazorpaySync
+
+
+class Supabase:
+    """Counts round trips; pending_razorpay_payments returns one indexed payment."""
+
+    def __init__(self):
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append(name)
+        data = [{'id': 'pay_1', 'email': params['p_email'], 'amount': 2400, 'status': 'captured'}]
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=data))
+
+    def table(self, name):
+        self.calls.append(name)
+        raise AssertionError("a credit check must not read or write the sync state")
+
+
+def razorpay_get(*args, **kwargs):
+    raise AssertionError("a credit check must not call Razorpay")
+
+
+def test_pending_payments_is_one_lookup_and_never_calls_razorpay():
+    supabase = Supabase()
+    sync = RazorpaySync(supabase, ('rzp_test', 'secret'), api_url='http://127.0.0.1:9')
+    sync._http = SimpleNamespace(get=razorpay_get)
+    payments = sync.pending_payments(' Student@Gmail.com ')
+    assert [p['id'] for p in payments] == ['pay_1'] and payments[0]['email'] == 'student@gmail.com'
+    assert supabase.calls == ['pending_razorpay_payments']
@@ -0,0 +1,163 @@
+"""The credit functions in migrations/, run against a real Postgres.
+
+Needs DATABASE_URL (a throwaway database: pending migrations are applied)
+and psycopg2; skipped otherwise. Every test rolls back.
+"""
+
+import json
+import os
+import uuid
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from migrate import applied_versions, apply_migration, migration_files  # noqa: E402
+
+pytestmark = pytest.mark.skipif(not os.environ.get('DATABASE_URL'), reason='DATABASE_URL is not set')
+
+
+@pytest.fixture(scope='module')
+def database():
+    conn = psycopg2.connect(os.environ['DATABASE_URL'])
+    done = applied_versions(conn)
+    for version, name in migration_files():
+        if version not in done:
+            apply_migration(conn, version, name)
+    yield conn
+    conn.close()
+
+
+@pytest.fixture
+def cur(database):
+    with database.cursor() as cur:
+        yield cur
+    database.rollback()
+
+
+def add_user(cur, free=0, paid=0):
+    email = f"sql-{uuid.uuid4().hex[:8]}@gmail.com"
+    cur.execute("insert into users (email, free_credits, paid_credits, total_queries) values (%s, %s, %s, 0)",
+                (email, free, paid))
+    return email
+
+
+def add_job(cur, email):
+    job_id = str(uuid.uuid4())
+    cur.execute("insert into generation_jobs (id, email, topic) values (%s, %s, 'Monetary policy')", (job_id, email))
+    return job_id
+
+
+def call(cur, function, *args):
+    cur.execute(f"select * from {function}({', '.join(['%s'] * len(args))})", args)
+    return cur.fetchall()
+
+
+def balances(cur, email):
+    cur.execute("select free_credits, paid_credits, total_queries from users where email = %s", (email,))
+    return cur.fetchone()
+
+
+def job_credit(cur, job_id):
+    cur.execute("select charged, credit from generation_jobs where id = %s", (job_id,))
+    return cur.fetchone()
+
+
+def test_reserve_takes_free_credits_first_and_marks_the_job(cur):
+    email = add_user(cur, free=1, paid=1)
+    job_id = add_job(cur, email)
+    assert call(cur, 'reserve_query_credit', job_id) == [(0, 1, 1, 'free')]
+    assert job_credit(cur, job_id) == (True, 'free')
+
+
+def test_a_job_is_reserved_once(cur):
+    email = add_user(cur, paid=2)
+    job_id = add_job(cur, email)
+    call(cur, 'reserve_query_credit', job_id)
+    assert call(cur, 'reserve_query_credit', job_id) == []
+    assert balances(cur, email) == (0, 1, 1)
+
+
+def test_reserve_without_credit_leaves_the_job_uncharged(cur):
+    job_id = add_job(cur, add_user(cur))
+    assert call(cur, 'reserve_query_credit', job_id) == []
+    assert job_credit(cur, job_id) == (False, None)
+
+
+def test_refund_returns_the_same_kind_once(cur):
+    email = add_user(cur, free=1, paid=1)
+    job_id = add_job(cur, email)
+    call(cur, 'reserve_query_credit', job_id)
+    assert call(cur, 'refund_query_credit', job_id) == [(1, 1, 0)]
+    assert call(cur, 'refund_query_credit', job_id) == []
+    assert balances(cur, email) == (1, 1, 0) and job_credit(cur, job_id) == (False, None)
+
+
+def test_refund_of_an_uncharged_job_adds_nothing(cur):
+    email = add_user(cur, paid=1)
+    assert call(cur, 'refund_query_credit', add_job(cur, email)) == []
+    assert call(cur, 'refund_query_credit', str(uuid.uuid4())) == []
+    assert balances(cur, email) == (0, 1, 0)
+
+
+def test_refund_by_email_is_gone(cur):
+    email = add_user(cur, paid=1)
+    with pytest.raises(psycopg2.errors.UndefinedFunction):
+        call(cur, 'refund_query_credit', email, 'paid')
+
+
+def test_consume_stops_at_zero(cur):
+    email = add_user(cur, paid=1)
+    assert call(cur, 'consume_query_credit', email) == [(0, 0, 1, 'paid')]
+    assert call(cur, 'consume_query_credit', email) == []
+
+
+def payment_rows(*ids, credits=2):
+    return json.dumps([{'id': pid, 'credits': credits, 'amount': credits * 12} for pid in ids])
+
+
+def test_credit_payments_credits_each_payment_once(cur):
+    email = add_user(cur, free=1)
+    pid = f"pay_{uuid.uuid4().hex[:14]}"
+    assert call(cur, 'credit_payments', email, payment_rows(pid)) == [(2, 1, 2, 0)]
+    # A webhook retry and the polling fallback racing it
+    assert call(cur, 'credit_payments', email.upper(), payment_rows(pid)) == [(0, 1, 2, 0)]
+    assert balances(cur, email) == (1, 2, 0)
+
+
+def test_credit_payments_creates_a_missing_user(cur):
+    email = f"new-{uuid.uuid4().hex[:8]}@gmail.com"
+    assert call(cur, 'credit_payments', email, payment_rows(f"pay_{uuid.uuid4().hex[:14]}", credits=3)) == [(3, 0, 3, 0)]
+
+
+def test_synced_payments_are_pending_until_credited(cur):
+    email = add_user(cur)
+    credited, waiting = (f"pay_{uuid.uuid4().hex[:14]}" for _ in range(2))
+    rows = [{'id': pid, 'email': email.upper(), 'amount': 2400, 'status': 'captured', 'created_at': 1_900_000_000 + n}
+            for n, pid in enumerate((credited, waiting))]
+    assert call(cur, 'sync_razorpay_payments', json.dumps(rows)) == [(2,)]
+    call(cur, 'credit_payments', email, payment_rows(credited))
+    assert [row[0] for row in call(cur, 'pending_razorpay_payments', email, 1_899_999_999)] == [waiting]
+
+
+def test_sync_cursor_never_moves_backwards(cur):
+    cur.execute("select last_created_at, last_payment_id from razorpay_sync_state where name = 'payments'")
+    before = cur.fetchone()
+    newest = (before[0] + 1 if before else 2_000_000_000, 'pay_zzzzzzzzzzzzzz')
+    call(cur, 'sync_razorpay_payments', '[]', *newest)
+    call(cur, 'sync_razorpay_payments', '[]', newest[0] - 10, 'pay_older')
+    cur.execute("select last_created_at, last_payment_id from razorpay_sync_state where name = 'payments'")
+    assert cur.fetchone() == newest
+
+
+def test_otp_purge_removes_only_dead_codes(cur):
+    email = add_user(cur)
+    cur.execute("delete from otp_codes")
+    cur.execute("insert into otp_codes (email, otp, expires_at, used) values "
+                "(%s, '111111', now() - interval '1 minute', false), "
+                "(%s, '222222', now() + interval '5 minutes', true), "
+                "(%s, '333333', now() + interval '5 minutes', false)", (email, email, email))
+    assert call(cur, 'purge_otp_codes', 1) == [(1,)]
+    assert call(cur, 'purge_otp_codes', 10) == [(1,)]
+    cur.execute("select otp from otp_codes where email = %s", (email,))
+    assert cur.fetchall() == [('333333',)]
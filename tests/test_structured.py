@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from structured import MCQ, MainsQuestion, StreamingQuestionParser, StructuredQuestions, TopicAnalysis
+
+QUESTIONS = {
+    "analysis": {"topic": "RBI holds repo rate", "primary_subject": "GS-III — Economy",
+                 "angles": [{"angle": "Federalism", "paper": "GS-II", "connection": "States' borrowing"}]},
+    "mcqs": [{"number": n, "subject": "Economy", "cross": n > 3,
+              "stem": f"Q{n}: which {{bracketed}} [list] \"quoted\" \\ claim is correct?",
+              "options": ["One", "Two", "Three", "Four"], "answer": "b", "trap": "Looks right.",
+              "key_point": "Key."} for n in range(1, 6)],
+    "mains": [{"number": n, "paper": "GS-III", "cross": n > 2, "marks": 15, "question": f"Discuss M{n}.",
+               "framework": ["Intro", "Body", "Conclusion"], "must_include": "Cases.", "avoid": "Bias."}
+              for n in range(1, 6)],
+}
+TEXT = json.dumps(QUESTIONS, ensure_ascii=False, indent=2)
+
+
+def parse(text, size):
+    parser = StreamingQuestionParser()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return parser, items
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, len(TEXT)])
+def test_items_arrive_in_order_whatever_the_chunking(size):
+    parser, items = parse(TEXT, size)
+    assert [type(item) for item in items] == [TopicAnalysis] + [MCQ] * 5 + [MainsQuestion] * 5
+    assert parser.done
+    assert [q.number for q in parser.result.mcqs] == [1, 2, 3, 4, 5]
+    assert parser.result.mcqs[0].stem == QUESTIONS['mcqs'][0]['stem']
+
+
+def test_fenced_output_is_parsed():
+    parser, items = parse("```json\n" + TEXT + "\n```", 5)
+    assert len(items) == 11 and parser.done
+
+
+def test_an_item_is_returned_as_soon_as_it_closes():
+    first_mcq_end = TEXT.index('}', TEXT.index('"key_point"')) + 1
+    parser = StreamingQuestionParser()
+    items = parser.feed(TEXT[:first_mcq_end])
+    assert [type(item) for item in items] == [TopicAnalysis, MCQ]
+    assert not parser.done
+
+
+def test_truncated_stream_is_not_done():
+    parser, items = parse(TEXT[:len(TEXT) // 2], 16)
+    assert not parser.done and 0 < len(items) < 11
+
+
+def test_buffer_stays_about_one_question_long():
+    parser = StreamingQuestionParser()
+    longest = 0
+    for start in range(0, len(TEXT), 20):
+        parser.feed(TEXT[start:start + 20])
+        longest = max(longest, len(parser._buf))
+    assert longest < len(TEXT) / 4
+
+
+def test_result_round_trips_through_json():
+    parser, _ = parse(TEXT, 32)
+    again = StructuredQuestions.from_json(parser.result.to_json())
+    assert again.to_dict() == parser.result.to_dict()
+    assert "Q1: which" in again.to_text()
@@ -0,0 +1,33 @@
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from fake_services import FAKE_SUPABASE_KEY, FakeServices  # noqa: E402
+from telemetry import METRICS_PAGE_SIZE, METRICS_TABLE, OK, MetricsWriter, summarize  # noqa: E402
+
+
+@pytest.fixture
+def services():
+    services = FakeServices()
+    yield services
+    services.close()
+
+
+def test_rows_since_reads_past_one_page(services):
+    from supabase import create_client
+
+    now = datetime.now(timezone.utc)
+    rows = [{'at': (now - timedelta(minutes=n)).isoformat(), 'outcome': OK, 'latency_ms': n}
+            for n in range(METRICS_PAGE_SIZE * 2 + 5)]
+    old = {'at': (now - timedelta(days=8)).isoformat(), 'outcome': OK, 'latency_ms': 0}
+    services._insert(METRICS_TABLE, rows + [old])
+
+    writer = MetricsWriter(create_client(services.url, FAKE_SUPABASE_KEY))
+    found = writer.rows_since(7 * 24)
+    assert len(found) == len(rows)
+    assert len({row['id'] for row in found}) == len(rows)
+    assert summarize(found)['queries'] == len(rows)
@@ -0,0 +1,146 @@
+"""
+CACHE WARM-UP
+=============
+Pre-generate trending topics into the result cache before peak hours, so
+the first students to ask get an instant cache hit instead of a live Claude
+call. Runs from the admin sidebar, or offline / on a schedule:
+
+    python warmup.py trending.txt             # one topic per line, or a CSV
+    python warmup.py --force trending.txt     # regenerate even if cached
+
+    # crontab: every morning at 06:30 IST
+    0 1 * * * cd /app && python warmup.py trending.txt >> warmup.log 2>&1
+
+Offline runs write to the Supabase generation_cache table, which the app
+reads on a miss. Credentials come from the environment (ANTHROPIC_API_KEY,
+SUPABASE_URL, SUPABASE_KEY), falling back to .streamlit/secrets.toml.
+"""
+
+import argparse
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from generation_cache import GenerationCache
+from settings import secret
+
+WARMUP_CONCURRENCY = 2  # warm-up calls at once; leaves the API limit to users
+
+
+class CacheWarmer:
+    """Generates topics that are not cached yet; execute(topic) stores the result.
+
+    Topics already cached, exactly or as a close paraphrase, are skipped
+    unless force is set. Only one run is active at a time.
+    """
+
+    def __init__(self, cache: GenerationCache, execute, max_workers: int = WARMUP_CONCURRENCY):
+        self.cache = cache
+        self.execute = execute
+        self.max_workers = max_workers
+        self._lock = threading.Lock()
+        self._status = {'running': False, 'total': 0, 'generated': 0, 'cached': 0, 'failed': 0,
+                        'errors': [], 'started_at': None, 'finished_at': None}
+
+    def warm(self, topics: list, force: bool = False, on_topic=None) -> dict:
+        """Warm topics on a small pool; on_topic(topic, outcome, error) per topic."""
+        with self._lock:
+            self._status.update(running=True, total=len(topics), generated=0, cached=0, failed=0,
+                                errors=[], started_at=time.time(), finished_at=None)
+
+        def warm_one(topic):
+            if not force and self.cache.get(topic, record_stats=False) is not None:
+                return topic, 'cached', None
+            try:
+                self.execute(topic)
+                return topic, 'generated', None
+            except Exception as e:
+                return topic, 'failed', str(e)
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="upsc-warmup") as pool:
+                for topic, outcome, error in pool.map(warm_one, topics):
+                    with self._lock:
+                        self._status[outcome] += 1
+                        if error:
+                            self._status['errors'].append(f"{topic}: {error}")
+                    if on_topic is not None:
+                        on_topic(topic, outcome, error)
+        finally:
+            with self._lock:
+                self._status.update(running=False, finished_at=time.time())
+        return self.status()
+
+    def start(self, topics: list, force: bool = False) -> bool:
+        """Warm in a background thread; False if a run is already going."""
+        with self._lock:
+            if self._status['running']:
+                return False
+            self._status['running'] = True
+        threading.Thread(target=self.warm, args=(topics, force), name="upsc-warmup-run", daemon=True).start()
+        return True
+
+    def status(self) -> dict:
+        with self._lock:
+            status = dict(self._status)
+            status['errors'] = list(status['errors'])
+            return status
+
+
+# =============================================================================
+# COMMAND LINE
+# =============================================================================
+
+def main():
+    from generation import CLAUDE_MODEL, GENERATION_MODES, LLMLimiter, PromptCacheStats, build_anthropic_client
+
+    modes = sorted(GENERATION_MODES)
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('topics_file', help='topics, one per line or a CSV with a topic column')
+    parser.add_argument('--force', action='store_true', help='regenerate topics that are already cached')
+    parser.add_argument('--mode', default='single', choices=modes, help=f"generation mode: {', '.join(modes)}")
+    parser.add_argument('--concurrency', type=int, default=WARMUP_CONCURRENCY)
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    from batch import parse_topics
+
+    api_key = secret('ANTHROPIC_API_KEY')
+    url, key = secret('SUPABASE_URL'), secret('SUPABASE_KEY')
+    if not api_key:
+        sys.exit('ANTHROPIC_API_KEY is not set')
+    if not (url and key):
+        sys.exit('SUPABASE_URL / SUPABASE_KEY are not set; warmed results would be lost on exit')
+
+    with open(args.topics_file, encoding='utf-8') as f:
+        topics = parse_topics(f.read(), max_topics=10_000)
+    if not topics:
+        sys.exit('no topics found')
+
+    client = build_anthropic_client(api_key, max_retries=0)
+    cache = GenerationCache(create_client(url, key), model=CLAUDE_MODEL)
+    generate = GENERATION_MODES[args.mode]
+    limiter = LLMLimiter(max_concurrent=args.concurrency)
+    usage = PromptCacheStats()
+
+    def execute(topic):
+        output = generate(client, topic, usage_stats=usage, limit=limiter.call)
+        if not output:
+            raise RuntimeError("Empty response.")
+        cache.put(topic, output)
+
+    def report(topic, outcome, error):
+        print(f"[{outcome:9}] {topic[:70]}" + (f"  ({error})" if error else ''), flush=True)
+
+    started = time.perf_counter()
+    status = CacheWarmer(cache, execute, max_workers=args.concurrency).warm(topics, force=args.force, on_topic=report)
+    totals = usage.totals()
+    print(f"\n{status['generated']} generated, {status['cached']} already cached, {status['failed']} failed "
+          f"in {time.perf_counter() - started:.1f}s; cache-read tokens {totals['cache_read_tokens']}")
+    sys.exit(1 if status['failed'] else 0)
+
+
+if __name__ == '__main__':
+    main()
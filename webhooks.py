@@ -0,0 +1,147 @@
+"""
+RAZORPAY WEBHOOKS
+=================
+A small receiver that credits payments the moment Razorpay captures them, so
+the app mostly reads balances instead of downloading and scanning recent
+payments on every Refresh Credits, Quick Login and OTP verify:
+
+    python webhooks.py --port 8502
+
+Razorpay Dashboard -> Settings -> Webhooks: URL https://<host>/razorpay/webhook,
+active event payment.captured, and a secret, which goes in
+RAZORPAY_WEBHOOK_SECRET here. Every body is checked against its
+X-Razorpay-Signature before anything is written. Captured payments are
+credited with the credit_payments database function (migrations/003), so
+Razorpay's retries and the app's polling fallback never credit a payment twice.
+
+Then set PAYMENT_WEBHOOKS = "on" in the app's secrets. The app still polls
+Razorpay when a balance has not caught up, in case a webhook is late or lost.
+
+Credentials come from the environment (RAZORPAY_WEBHOOK_SECRET, SUPABASE_URL,
+SUPABASE_KEY), falling back to .streamlit/secrets.toml. Try it locally with
+benchmarks/replay_webhooks.py.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import sys
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from payments import billing_email, credit_row, ordered_emails
+from settings import secret
+
+WEBHOOK_PATH = '/razorpay/webhook'
+SIGNATURE_HEADER = 'X-Razorpay-Signature'
+MAX_BODY_BYTES = 1024 * 1024
+
+
+def sign(body: bytes, secret: str) -> str:
+    """Razorpay's webhook signature: hex HMAC-SHA256 of the raw body."""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: str, secret: str) -> bool:
+    if not (secret and signature):
+        return False
+    return hmac.compare_digest(sign(body, secret), signature)
+
+
+def handle_event(supabase, event: dict):
+    """Apply one verified event. Returns (HTTP status, message).
+
+    Only payment.captured credits anything; other events are acknowledged
+    and ignored. The payment goes to an existing account carrying any of
+    its emails, as polling would find it (payments.billing_email). A failed
+    database call answers 500 so Razorpay retries.
+    """
+    if event.get('event') != 'payment.captured':
+        return 200, f"ignored {event.get('event')}"
+    payment = ((event.get('payload') or {}).get('payment') or {}).get('entity') or {}
+    row = credit_row(payment) if payment.get('id') else None
+    emails = ordered_emails(payment)
+    if not (row and emails):
+        return 200, f"ignored payment {payment.get('id')}: no credits or no email"
+    try:
+        known = supabase.table('users').select('email').in_('email', emails).execute()
+        email = billing_email(payment, {user['email'] for user in known.data or []})
+        result = supabase.rpc('credit_payments', {'p_email': email, 'p_payments': [row]}).execute()
+    except Exception as e:
+        return 500, f"credit failed for {row['id']}: {e}"
+    added = result.data[0]['credits_added'] if result.data else 0
+    return 200, f"{row['id']}: +{added} credit(s) to {email}"
+
+
+def make_server(supabase, secret: str, host: str = '127.0.0.1', port: int = 8502) -> ThreadingHTTPServer:
+    """HTTP server for WEBHOOK_PATH (plus GET /healthz); call serve_forever() on it."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def _send(self, status: int, message: str):
+            body = message.encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'text/plain; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/healthz':
+                return self._send(200, 'ok')
+            self._send(404, 'not found')
+
+        def do_POST(self):
+            if self.path.split('?')[0] != WEBHOOK_PATH:
+                return self._send(404, 'not found')
+            length = int(self.headers.get('Content-Length') or 0)
+            if length > MAX_BODY_BYTES:
+                return self._send(413, 'body too large')
+            body = self.rfile.read(length)
+            if not verify_signature(body, self.headers.get(SIGNATURE_HEADER), secret):
+                print("rejected: bad signature", file=sys.stderr, flush=True)
+                return self._send(400, 'bad signature')
+            try:
+                event = json.loads(body)
+            except ValueError:
+                return self._send(400, 'bad json')
+            if not isinstance(event, dict):
+                return self._send(400, 'not a json object')
+            status, message = handle_event(supabase, event)
+            print(message, file=sys.stderr, flush=True)
+            self._send(status, message)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+
+    from supabase import create_client
+
+    webhook_secret = secret('RAZORPAY_WEBHOOK_SECRET')
+    url, key = secret('SUPABASE_URL'), secret('SUPABASE_KEY')
+    if not webhook_secret:
+        sys.exit('RAZORPAY_WEBHOOK_SECRET is not set')
+    if not (url and key):
+        sys.exit('SUPABASE_URL / SUPABASE_KEY are not set')
+
+    server = make_server(create_client(url, key), webhook_secret, args.host, args.port)
+    print(f"listening on http://{args.host}:{args.port}{WEBHOOK_PATH}", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()